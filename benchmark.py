@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from engine import DatabaseEngine, SearchIndex
+
+PAGE = 100
+# Only a complete result can be mirrored, so the sort flip runs on a copy small enough to cache whole.
+FLIP_ROWS = 10000
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet",
+         "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango")
+SHAPES = {
+    "narrow": ["name TEXT", "city TEXT", "amount REAL"],
+    "wide": [f"c{i} {'TEXT' if i % 2 else 'INTEGER'}" for i in range(30)],
+}
+
+
+def random_value(rng, decl):
+    if decl.endswith("TEXT"):
+        return " ".join(rng.choice(WORDS) for _ in range(3))
+    if decl.endswith("REAL"):
+        return rng.random() * 1000
+    return rng.randrange(1000000)
+
+
+def build_database(path, rows, shape, seed=0):
+    rng = random.Random(seed)
+    columns = SHAPES[shape]
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(f"CREATE TABLE data (id INTEGER PRIMARY KEY, {', '.join(columns)})")
+    sql = f"INSERT INTO data VALUES (NULL, {', '.join('?' * len(columns))})"
+    batch = 10000
+    with conn:
+        for start in range(0, rows, batch):
+            conn.executemany(sql, ([random_value(rng, decl) for decl in columns]
+                                   for _ in range(min(batch, rows - start))))
+    conn.close()
+
+
+def summary_rows(summary):
+    return summary["rows"]
+
+
+def timed(results, name, func, repeat=1, rows=None):
+    # rows is a count or a function of the result; it adds a rows_per_sec figure for the scenario.
+    best = None
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    results[name] = round(best, 6)
+    if rows is not None:
+        count = rows(value) if callable(rows) else rows
+        results.setdefault("rows_per_sec", {})[name] = round(count / best) if best else None
+    return value
+
+
+def run_case(workdir, rows, shape, repeat):
+    path = os.path.join(workdir, f"{shape}_{rows}.db")
+    results = {}
+    timed(results, "generate", lambda: build_database(path, rows, shape), rows=rows)
+    sort_column = SHAPES[shape][0].split()[0]
+    text_column = next(decl.split()[0] for decl in SHAPES[shape] if decl.endswith("TEXT"))
+
+    engine = timed(results, "open", lambda: DatabaseEngine(path, result_cache=False))
+    try:
+        source = engine.table("data")
+        first = timed(results, "first_page", lambda: source.first(PAGE), repeat, rows=len)
+        timed(results, "seek_middle", lambda: source.seek(0.5, PAGE), repeat, rows=len)
+        timed(results, "next_page", lambda: source.after(first[-1][0], PAGE), repeat, rows=len)
+        sorted_source = engine.sort("data", sort_column)
+        timed(results, "sort_first_page", lambda: sorted_source.first(PAGE), repeat, rows=len)
+        timed(results, "sort_seek_middle", lambda: sorted_source.seek(0.5, PAGE), repeat, rows=len)
+        key = source.row_key(first[0][0])
+        timed(results, "cell_edit", lambda: engine.update_cell("data", key, text_column, "edited"), repeat, rows=1)
+        timed(results, "insert_row", lambda: engine.insert_row("data", {text_column: "inserted"}), repeat, rows=1)
+        timed(results, "insert_1000_rows", lambda: engine.insert_empty_rows("data", 1000), rows=1000)
+        victims = [source.row_key(sort_key) for sort_key, values in source.seek(0.33, 1000)]
+        timed(results, "delete_1000_rows", lambda: engine.delete_rows("data", victims), rows=len(victims))
+        timed(results, "find_like", lambda: engine.find("data", text_column, "tango").first(PAGE), repeat, rows=len)
+        index = SearchIndex(engine.conn, engine.catalog)
+        timed(results, "fts_build", lambda: index.create("data", [text_column]), rows=rows)
+        engine.commit()
+        timed(results, "fts_search", lambda: engine.search("tango sierra"), repeat, rows=len)
+        timed(results, "find_fts", lambda: engine.find("data", text_column, "tango").first(PAGE), repeat, rows=len)
+        timed(results, "profile_table", lambda: engine.profile_table("data").run(), rows=summary_rows)
+        engine.conn.execute(f"CREATE TABLE flip AS SELECT * FROM data LIMIT {FLIP_ROWS}")
+        engine.commit()
+
+        cached = DatabaseEngine(path)
+        try:
+            def sorted_page(table, ascending):
+                return cached.sort(table, sort_column, ascending).first(PAGE)
+            sorted_page("data", True)
+            timed(results, "cached_sort_revisit", lambda: sorted_page("data", True), repeat, rows=len)
+            flip_rows = len(cached.sort("flip", sort_column).first(FLIP_ROWS + 1))
+            reversed_before = cached.cache.reversed
+            timed(results, "cached_sort_flip", lambda: sorted_page("flip", False), repeat, rows=len)
+            if cached.cache.reversed - reversed_before != repeat:
+                raise RuntimeError(f"cached_sort_flip was not served by mirroring the {flip_rows:,}-row result")
+        finally:
+            cached.close()
+
+        export_path = os.path.join(workdir, f"{shape}_{rows}.csv")
+        timed(results, "export_csv", lambda: engine.export(export_path, table="data"), rows=summary_rows)
+        timed(results, "import_csv", lambda: engine.import_file(export_path, "imported"), rows=summary_rows)
+    finally:
+        engine.close()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    return results
+
+
+def run_startup(repeat):
+    # Cold imports in a fresh interpreter; the GUI window itself needs a display, so only the import part is timed.
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, code in (("interpreter", "pass"), ("import_engine", "import engine"), ("import_main", "import main")):
+        timed(results, name, lambda: subprocess.run([sys.executable, "-c", code], cwd=here, check=True),
+              max(repeat, 3))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, timings in results["cases"].items():
+        for name, seconds in timings.items():
+            # Rates are derived from the timings, so only the timings are compared.
+            if name in ("generate", "rows_per_sec"):
+                continue
+            before = baseline.get("cases", {}).get(case, {}).get(name)
+            # Sub-millisecond timings are mostly noise; only flag them past an absolute floor.
+            if before is not None and seconds > before * (1 + tolerance) and seconds - before > 0.001:
+                regressions.append((case, name, before, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Time OpenDoc SQL engine operations.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="table sizes to generate (e.g. 10000 100000 1000000 10000000)")
+    parser.add_argument("--shape", choices=sorted(SHAPES), nargs="+", default=sorted(SHAPES))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing; the best is kept")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = {"sqlite": sqlite3.sqlite_version, "python": platform.python_version(), "cases": {}}
+    print("startup ...", file=sys.stderr)
+    results["cases"]["startup"] = run_startup(args.repeat)
+    with tempfile.TemporaryDirectory() as workdir:
+        for shape in args.shape:
+            for rows in args.rows:
+                case = f"{shape}/{rows}"
+                print(f"{case} ...", file=sys.stderr)
+                results["cases"][case] = run_case(workdir, rows, shape, args.repeat)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for case, name, before, after in regressions:
+            print(f"REGRESSION {case} {name}: {before:.6f}s -> {after:.6f}s", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
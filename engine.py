@@ -0,0 +1,2713 @@
+import sqlite3
+import re
+import threading
+import time
+import os
+import io
+import csv
+import json
+import gzip
+import itertools
+import collections
+import random
+import sys
+import hashlib
+import hmac
+import secrets
+
+# concurrent.futures, multiprocessing and argparse are imported where they are used, and pathname2url comes
+# from its small platform module rather than urllib.request: together they were over half of the GUI's
+# import time and most sessions never need them.
+if os.name == "nt":
+    from nturl2path import pathname2url
+else:
+    from urllib.parse import quote as pathname2url
+
+
+def quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+SQLITE_KEYWORDS_FALLBACK = (
+    "ABORT ACTION ADD AFTER ALL ALTER ALWAYS ANALYZE AND AS ASC ATTACH AUTOINCREMENT BEFORE BEGIN "
+    "BETWEEN BY CASCADE CASE CAST CHECK COLLATE COLUMN COMMIT CONFLICT CONSTRAINT CREATE CROSS "
+    "CURRENT CURRENT_DATE CURRENT_TIME CURRENT_TIMESTAMP DATABASE DEFAULT DEFERRABLE DEFERRED "
+    "DELETE DESC DETACH DISTINCT DO DROP EACH ELSE END ESCAPE EXCEPT EXCLUDE EXCLUSIVE EXISTS "
+    "EXPLAIN FAIL FILTER FIRST FOLLOWING FOR FOREIGN FROM FULL GENERATED GLOB GROUP GROUPS HAVING "
+    "IF IGNORE IMMEDIATE IN INDEX INDEXED INITIALLY INNER INSERT INSTEAD INTERSECT INTO IS ISNULL "
+    "JOIN KEY LAST LEFT LIKE LIMIT MATCH MATERIALIZED NATURAL NO NOT NOTHING NOTNULL NULL NULLS OF "
+    "OFFSET ON OR ORDER OTHERS OUTER OVER PARTITION PLAN PRAGMA PRECEDING PRIMARY QUERY RAISE RANGE "
+    "RECURSIVE REFERENCES REGEXP REINDEX RELEASE RENAME REPLACE RESTRICT RETURNING RIGHT ROLLBACK "
+    "ROW ROWS SAVEPOINT SELECT SET TABLE TEMP TEMPORARY THEN TIES TO TRANSACTION TRIGGER UNBOUNDED "
+    "UNION UNIQUE UPDATE USING VACUUM VALUES VIEW VIRTUAL WHEN WHERE WINDOW WITH WITHOUT"
+).split()
+
+_sqlite_keywords = None
+
+
+def sqlite_keywords():
+    global _sqlite_keywords
+    if _sqlite_keywords is None:
+        _sqlite_keywords = frozenset(_load_sqlite_keywords() or SQLITE_KEYWORDS_FALLBACK)
+    return _sqlite_keywords
+
+
+def _load_sqlite_keywords():
+    # The sqlite3 module does not wrap sqlite3_keyword_name(), so ask the linked library directly.
+    try:
+        import ctypes
+        import ctypes.util
+        import _sqlite3
+    except ImportError:
+        return None
+    for name in (_sqlite3.__file__, ctypes.util.find_library("sqlite3"), "sqlite3"):
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+            count = lib.sqlite3_keyword_count()
+        except (OSError, AttributeError):
+            continue
+        keywords = []
+        text = ctypes.c_char_p()
+        size = ctypes.c_int()
+        for i in range(count):
+            if lib.sqlite3_keyword_name(i, ctypes.byref(text), ctypes.byref(size)) == 0:
+                keywords.append(ctypes.string_at(text, size.value).decode("ascii").upper())
+        return keywords
+    return None
+
+
+SQL_TYPES = frozenset("INTEGER INT TEXT REAL BLOB NUMERIC BOOLEAN DATE DATETIME VARCHAR CHAR FLOAT DOUBLE".split())
+SQL_CONTROL = frozenset("IF ELSE BEGIN END CASE WHEN THEN".split())
+
+SQL_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--.*)
+  | (?P<block>/\*)
+  | (?P<quote>['"`\[])
+  | (?P<number>0[xX][0-9A-Fa-f]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<other>.)
+""", re.VERBOSE)
+
+QUOTE_CLOSERS = {"'": "'", '"': '"', "`": "`", "[": "]"}
+
+
+def _close_quote(line, pos, opener):
+    closer = QUOTE_CLOSERS[opener]
+    while True:
+        end = line.find(closer, pos)
+        if end == -1:
+            return -1
+        if opener != "[" and line.startswith(closer, end + 1):
+            pos = end + 2
+            continue
+        return end + 1
+
+
+# state is what the previous line ended inside of: None, "comment" for a block
+# comment, or the opening quote of a string or quoted identifier.
+def tokenize_sql_line(line, state=None):
+    tokens = []
+    pos = 0
+    length = len(line)
+    keywords = sqlite_keywords()
+    while pos < length:
+        if state == "comment":
+            end = line.find("*/", pos)
+            end = length if end == -1 else end + 2
+            tokens.append((pos, end, "comment"))
+            state = None if end < length or line.endswith("*/") else "comment"
+            pos = end
+            continue
+        if state is not None:
+            end = _close_quote(line, pos, state)
+            kind = "string" if state == "'" else "identifier"
+            if end == -1:
+                tokens.append((pos, length, kind))
+                return tokens, state
+            tokens.append((pos, end, kind))
+            state = None
+            pos = end
+            continue
+        match = SQL_TOKEN.match(line, pos)
+        group = match.lastgroup
+        start, pos = match.span()
+        if group == "comment":
+            tokens.append((start, pos, "comment"))
+        elif group == "block":
+            state = "comment"
+            pos = start + 2
+            end = line.find("*/", pos)
+            if end != -1:
+                state = None
+                pos = end + 2
+            else:
+                pos = length
+            tokens.append((start, pos, "comment"))
+        elif group == "quote":
+            state = match.group()
+            end = _close_quote(line, pos, state)
+            kind = "string" if state == "'" else "identifier"
+            if end == -1:
+                tokens.append((start, length, kind))
+                return tokens, state
+            tokens.append((start, end, kind))
+            state = None
+            pos = end
+        elif group == "number":
+            tokens.append((start, pos, "number"))
+        elif group == "word":
+            word = match.group().upper()
+            if word in SQL_CONTROL:
+                tokens.append((start, pos, "control"))
+            elif word in keywords:
+                tokens.append((start, pos, "keyword"))
+            elif word in SQL_TYPES:
+                tokens.append((start, pos, "type"))
+    return tokens, state
+
+
+FTS_SUFFIX = "__fts"
+MAX_ROWID = 2 ** 63 - 1
+SHADOW_SUFFIXES = ("_data", "_idx", "_content", "_docsize", "_config")
+
+Column = collections.namedtuple("Column", "cid name type notnull default pk")
+Index = collections.namedtuple("Index", "name unique origin columns")
+
+
+class SchemaCatalog:
+    ROWID_ALIASES = ("rowid", "_rowid_", "oid")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.version = None
+        self.objects = {}
+        self._columns = {}
+        self._keys = {}
+        self._indexes = {}
+        self._row_counts = {}
+        self._profiles = {}
+
+    def refresh(self):
+        version = pragma_value(self.conn, "schema_version")
+        if version == self.version:
+            return False
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT type, name, tbl_name, sql FROM sqlite_master ORDER BY name")
+        self.objects = {name: (kind, table, sql) for kind, name, table, sql in cursor.fetchall()}
+        self._columns = {}
+        self._keys = {}
+        self._indexes = {}
+        self._row_counts = {}
+        self._profiles = {}
+        self.version = version
+        return True
+
+    def _names(self, kind, table=None):
+        self.refresh()
+        return [name for name, (k, owner, _) in self.objects.items()
+                if k == kind and (table is None or owner == table)]
+
+    def tables(self, internal=False):
+        names = self._names("table")
+        if internal:
+            return names
+        virtual = [name for name in names if (self.objects[name][2] or "").upper().startswith("CREATE VIRTUAL TABLE")]
+        hidden = {name + suffix for name in virtual for suffix in SHADOW_SUFFIXES}
+        hidden.update(name for name in virtual if name.endswith(FTS_SUFFIX))
+        return [name for name in names if name not in hidden]
+
+    def views(self):
+        return self._names("view")
+
+    def triggers(self, table=None):
+        return self._names("trigger", table)
+
+    def kind(self, name):
+        self.refresh()
+        entry = self.objects.get(name)
+        return entry[0] if entry else None
+
+    def sql(self, name):
+        self.refresh()
+        entry = self.objects.get(name)
+        return entry[2] if entry else None
+
+    def columns(self, table):
+        self.refresh()
+        if table not in self._columns:
+            cursor = self.conn.execute(f"PRAGMA table_info({quote_ident(table)})")
+            self._columns[table] = [Column(*row) for row in cursor.fetchall()]
+        return self._columns[table]
+
+    def column_names(self, table):
+        return [col.name for col in self.columns(table)]
+
+    def primary_key(self, table):
+        return [col.name for col in sorted(self.columns(table), key=lambda c: c.pk) if col.pk > 0]
+
+    def indexes(self, table):
+        self.refresh()
+        if table not in self._indexes:
+            indexes = []
+            for _, name, unique, origin, _ in self.conn.execute(f"PRAGMA index_list({quote_ident(table)})").fetchall():
+                info = self.conn.execute(f"PRAGMA index_info({quote_ident(name)})").fetchall()
+                indexes.append(Index(name, bool(unique), origin, [row[2] for row in info]))
+            self._indexes[table] = indexes
+        return self._indexes[table]
+
+    def key_columns(self, table):
+        self.refresh()
+        if table not in self._keys:
+            self._keys[table] = self._find_key(table)
+        return self._keys[table]
+
+    def _find_key(self, table):
+        columns = self.columns(table)
+        if self.kind(table) == "table":
+            names = {col.name.lower() for col in columns}
+            for alias in self.ROWID_ALIASES:
+                if alias in names:
+                    continue
+                try:
+                    self.conn.execute(f"SELECT {alias} FROM {quote_ident(table)} LIMIT 0")
+                    return [alias], True
+                except sqlite3.OperationalError:
+                    break
+        return [quote_ident(name) for name in self.primary_key(table)], False
+
+    def rowid_bounds(self, table):
+        alias = self.key_columns(table)[0][0]
+        return self.conn.execute(f"SELECT min({alias}), max({alias}) FROM {quote_ident(table)}").fetchone()
+
+    def data_stamp(self):
+        return self.conn.total_changes, pragma_value(self.conn, "data_version")
+
+    def profile(self, table):
+        self.refresh()
+        cached = self._profiles.get(table)
+        return cached[1] if cached and cached[0] == self.data_stamp() else None
+
+    def store_profile(self, table, stamp, profile):
+        self.refresh()
+        self._profiles[table] = (stamp, profile)
+
+    def row_estimate(self, table):
+        stamp = self.data_stamp()
+        cached = self._row_counts.get(table)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        estimate = None
+        try:
+            stat = self.conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+            if stat and stat[0]:
+                estimate = int(stat[0].split()[0])
+        except sqlite3.OperationalError:
+            pass
+        if estimate is None and self.key_columns(table)[1]:
+            low, high = self.rowid_bounds(table)
+            estimate = 0 if low is None else high - low + 1
+        self._row_counts[table] = (stamp, estimate)
+        return estimate
+
+
+_json_supported = None
+
+
+def json_supported():
+    global _json_supported
+    if _json_supported is None:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("SELECT value FROM json_each('[]')")
+            _json_supported = True
+        except sqlite3.OperationalError:
+            _json_supported = False
+        finally:
+            conn.close()
+    return _json_supported
+
+
+def key_sets(key_columns, keys):
+    # Yields (condition, params) pairs that together match every key. Plain
+    # integer/text keys (rowids, most primary keys) go into one statement through
+    # json_each; composite or binary keys fall back to chunked IN (VALUES ...)
+    # lists that stay well below SQLITE_MAX_VARIABLE_NUMBER on older builds.
+    keys = [tuple(key) for key in keys]
+    if not keys:
+        return
+    if len(key_columns) == 1 and json_supported() and all(type(key[0]) in (int, str) for key in keys):
+        yield f"{key_columns[0]} IN (SELECT value FROM json_each(?))", (json.dumps([key[0] for key in keys]),)
+        return
+    width = len(key_columns)
+    row_sql = f"({', '.join('?' * width)})"
+    step = max(1, 900 // width)
+    for start in range(0, len(keys), step):
+        chunk = keys[start:start + step]
+        yield (f"({', '.join(key_columns)}) IN (VALUES {', '.join([row_sql] * len(chunk))})",
+               [value for key in chunk for value in key])
+
+
+def sqlite_order(values):
+    # Sort key matching SQLite's ordering across storage classes: NULL < numbers < text < blobs.
+    return tuple((0, 0) if value is None else (1, value) if isinstance(value, (int, float))
+                 else (2, value) if isinstance(value, str) else (3, bytes(value)) for value in values)
+
+
+class ResultCache:
+    MAX_ENTRIES = 256
+    MAX_BYTES = 64 << 20
+    ROW_OVERHEAD = 100
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.max_bytes = max_bytes or self.MAX_BYTES
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.stamp = None
+        self.hits = self.misses = self.reversed = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def _validate(self, conn):
+        # data_version moves when another connection commits, total_changes when this one
+        # writes rows and schema_version when this one changes the schema.
+        stamp = (pragma_value(conn, "data_version"), conn.total_changes, pragma_value(conn, "schema_version"))
+        if stamp != self.stamp:
+            self.clear()
+            self.stamp = stamp
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def lookup(self, conn, query, limit, offset=0, mirror=None):
+        self._validate(conn)
+        rows = self._get((query, limit, offset))
+        if rows is None and not offset:
+            # A complete result (fewer rows than its limit) answers any limit in either direction.
+            rows = self._get((query, None, 0))
+            if rows is None and mirror is not None:
+                rows = self._get((mirror, None, 0))
+                if rows is not None:
+                    rows = rows[::-1]
+                    self.reversed += 1
+        if rows is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return rows[:limit]
+
+    def store(self, query, limit, offset, rows):
+        key = (query, None, 0) if not offset and len(rows) < limit else (query, limit, offset)
+        size = sum(self.ROW_OVERHEAD + sum(len(value) if isinstance(value, (str, bytes)) else 8
+                                           for part in row for value in part) for row in rows)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        self.entries[key] = (list(rows), size)
+        self.size += size
+        self._evict()
+
+    def resize(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            self.size -= self.entries.popitem(last=False)[1][1]
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses,
+                "reversed": self.reversed}
+
+
+class TableSource:
+    def __init__(self, conn, table, order_by=None, ascending=True, where=None, params=(), catalog=None, cache=None):
+        self.conn = conn
+        self.catalog = catalog or SchemaCatalog(conn)
+        self.cache = cache
+        self.table = table
+        self.order_by = order_by
+        self.ascending = ascending
+        self.where = where
+        self.params = tuple(params)
+        self.columns = self.catalog.column_names(table)
+        self.key_columns, self.has_rowid = self.catalog.key_columns(table)
+
+        sort = [quote_ident(order_by)] if order_by else []
+        sort += self.key_columns
+        self.sort_exprs = sort
+        self.select = f"SELECT {', '.join(sort)}, * FROM {quote_ident(table)}"
+
+    def row_key(self, sort_key):
+        return sort_key[len(sort_key) - len(self.key_columns):]
+
+    def _sql(self, clauses, ascending):
+        sql = self.select
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if self.sort_exprs:
+            direction = "ASC" if ascending else "DESC"
+            sql += " ORDER BY " + ", ".join(f"{expr} {direction}" for expr in self.sort_exprs)
+        return sql
+
+    def _query(self, predicate, params, forward, limit, offset=0):
+        clauses = [f"({self.where})"] if self.where else []
+        if predicate:
+            clauses.append(predicate)
+        ascending = self.ascending == forward
+        sql = self._sql(clauses, ascending)
+        params = self.params + tuple(params)
+        rows = None
+        if self.cache is not None:
+            # Without a keyset predicate the opposite direction is the same result reversed.
+            mirror = self._sql(clauses, not ascending) if self.sort_exprs and not predicate else None
+            rows = self.cache.lookup(self.conn, (sql, params), limit, offset, mirror and (mirror, params))
+        if rows is None:
+            cursor = self.conn.cursor()
+            cursor.execute(f"{sql} LIMIT {int(limit)}" + (f" OFFSET {int(offset)}" if offset else ""), params)
+            width = len(self.sort_exprs)
+            rows = [(row[:width], row[width:]) for row in cursor.fetchall()]
+            if self.cache is not None:
+                self.cache.store((sql, params), limit, offset, rows)
+        if not forward:
+            rows.reverse()
+        return rows
+
+    def _predicate(self, sort_key, greater, inclusive):
+        keys = self.key_columns
+        key_values = tuple(self.row_key(sort_key))
+        op = (">" if greater else "<") + ("=" if inclusive else "")
+        if not self.order_by:
+            return f"({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})", key_values
+        column = quote_ident(self.order_by)
+        value = sort_key[0]
+        # NULLs sort first in ascending order, so they need explicit handling.
+        if value is None:
+            rest = f"{column} IS NULL AND ({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})"
+            if greater:
+                return f"(({rest}) OR {column} IS NOT NULL)", key_values
+            return f"({rest})", key_values
+        tuple_sql = f"({', '.join(self.sort_exprs)}) {op} ({', '.join('?' * len(self.sort_exprs))})"
+        if greater:
+            return f"({tuple_sql})", tuple(sort_key)
+        return f"({tuple_sql} OR {column} IS NULL)", tuple(sort_key)
+
+    def first(self, n):
+        return self._query(None, (), True, n)
+
+    def last(self, n):
+        return self._query(None, (), False, n)
+
+    def after(self, sort_key, n, inclusive=False):
+        if not self.key_columns:
+            return []
+        predicate, params = self._predicate(sort_key, self.ascending, inclusive)
+        return self._query(predicate, params, True, n)
+
+    def before(self, sort_key, n):
+        if not self.key_columns:
+            return []
+        predicate, params = self._predicate(sort_key, not self.ascending, False)
+        return self._query(predicate, params, False, n)
+
+    def fetch(self, keys):
+        rows = {}
+        if not self.key_columns:
+            return rows
+        width = len(self.sort_exprs)
+        key_width = len(self.key_columns)
+        for condition, params in key_sets(self.key_columns, keys):
+            for row in self.conn.execute(f"{self.select} WHERE {condition}", params):
+                rows[tuple(row[width - key_width:width])] = (row[:width], row[width:])
+        return rows
+
+    def rowid_bounds(self):
+        return self.catalog.rowid_bounds(self.table)
+
+    def order_key_for(self, rowid):
+        if not self.order_by:
+            return (rowid,)
+        row = self.conn.execute(f"SELECT {quote_ident(self.order_by)} FROM {quote_ident(self.table)} "
+                                f"WHERE {self.key_columns[0]} = ?", (rowid,)).fetchone()
+        return (row[0] if row else None, rowid)
+
+    def seek(self, fraction, n):
+        if self.has_rowid and not self.order_by:
+            low, high = self.rowid_bounds()
+            if low is None:
+                return []
+            target = int(low + fraction * (high - low))
+            return self.after((target,), n, inclusive=True) if self.ascending else self.after((high - (target - low),), n, inclusive=True)
+        estimate = self.estimate()
+        if not estimate:
+            return self.first(n)
+        # Sorted or keyless sources have no cheap positional seek; land once with
+        # OFFSET and continue with keyset paging from there.
+        return self._query(None, (), True, n, offset=int(fraction * estimate))
+
+    def estimate(self):
+        if self.where:
+            return None
+        return self.catalog.row_estimate(self.table)
+
+
+class ListSource:
+    def __init__(self, columns, rows=None, label="Result"):
+        self.columns = list(columns)
+        self.rows = rows if rows is not None else []
+        self.table = label
+        self.where = None
+        self.order_by = None
+        self.has_rowid = False
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+
+    def row_key(self, sort_key):
+        return sort_key
+
+    def _slice(self, start, n):
+        start = max(0, start)
+        return [((i,), self.rows[i]) for i in range(start, min(start + n, len(self.rows)))]
+
+    def first(self, n):
+        return self._slice(0, n)
+
+    def last(self, n):
+        return self._slice(len(self.rows) - n, n)
+
+    def after(self, sort_key, n, inclusive=False):
+        return self._slice(sort_key[0] + (0 if inclusive else 1), n)
+
+    def before(self, sort_key, n):
+        start = max(0, sort_key[0] - n)
+        return self._slice(start, sort_key[0] - start)
+
+    def seek(self, fraction, n):
+        return self._slice(int(fraction * len(self.rows)), n)
+
+    def fetch(self, keys):
+        return {tuple(key): (tuple(key), self.rows[key[0]]) for key in keys if 0 <= key[0] < len(self.rows)}
+
+    def estimate(self):
+        return len(self.rows)
+
+
+def pragma_value(conn, name):
+    # A plain cursor keeps the engine's own bookkeeping out of a ProfilingConnection's records.
+    return sqlite3.Cursor(conn).execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def database_path(conn):
+    for _, name, path in sqlite3.Cursor(conn).execute("PRAGMA database_list"):
+        if name == "main":
+            return path
+    return ""
+
+
+def database_uri(path, **params):
+    uri = "file:" + pathname2url(os.path.abspath(path))
+    if params:
+        uri += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+    return uri
+
+
+def connect_readonly(path, timeout=30):
+    return sqlite3.connect(database_uri(path, mode="ro"), uri=True, timeout=timeout)
+
+
+# Connection settings chosen per database when it is opened. Editing uses WAL with synchronous=NORMAL,
+# which only syncs at checkpoints; Read-only and Archive read through a memory map, and Archive also
+# marks the file immutable so SQLite skips locking and journal checks entirely.
+OPEN_PROFILES = {
+    "Default": {},
+    "Editing": {"journal_mode": "wal", "synchronous": "normal", "cache_mb": 64, "cached_statements": 256},
+    "Read-only": {"mode": "ro", "mmap_mb": 1024, "cache_mb": 64, "cached_statements": 256},
+    "Archive": {"mode": "ro", "immutable": True, "mmap_mb": 1 << 20, "cache_mb": 16, "cached_statements": 256},
+}
+
+
+def open_settings(profile="Default", **overrides):
+    if profile not in OPEN_PROFILES:
+        raise ValueError(f"Unknown open profile '{profile}'")
+    settings = dict(OPEN_PROFILES[profile], profile=profile)
+    settings.update((key, value) for key, value in overrides.items() if value is not None)
+    return settings
+
+
+def connect_database(path, settings=None, profiler=None, timeout=30):
+    settings = settings or {}
+    params = {}
+    if settings.get("mode") == "ro" or settings.get("immutable"):
+        params["mode"] = "ro"
+    if settings.get("immutable"):
+        params["immutable"] = 1
+    target = database_uri(path, **params) if params else path
+    kwargs = {"timeout": timeout, "uri": bool(params), "cached_statements": settings.get("cached_statements", 128)}
+    conn = connect_profiled(target, profiler, **kwargs) if profiler else sqlite3.connect(target, **kwargs)
+    if settings.get("schema_locked"):
+        conn.set_authorizer(deny_schema_changes)
+    elif settings.get("restricted"):
+        conn.set_authorizer(deny_attach)
+    # SQLite caps mmap_size at its compile-time limit, so a large value simply means "as much as allowed".
+    if settings.get("mmap_mb") is not None:
+        conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_mb']) << 20}").fetchall()
+    if settings.get("cache_mb"):
+        conn.execute(f"PRAGMA cache_size = {-int(settings['cache_mb']) * 1024}")
+    if not params:
+        if settings.get("journal_mode"):
+            conn.execute(f"PRAGMA journal_mode = {settings['journal_mode']}").fetchall()
+        if settings.get("synchronous"):
+            conn.execute(f"PRAGMA synchronous = {settings['synchronous']}")
+    return conn
+
+
+class RecentFiles:
+    LIMIT = 10
+
+    def __init__(self, path=None, limit=None):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".opendoc_sql_recent.json")
+        self.limit = limit or self.LIMIT
+        try:
+            with open(self.path) as f:
+                self.entries = [entry for entry in json.load(f) if isinstance(entry, dict) and entry.get("path")]
+        except (OSError, ValueError):
+            self.entries = []
+
+    def settings_for(self, path):
+        path = os.path.abspath(path)
+        for entry in self.entries:
+            if entry["path"] == path:
+                return entry.get("settings") or {}
+        return None
+
+    def remember(self, path, settings):
+        path = os.path.abspath(path)
+        self.entries = [entry for entry in self.entries if entry["path"] != path]
+        self.entries.insert(0, {"path": path, "settings": dict(settings or {})})
+        del self.entries[self.limit:]
+        self.save()
+
+    def forget(self, path):
+        path = os.path.abspath(path)
+        self.entries = [entry for entry in self.entries if entry["path"] != path]
+        self.save()
+
+    def save(self):
+        temp = self.path + ".tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(temp, self.path)
+        except OSError:
+            pass
+
+
+NUMERIC = "typeof({0}) IN ('integer', 'real')"
+
+
+def _where(*conditions):
+    conditions = [condition for condition in conditions if condition]
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _profile_range(uri, table, columns, condition, params):
+    # Mergeable aggregates for one slice of the table: per column the non-null count,
+    # min, max, and count/sum/min/max of its numeric values.
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        parts = ["count(*)"]
+        for column in columns:
+            name = quote_ident(column)
+            numeric = NUMERIC.format(name)
+            parts += [f"count({name})", f"min({name})", f"max({name})",
+                      f"count(CASE WHEN {numeric} THEN 1 END)", f"total(CASE WHEN {numeric} THEN {name} END)",
+                      f"min(CASE WHEN {numeric} THEN {name} END)", f"max(CASE WHEN {numeric} THEN {name} END)"]
+        row = conn.execute(f"SELECT {', '.join(parts)} FROM {quote_ident(table)}{_where(condition)}", params).fetchone()
+        return row[0], {column: row[1 + 7 * i:8 + 7 * i] for i, column in enumerate(columns)}
+    finally:
+        conn.close()
+
+
+def _profile_values(uri, table, column, top):
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        name = quote_ident(column)
+        groups = f"SELECT {name} AS v, count(*) AS n FROM {quote_ident(table)} WHERE {name} IS NOT NULL GROUP BY {name}"
+        if sqlite3.sqlite_version_info >= (3, 25, 0):
+            # One grouping pass yields both the distinct count and the most common values.
+            rows = conn.execute(f"SELECT count(*) OVER (), v, n FROM ({groups}) ORDER BY n DESC, v LIMIT ?",
+                                (top,)).fetchall()
+            return column, rows[0][0] if rows else 0, [row[1:] for row in rows]
+        distinct = conn.execute(f"SELECT count(DISTINCT {name}) FROM {quote_ident(table)}").fetchone()[0]
+        return column, distinct, conn.execute(f"{groups} ORDER BY n DESC, v LIMIT ?", (top,)).fetchall()
+    finally:
+        conn.close()
+
+
+def _profile_histogram(uri, table, spans, bins, condition, params):
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        histograms = {}
+        for column, (low, high) in spans.items():
+            name = quote_ident(column)
+            counts = [0] * bins
+            cursor = conn.execute(f"SELECT min(CAST(({name} - ?) * ? / (? - ?) AS INTEGER), ?) AS bin, count(*) "
+                                  f"FROM {quote_ident(table)}{_where(NUMERIC.format(name), condition)} GROUP BY bin",
+                                  (low, float(bins), high, low, bins - 1) + tuple(params))
+            for index, count in cursor:
+                counts[index] += count
+            histograms[column] = counts
+        return histograms
+    finally:
+        conn.close()
+
+
+class _SerialExecutor:
+    def __init__(self, cancelled=None):
+        self.cancelled = cancelled
+
+    def submit(self, fn, *args):
+        import concurrent.futures
+        if self.cancelled and self.cancelled():
+            raise sqlite3.OperationalError("interrupted")
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class TableProfiler:
+    TOP_VALUES = 5
+    BINS = 20
+    PARALLEL_MIN_ROWS = 200000
+    RANGES_PER_WORKER = 4
+
+    def __init__(self, path, table, columns=None, workers=None, top=None, bins=None):
+        self.path = path
+        self.uri = database_uri(path, mode="ro")
+        self.table = table
+        self.columns = columns
+        self.workers = workers or os.cpu_count() or 1
+        self.top = top or self.TOP_VALUES
+        self.bins = bins or self.BINS
+
+    def _plan(self):
+        conn = connect_readonly(self.path)
+        try:
+            catalog = SchemaCatalog(conn)
+            if catalog.kind(self.table) not in ("table", "view"):
+                raise ValueError(f"No table '{self.table}'")
+            types = {col.name: col.type for col in catalog.columns(self.table)}
+            columns = self.columns or list(types)
+            keys, has_rowid = catalog.key_columns(self.table)
+            parallel = self.workers > 1 and (catalog.row_estimate(self.table) or 0) >= self.PARALLEL_MIN_ROWS
+            ranges = [(None, ())]
+            groups = [columns]
+            low, high = catalog.rowid_bounds(self.table) if parallel and has_rowid else (None, None)
+            if low is not None:
+                step = (high - low) // (self.workers * self.RANGES_PER_WORKER) + 1
+                ranges = [(f"{keys[0]} BETWEEN ? AND ?", (start, min(start + step - 1, high)))
+                          for start in range(low, high + 1, step)]
+            elif parallel:
+                groups = [columns[i::self.workers] for i in range(min(self.workers, len(columns)))]
+            return types, columns, ranges, groups, parallel
+        finally:
+            conn.close()
+
+    def _collect(self, futures, done, total, progress, cancelled):
+        import concurrent.futures
+        results = []
+        for future in concurrent.futures.as_completed(futures):
+            if cancelled and cancelled():
+                raise sqlite3.OperationalError("interrupted")
+            results.append(future.result())
+            done += 1
+            if progress:
+                progress(done, done / total)
+        return results, done
+
+    def run(self, progress=None, cancelled=None):
+        started = time.monotonic()
+        types, columns, ranges, groups, parallel = self._plan()
+        if parallel:
+            import concurrent.futures
+            import multiprocessing
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            executor = _SerialExecutor(cancelled)
+        try:
+            total = len(ranges) * len(groups) * 2 + len(columns)
+            futures = [executor.submit(_profile_range, self.uri, self.table, group, condition, params)
+                       for condition, params in ranges for group in groups]
+            partials, done = self._collect(futures, 0, total, progress, cancelled)
+            rows = sum(count for count, stats in partials) // len(groups)
+            merged = {}
+            for count, stats in partials:
+                for column, (non_null, low, high, numbers, number_sum, number_low, number_high) in stats.items():
+                    entry = merged.setdefault(column, [0, None, None, 0, 0.0, None, None])
+                    entry[0] += non_null
+                    entry[3] += numbers
+                    entry[4] += number_sum
+                    for index, value, pick in ((1, low, min), (2, high, max), (5, number_low, min), (6, number_high, max)):
+                        if value is not None:
+                            entry[index] = value if entry[index] is None else pick(entry[index], value,
+                                                                                    key=lambda v: sqlite_order((v,)))
+            spans = {column: (entry[5], entry[6]) for column, entry in merged.items()
+                     if entry[5] is not None and entry[6] > entry[5]}
+            futures = [executor.submit(_profile_values, self.uri, self.table, column, self.top) for column in columns]
+            futures += [executor.submit(_profile_histogram, self.uri, self.table,
+                                        {column: spans[column] for column in group if column in spans},
+                                        self.bins, condition, params)
+                        for condition, params in ranges for group in groups]
+            results, done = self._collect(futures, done, total, progress, cancelled)
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+        values, histograms = {}, {}
+        for result in results:
+            if isinstance(result, tuple):
+                values[result[0]] = result[1:]
+                continue
+            for column, counts in result.items():
+                histograms[column] = [a + b for a, b in zip(histograms.get(column, [0] * self.bins), counts)]
+        profile = []
+        for column in columns:
+            non_null, low, high, numbers, number_sum, number_low, number_high = merged[column]
+            distinct, top = values[column]
+            profile.append({"column": column, "type": types.get(column, ""), "nulls": rows - non_null,
+                            "distinct": distinct, "min": low, "max": high,
+                            "mean": number_sum / numbers if numbers else None, "top": top,
+                            "histogram": histograms.get(column), "range": spans.get(column)})
+        return {"table": self.table, "rows": rows, "columns": profile, "workers": self.workers if parallel else 1,
+                "seconds": time.monotonic() - started}
+
+
+class ProfileRecord:
+    def __init__(self, sql, params, database):
+        self.sql = sql
+        self.params = params
+        self.database = database
+        self.expanded = None
+        self.started = time.time()
+        self.seconds = 0.0
+        self.rows = 0
+        self.steps = 0
+        self.finished = False
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        record = self.connection.begin_record(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record.seconds += time.perf_counter() - started
+            if self.description is None:
+                self.connection.finish_record(record)
+
+    def executemany(self, sql, seq_of_parameters):
+        record = self.connection.begin_record(sql, None)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record.seconds += time.perf_counter() - started
+            self.connection.finish_record(record)
+
+    def _fetched(self, started, rows, exhausted):
+        record = self.connection.current
+        if record is None:
+            return
+        record.seconds += time.perf_counter() - started
+        record.rows += rows
+        if exhausted:
+            self.connection.finish_record(record)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+
+class ProfilingConnection(sqlite3.Connection):
+    PROGRESS_STEPS = 1000
+
+    def attach_profiler(self, profiler, database=""):
+        self.profiler = profiler
+        self.database = database
+        self.current = None
+        self.user_progress = None
+        self.user_progress_every = 1
+        self.ticks = 0
+        self.set_trace_callback(self._trace)
+        super().set_progress_handler(self._progress, self.PROGRESS_STEPS)
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def set_progress_handler(self, handler, n):
+        # The profiler owns the real handler; chain the caller's at its own interval.
+        self.user_progress = handler
+        self.user_progress_every = max(1, n // self.PROGRESS_STEPS)
+
+    def begin_record(self, sql, params):
+        if self.current is not None:
+            self.finish_record(self.current)
+        self.current = ProfileRecord(sql, params, self.database)
+        return self.current
+
+    def finish_record(self, record):
+        if record.finished:
+            return
+        record.finished = True
+        if self.current is record:
+            self.current = None
+        self.profiler.add(record)
+
+    def _trace(self, statement):
+        record = self.current
+        if record is None or record.expanded is not None:
+            return
+        # Skip the implicit BEGIN the sqlite3 module issues before DML.
+        if statement.strip().upper() == "BEGIN" and not record.sql.strip().upper().startswith("BEGIN"):
+            return
+        record.expanded = statement
+
+    def _progress(self):
+        if self.current is not None:
+            self.current.steps += self.PROGRESS_STEPS
+        self.ticks += 1
+        if self.user_progress and self.ticks % self.user_progress_every == 0:
+            return self.user_progress()
+        return 0
+
+
+def connect_profiled(path, profiler, **kwargs):
+    conn = sqlite3.connect(path, factory=ProfilingConnection, **kwargs)
+    conn.attach_profiler(profiler, path)
+    return conn
+
+
+def explain_plan(conn, sql, params=()):
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    return [(node_id, parent, detail) for node_id, parent, _, detail in rows]
+
+
+def plan_warnings(detail):
+    warnings = []
+    if detail.startswith("SCAN ") and " USING " not in detail:
+        warnings.append("full table scan")
+    if "TEMP B-TREE" in detail:
+        warnings.append("temp b-tree")
+    return warnings
+
+
+SQL_WORD = re.compile(r"""'(?:[^']|'')*'|"((?:[^"]|"")*)"|`([^`]*)`|\[([^\]]*)\]|([A-Za-z_][A-Za-z0-9_$]*)|([.,*])""")
+CLAUSE_WORDS = {"SELECT", "FROM", "JOIN", "WHERE", "ON", "GROUP", "ORDER", "HAVING", "LIMIT", "SET", "VALUES", "USING"}
+COVERING_EXTRA_COLUMNS = 4
+
+
+def _sql_words(sql):
+    for match in SQL_WORD.finditer(sql):
+        quoted = match.group(1) or match.group(2) or match.group(3)
+        if quoted is not None:
+            yield quoted.replace('""', '"'), False
+        elif match.group(4):
+            yield match.group(4), True
+        elif match.group(5):
+            yield match.group(5), None
+
+
+def _query_references(sql):
+    keywords = sqlite_keywords()
+    aliases = {}
+    refs = []
+    clause = None
+    expect_table = False
+    last_table = None
+    named = None
+    words = list(_sql_words(sql))
+    for i, (word, bare) in enumerate(words):
+        upper = word.upper() if bare else None
+        if upper in CLAUSE_WORDS:
+            clause = upper
+            expect_table = upper in ("FROM", "JOIN")
+            last_table = None
+            continue
+        if bare is None:
+            if word == "," and clause == "FROM":
+                expect_table = True
+            elif word == "*":
+                refs.append((clause, None, "*"))
+            continue
+        if bare and upper in keywords:
+            continue
+        if clause in ("FROM", "JOIN"):
+            if expect_table:
+                # The table's own name only stays usable as a qualifier if no alias follows.
+                named = word if word not in aliases else None
+                aliases[word] = last_table = word
+                expect_table = False
+            elif last_table:
+                if named is not None:
+                    del aliases[named]
+                aliases[word] = last_table
+                last_table = named = None
+            continue
+        if i + 1 < len(words) and words[i + 1][0] == "." and words[i + 1][1] is None:
+            continue
+        qualifier = words[i - 2][0] if i >= 2 and words[i - 1] == (".", None) else None
+        refs.append((clause, qualifier, word))
+    return aliases, refs
+
+
+def suggest_indexes(sql, plan, catalog):
+    # References are grouped per alias, so the two sides of a self-join get separate indexes.
+    aliases, refs = _query_references(sql)
+    aliases = {alias: table for alias, table in aliases.items() if catalog.kind(table) == "table"}
+    columns = {table: {c.lower(): c for c in catalog.column_names(table)} for table in set(aliases.values())}
+    suggestions = []
+    for _, _, detail in plan:
+        if not plan_warnings(detail):
+            continue
+        words = detail.split()
+        if words[0] == "SCAN" and len(words) > 1:
+            # SQLite before 3.36 writes "SCAN TABLE t AS a".
+            if words[1] == "TABLE" and len(words) > 2:
+                words = words[1:]
+                if len(words) > 3 and words[2] == "AS":
+                    words = words[2:]
+            names = [words[1]]
+        else:
+            names = sorted(aliases)
+        for alias in names:
+            table = aliases.get(alias, alias)
+            if catalog.kind(table) != "table":
+                continue
+            own = columns.get(table) or {c.lower(): c for c in catalog.column_names(table)}
+            filters, joins, ordering, selected = [], [], [], []
+            for clause, qualifier, word in refs:
+                if word == "*":
+                    if clause == "SELECT":
+                        selected.append("*")
+                    continue
+                if qualifier is not None:
+                    owner = qualifier
+                else:
+                    owners = [a for a, t in aliases.items() if word.lower() in columns[t]] or [alias]
+                    owner = owners[0] if len(owners) == 1 else None
+                column = own.get(word.lower())
+                if owner != alias or column is None:
+                    continue
+                # Filters on this alias alone lead the key; join columns follow them.
+                if clause in ("WHERE", "HAVING"):
+                    target = filters
+                elif clause == "ON":
+                    target = joins
+                elif clause in ("ORDER", "GROUP"):
+                    target = ordering
+                elif clause == "SELECT":
+                    target = selected
+                else:
+                    continue
+                if column not in target:
+                    target.append(column)
+            filters += [c for c in joins if c not in filters]
+            key = filters + [c for c in ordering if c not in filters]
+            if not key:
+                continue
+            if any(index.columns[:len(key)] == key for index in catalog.indexes(table)):
+                continue
+            extra = [c for c in selected if c not in key]
+            if "*" not in selected and 0 < len(extra) <= COVERING_EXTRA_COLUMNS:
+                key += extra
+            index_name = "idx_" + "_".join([table] + key).replace(" ", "_")
+            statement = f"CREATE INDEX {quote_ident(index_name)} ON {quote_ident(table)}({', '.join(map(quote_ident, key))})"
+            if statement not in suggestions:
+                suggestions.append(statement)
+    return suggestions
+
+
+class QueryProfiler:
+    HISTORY = 1000
+    LOG_PATH = os.path.join(os.path.expanduser("~"), ".opendoc_sql_slow_queries.jsonl")
+    # The log rotates to LOG_PATH + ".1" at this size, so it and slow_log() stay bounded.
+    LOG_LIMIT = 1024 * 1024
+
+    def __init__(self, threshold=0.5, log_path=None, log_limit=None):
+        self.threshold = threshold
+        self.log_path = log_path or self.LOG_PATH
+        self.log_limit = log_limit or self.LOG_LIMIT
+        self.records = collections.deque(maxlen=self.HISTORY)
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+        if record.seconds >= self.threshold:
+            self.log_slow(record)
+
+    def recent(self):
+        with self.lock:
+            return list(self.records)
+
+    def log_slow(self, record):
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.started)),
+                 "database": record.database, "sql": record.expanded or record.sql,
+                 "seconds": round(record.seconds, 4), "rows": record.rows, "steps": record.steps}
+        try:
+            with self.lock:
+                if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.log_limit:
+                    os.replace(self.log_path, self.log_path + ".1")
+                with open(self.log_path, "a", encoding="utf-8") as log:
+                    log.write(json.dumps(entry) + "\n")
+        except OSError:
+            pass
+
+    def slow_log(self, limit=500):
+        lines = collections.deque(maxlen=limit)
+        for path in (self.log_path + ".1", self.log_path):
+            try:
+                with open(path, encoding="utf-8") as log:
+                    lines.extend(log)
+            except OSError:
+                continue
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+
+def split_statements(sql):
+    statements = []
+    start = 0
+    pos = sql.find(";")
+    while pos != -1:
+        candidate = sql[start:pos + 1]
+        if sqlite3.complete_statement(candidate):
+            if candidate.strip(" \t\r\n;"):
+                statements.append(candidate.strip())
+            start = pos + 1
+        pos = sql.find(";", pos + 1)
+    rest = sql[start:].strip()
+    if rest:
+        statements.append(rest)
+    return statements
+
+
+LEADING_COMMENTS = re.compile(r"(?:\s+|--[^\n]*(?:\n|$)|/\*.*?(?:\*/|$))*", re.S)
+
+
+def statement_verb(statement):
+    match = re.match(r"[A-Za-z]+", statement[LEADING_COMMENTS.match(statement).end():])
+    return match.group(0).upper() if match else ""
+
+
+class ScriptRunner:
+    # These manage transactions themselves or cannot run inside one, so such scripts run statement by statement.
+    PLAIN_VERBS = {"BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE", "VACUUM", "ATTACH", "DETACH"}
+    SAVEPOINT = "opendoc_statement"
+    BATCH_SIZE = 500
+    RESULT_ROW_LIMIT = 200000
+
+    def __init__(self, conn, sql, row_limit=None, result_limit=None):
+        self.conn = conn
+        self.statements = split_statements(sql)
+        self.transactional = not any(statement_verb(statement) in self.PLAIN_VERBS for statement in self.statements)
+        self.row_limit = row_limit or self.RESULT_ROW_LIMIT
+        self.result_limit = result_limit
+        self.results = []
+        self.open = False
+        self.isolation_level = ""
+
+    def run(self, post=None, cancelled=None):
+        # Statement results go to post() as ("result", (index, sql, columns)), ("rows", (index, batch)),
+        # ("truncated", (index, rows)) and ("statement", entry). A failing statement is rolled back to its
+        # savepoint and ends the run; the good statements before it stay pending until finish().
+        conn = self.conn
+        post = post or (lambda kind, payload: None)
+        if conn.in_transaction:
+            conn.commit()
+        self.isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        if self.transactional:
+            conn.execute("BEGIN")
+        schema_version = pragma_value(conn, "schema_version")
+        cursor = conn.cursor()
+        error = None
+        shown = 0
+        for index, statement in enumerate(self.statements):
+            entry = {"index": index, "sql": statement, "columns": None, "rows": 0, "changes": 0,
+                     "seconds": 0.0, "error": None}
+            self.results.append(entry)
+            before = conn.total_changes
+            started = time.perf_counter()
+            saved = False
+            try:
+                if cancelled and cancelled():
+                    raise sqlite3.OperationalError("interrupted")
+                if self.transactional:
+                    cursor.execute(f"SAVEPOINT {self.SAVEPOINT}")
+                    saved = True
+                cursor.execute(statement)
+                if cursor.description is not None:
+                    entry["columns"] = [d[0] for d in cursor.description]
+                    show = self.result_limit is None or shown < self.result_limit
+                    if show:
+                        shown += 1
+                        post("result", (index, statement, entry["columns"]))
+                    while True:
+                        batch = cursor.fetchmany(self.BATCH_SIZE)
+                        if not batch:
+                            break
+                        entry["rows"] += len(batch)
+                        if show:
+                            post("rows", (index, batch))
+                        if entry["rows"] >= self.row_limit:
+                            post("truncated", (index, entry["rows"]))
+                            break
+                if saved:
+                    cursor.execute(f"RELEASE {self.SAVEPOINT}")
+            except sqlite3.Error as e:
+                error = e
+                entry["error"] = str(e)
+                cursor.close()
+                # Some errors (an interrupted write, a full disk) make SQLite roll back the whole transaction.
+                if saved and conn.in_transaction:
+                    conn.execute(f"ROLLBACK TO {self.SAVEPOINT}")
+                    conn.execute(f"RELEASE {self.SAVEPOINT}")
+            entry["seconds"] = time.perf_counter() - started
+            entry["changes"] = conn.total_changes - before
+            post("statement", entry)
+            if error is not None:
+                break
+        self.open = conn.in_transaction
+        changes = sum(entry["changes"] for entry in self.results)
+        # Row counts catch DML (with or without RETURNING), the schema version catches DDL.
+        modified = changes > 0 or pragma_value(conn, "schema_version") != schema_version
+        return {"statements": len(self.results), "failed": len(self.results) - 1 if error else None,
+                "error": error, "pending": self.open, "changes": changes, "modified": modified}
+
+    def finish(self, commit=True):
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT" if commit else "ROLLBACK")
+        self.open = False
+        self.conn.isolation_level = self.isolation_level
+
+
+def infer_column_type(values):
+    kind = None
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool) or isinstance(value, int):
+            kind = kind or "INTEGER"
+            continue
+        if isinstance(value, float):
+            kind = "REAL"
+            continue
+        if not isinstance(value, str):
+            return "TEXT"
+        text = value.strip()
+        # Leading zeros are usually codes (zip, phone), not numbers.
+        if len(text) > 1 and text[0] == "0" and text[1] != ".":
+            return "TEXT"
+        try:
+            int(text)
+            kind = kind or "INTEGER"
+            continue
+        except ValueError:
+            pass
+        try:
+            float(text)
+            kind = "REAL"
+        except ValueError:
+            return "TEXT"
+    return kind or "TEXT"
+
+
+def detect_format(path, formats):
+    # Maps the extension (under an optional .gz) through formats; anything unknown is CSV.
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return formats.get(os.path.splitext(name)[1], "csv")
+
+
+class BulkImporter:
+    BATCH_SIZE = 50000
+    SAMPLE_ROWS = 1000
+    PRAGMAS = {"journal_mode": None, "synchronous": "OFF", "cache_size": -262144}
+    FORMATS = {".csv": "csv", ".tsv": "tsv", ".tab": "tsv", ".txt": "tsv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+    def __init__(self, conn, path, table, fmt=None, pragmas=None, batch_size=None):
+        self.conn = conn
+        self.path = path
+        self.table = table
+        self.format = fmt or detect_format(path, self.FORMATS)
+        self.pragmas = dict(self.PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+    def _open(self):
+        raw = open(self.path, "rb")
+        stream = gzip.GzipFile(fileobj=raw) if self.path.lower().endswith(".gz") else raw
+        return raw, io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    def _records(self, text):
+        if self.format == "jsonl":
+            return self._json_records(text)
+        reader = csv.reader(text, delimiter="\t" if self.format == "tsv" else ",")
+        header = next(reader, None) or []
+        width = len(header)
+
+        def rows():
+            for row in reader:
+                if len(row) != width:
+                    row = (row + [""] * width)[:width]
+                yield [value if value != "" else None for value in row]
+        return header, rows()
+
+    def _json_records(self, text):
+        objects = (json.loads(line) for line in text if line.strip())
+        sample = list(itertools.islice(objects, self.SAMPLE_ROWS))
+        header = []
+        for obj in sample:
+            for key in obj:
+                if key not in header:
+                    header.append(key)
+
+        def value(item):
+            return json.dumps(item) if isinstance(item, (dict, list)) else item
+
+        def rows():
+            for obj in itertools.chain(sample, objects):
+                yield [value(obj.get(key)) for key in header]
+        return header, rows()
+
+    def _prepare_table(self, header, sample):
+        cursor = self.conn.cursor()
+        cursor.execute(f"PRAGMA table_info({quote_ident(self.table)})")
+        info = cursor.fetchall()
+        if not info:
+            names = []
+            for i, name in enumerate(header):
+                name = (name or "").strip() or f"column{i + 1}"
+                while name.lower() in (n.lower() for n in names):
+                    name += "_"
+                names.append(name)
+            types = [infer_column_type(row[i] for row in sample) for i in range(len(names))]
+            columns = ", ".join(f"{quote_ident(n)} {t}" for n, t in zip(names, types))
+            cursor.execute(f"CREATE TABLE {quote_ident(self.table)} ({columns})")
+            return list(enumerate(names)), True, []
+        existing = {row[1].lower(): row[1] for row in info}
+        mapping = [(i, existing[name.lower()]) for i, name in enumerate(header) if name.lower() in existing]
+        skipped = [name for name in header if name.lower() not in existing]
+        if not mapping:
+            raise ValueError(f"None of the columns in {os.path.basename(self.path)} exist in {self.table}")
+        return mapping, False, skipped
+
+    def _apply_pragmas(self):
+        saved = {}
+        for name, value in self.pragmas.items():
+            if value is None or name not in self.PRAGMAS:
+                continue
+            if not re.fullmatch(r"-?\w+", str(value)):
+                raise ValueError(f"Invalid value for PRAGMA {name}: {value}")
+            saved[name] = self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        return saved
+
+    def _restore_pragmas(self, saved):
+        for name, value in saved.items():
+            self.conn.execute(f"PRAGMA {name} = {value}")
+
+    def run(self, progress=None, cancelled=None):
+        size = os.path.getsize(self.path) or 1
+        raw, text = self._open()
+        with raw, text:
+            header, rows = self._records(text)
+            if not header:
+                raise ValueError(f"{os.path.basename(self.path)} has no header row")
+            sample = list(itertools.islice(rows, self.SAMPLE_ROWS))
+            self.conn.commit()
+            saved = self._apply_pragmas()
+            started = time.monotonic()
+            count = 0
+            try:
+                self.conn.execute("BEGIN")
+                mapping, created, skipped = self._prepare_table(header, sample)
+                indexes = [i for i, _ in mapping]
+                columns = ", ".join(quote_ident(name) for _, name in mapping)
+                sql = f"INSERT INTO {quote_ident(self.table)} ({columns}) VALUES ({', '.join('?' * len(mapping))})"
+                source = itertools.chain(sample, rows)
+                if indexes != list(range(len(header))):
+                    source = ([row[i] for i in indexes] for row in source)
+                while True:
+                    batch = list(itertools.islice(source, self.batch_size))
+                    if not batch:
+                        break
+                    self.conn.executemany(sql, batch)
+                    count += len(batch)
+                    if cancelled and cancelled():
+                        raise sqlite3.OperationalError("interrupted")
+                    if progress:
+                        elapsed = time.monotonic() - started
+                        progress(count, min(raw.tell() / size, 1.0), count / elapsed if elapsed else 0.0)
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self._restore_pragmas(saved)
+        elapsed = time.monotonic() - started
+        return {"table": self.table, "rows": count, "seconds": elapsed,
+                "rows_per_sec": count / elapsed if elapsed else 0.0,
+                "created": created, "skipped_columns": skipped}
+
+
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value) if value == value and abs(value) != float("inf") else "NULL"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "X'" + bytes(value).hex() + "'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def rows_to_tsv(rows, header=None):
+    # Tab-separated with spreadsheet quoting; NULL becomes an empty cell.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, dialect="excel-tab", lineterminator="\n")
+    if header:
+        writer.writerow(header)
+    for row in rows:
+        writer.writerow(["" if value is None else bytes(value).hex() if isinstance(value, (bytes, memoryview))
+                         else value for value in row])
+    return buffer.getvalue()
+
+
+def tsv_to_rows(text):
+    return [row for row in csv.reader(io.StringIO(text), dialect="excel-tab") if row]
+
+
+class StreamingExporter:
+    BATCH_SIZE = 5000
+    BUFFER_SIZE = 1 << 20
+    FORMATS = {".csv": "csv", ".tsv": "tsv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl", ".sql": "sql"}
+
+    def __init__(self, conn, sql, params=(), table=None, fmt=None, compress=None, batch_size=None):
+        self.conn = conn
+        self.sql = sql
+        self.params = tuple(params)
+        self.table = table
+        self.format = fmt
+        self.compress = compress
+        self.batch_size = batch_size or self.BATCH_SIZE
+
+    @classmethod
+    def for_table(cls, conn, table, **options):
+        return cls(conn, f"SELECT * FROM {quote_ident(table)}", table=table, **options)
+
+    def _open(self, path, compress):
+        if compress:
+            raw = gzip.open(path, "wb", compresslevel=6)
+            return io.TextIOWrapper(io.BufferedWriter(raw, self.BUFFER_SIZE), encoding="utf-8", newline="")
+        return open(path, "w", encoding="utf-8", newline="", buffering=self.BUFFER_SIZE)
+
+    def _writer(self, out, fmt, columns):
+        if fmt in ("csv", "tsv"):
+            writer = csv.writer(out, delimiter="\t" if fmt == "tsv" else ",")
+            writer.writerow(columns)
+            return writer.writerows, None
+        if fmt == "jsonl":
+            def write_json(rows):
+                out.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False,
+                                          default=_json_default) + "\n" for row in rows)
+            return write_json, None
+        if fmt == "sql":
+            target = f"INSERT INTO {quote_ident(self.table or 'query_result')} ({', '.join(map(quote_ident, columns))}) VALUES ("
+            out.write("BEGIN TRANSACTION;\n")
+
+            def write_sql(rows):
+                out.writelines(target + ", ".join(map(sql_literal, row)) + ");\n" for row in rows)
+            return write_sql, "COMMIT;\n"
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    def run(self, path, progress=None, cancelled=None):
+        fmt = self.format or detect_format(path, self.FORMATS)
+        compress = self.compress if self.compress is not None else path.lower().endswith(".gz")
+        total = SchemaCatalog(self.conn).row_estimate(self.table) if self.table else None
+        cursor = self.conn.cursor()
+        cursor.execute(self.sql, self.params)
+        if cursor.description is None:
+            raise ValueError("The statement does not return rows")
+        columns = [d[0] for d in cursor.description]
+        started = time.monotonic()
+        count = 0
+        try:
+            with self._open(path, compress) as out:
+                write, footer = self._writer(out, fmt, columns)
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    write(rows)
+                    count += len(rows)
+                    if cancelled and cancelled():
+                        raise sqlite3.OperationalError("interrupted")
+                    if progress:
+                        elapsed = time.monotonic() - started
+                        fraction = min(count / total, 1.0) if total else None
+                        progress(count, fraction, count / elapsed if elapsed else 0.0)
+                if footer:
+                    out.write(footer)
+        except BaseException:
+            cursor.close()
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        elapsed = time.monotonic() - started
+        return {"path": path, "format": fmt, "rows": count, "seconds": elapsed,
+                "rows_per_sec": count / elapsed if elapsed else 0.0}
+
+
+class OnlineBackup:
+    PAGES_PER_STEP = 1024
+    SLEEP = 0.005
+
+    def __init__(self, source_path, target_path, pages=None, sleep=None):
+        if os.path.abspath(source_path) == os.path.abspath(target_path):
+            raise ValueError("Choose a different file than the open database")
+        self.source_path = source_path
+        self.target_path = target_path
+        self.pages = pages or self.PAGES_PER_STEP
+        self.sleep = self.SLEEP if sleep is None else sleep
+
+    def run(self, progress=None, cancelled=None):
+        partial = self.target_path + ".part"
+        if os.path.exists(partial):
+            os.remove(partial)
+        started = time.monotonic()
+
+        def step(status, remaining, total):
+            if cancelled and cancelled():
+                raise sqlite3.OperationalError("interrupted")
+            if progress and total:
+                progress(total - remaining, total)
+
+        source = connect_readonly(self.source_path)
+        try:
+            target = sqlite3.connect(partial)
+            try:
+                source.backup(target, pages=self.pages, progress=step, sleep=self.sleep)
+            finally:
+                target.close()
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        finally:
+            source.close()
+        os.replace(partial, self.target_path)
+        return {"path": self.target_path, "seconds": time.monotonic() - started}
+
+
+class JobStore:
+    # Resumable job state lives with the app's settings, so jobs never add tables to the user's database.
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".opendoc_sql_jobs.json")
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                jobs = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return jobs if isinstance(jobs, dict) else {}
+
+    def _save(self, jobs):
+        temp = self.path + ".tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(jobs, f, indent=2)
+            os.replace(temp, self.path)
+        except OSError:
+            pass
+
+    def get(self, job_id):
+        return self._load().get(str(job_id))
+
+    def pending(self, database, kind):
+        jobs = [(int(job_id), job) for job_id, job in self._load().items()
+                if job.get("database") == database and job.get("kind") == kind
+                and job.get("status") not in ("done", "abandoned")]
+        return sorted(jobs, key=lambda item: item[0])
+
+    def start(self, database, kind, spec):
+        with self.lock:
+            # Finished jobs are only kept until the next one starts.
+            jobs = {job_id: job for job_id, job in self._load().items() if job.get("status") not in ("done", "abandoned")}
+            job_id = max((int(key) for key in jobs), default=0) + 1
+            now = time.time()
+            jobs[str(job_id)] = {"database": database, "kind": kind, "spec": spec, "position": None, "rows_done": 0,
+                                 "status": "running", "started": now, "updated": now}
+            self._save(jobs)
+        return job_id
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            jobs = self._load()
+            job = jobs.get(str(job_id))
+            if job is not None:
+                job.update(fields, updated=time.time())
+                self._save(jobs)
+
+
+class ColumnTransform:
+    CHUNK_ROWS = 20000
+    SLEEP = 0.01
+    EXACT_COUNT_LIMIT = 100000
+    SAMPLE_POINTS = 50
+    SAMPLE_ROWS = 20
+
+    def __init__(self, conn, table, column, value=None, expression=None, where=None,
+                 chunk_rows=None, sleep=None, catalog=None, job_id=None, store=None):
+        self.conn = conn
+        self.catalog = catalog or SchemaCatalog(conn)
+        self.store = store or JobStore()
+        self.database = database_key(database_path(conn))
+        self.table = table
+        self.column = column
+        self.value = value
+        self.expression = expression
+        self.where = where.strip() if where and where.strip() else None
+        self.chunk_rows = chunk_rows or self.CHUNK_ROWS
+        self.sleep = self.SLEEP if sleep is None else sleep
+        self.job_id = job_id
+        if column not in self.catalog.column_names(table):
+            raise ValueError(f"No column '{column}' in {table}")
+        keys = self.catalog.key_columns(table)[0]
+        if len(keys) != 1:
+            raise ValueError(f"{table} needs a rowid or a single-column primary key for chunked updates")
+        if column in self.catalog.primary_key(table):
+            raise ValueError("Edit Column cannot rewrite the row key; use the SQL console instead")
+        self.key = keys[0]
+
+    @classmethod
+    def pending(cls, conn, store=None):
+        jobs = (store or JobStore()).pending(database_key(database_path(conn)), "column_transform")
+        return [(job_id, job["spec"], job["rows_done"], job["status"], job["updated"]) for job_id, job in jobs]
+
+    @classmethod
+    def resume(cls, conn, job_id, catalog=None, store=None, **options):
+        store = store or JobStore()
+        job = store.get(job_id)
+        if job is None or job["database"] != database_key(database_path(conn)):
+            raise ValueError(f"No job {job_id}")
+        spec = job["spec"]
+        options.setdefault("chunk_rows", spec.get("chunk_rows"))
+        return cls(conn, spec["table"], spec["column"], spec.get("value"), spec.get("expression"), spec.get("where"),
+                   catalog=catalog, job_id=job_id, store=store, **options)
+
+    @classmethod
+    def abandon(cls, conn, job_id, store=None):
+        (store or JobStore()).update(job_id, status="abandoned")
+
+    def _set_sql(self):
+        if self.expression is not None:
+            return f"({self.expression})", ()
+        return "?", (self.value,)
+
+    def _filter(self):
+        return f" AND ({self.where})" if self.where else ""
+
+    def validate(self):
+        value_sql, params = self._set_sql()
+        self.conn.execute(f"SELECT {value_sql} FROM {quote_ident(self.table)} WHERE 1{self._filter()} LIMIT 0", params)
+
+    def estimate(self):
+        total = self.catalog.row_estimate(self.table) or 0
+        if not self.where:
+            return total
+        table = quote_ident(self.table)
+        if total <= self.EXACT_COUNT_LIMIT:
+            return self.conn.execute(f"SELECT count(*) FROM {table} WHERE {self.where}").fetchone()[0]
+        # Evaluate the filter on short runs of rows starting at random key positions;
+        # for integer keys the runs also measure how densely the key range is used.
+        test = f"SELECT {self.key}, CASE WHEN ({self.where}) THEN 1 ELSE 0 END FROM {table}"
+        low, high = self.conn.execute(f"SELECT min({self.key}), max({self.key}) FROM {table}").fetchone()
+        hits = seen = span = 0
+        if isinstance(low, int) and isinstance(high, int):
+            rng = random.Random(0)
+            for _ in range(self.SAMPLE_POINTS):
+                start = rng.randint(low, high)
+                rows = self.conn.execute(f"{test} WHERE {self.key} >= ? ORDER BY {self.key} LIMIT ?",
+                                         (start, self.SAMPLE_ROWS)).fetchall()
+                if rows:
+                    hits += sum(row[1] for row in rows)
+                    seen += len(rows)
+                    span += rows[-1][0] - start + 1
+            if span:
+                total = int((high - low + 1) * seen / span)
+        else:
+            rows = self.conn.execute(f"{test} LIMIT ?", (self.SAMPLE_POINTS * self.SAMPLE_ROWS,)).fetchall()
+            hits, seen = sum(row[1] for row in rows), len(rows)
+        return int(total * hits / seen) if seen else 0
+
+    def _start_job(self):
+        if self.job_id is not None:
+            job = self.store.get(self.job_id)
+            self.store.update(self.job_id, status="running")
+            return job["position"], job["rows_done"]
+        spec = {"table": self.table, "column": self.column, "value": self.value, "expression": self.expression,
+                "where": self.where, "chunk_rows": self.chunk_rows}
+        self.job_id = self.store.start(self.database, "column_transform", spec)
+        return None, 0
+
+    def run(self, progress=None, cancelled=None):
+        self.validate()
+        position, done = self._start_job()
+        table = quote_ident(self.table)
+        value_sql, value_params = self._set_sql()
+        total = self.catalog.row_estimate(self.table) or 0
+        scanned = 0
+        started = time.monotonic()
+        try:
+            while True:
+                if cancelled and cancelled():
+                    raise sqlite3.OperationalError("interrupted")
+                after = f"WHERE {self.key} > ? " if position is not None else ""
+                after_params = (position,) if position is not None else ()
+                # The chunk is the next chunk_rows keys; only its upper bound is looked up.
+                row = self.conn.execute(f"SELECT {self.key} FROM {table} {after}ORDER BY {self.key} "
+                                        f"LIMIT 1 OFFSET {self.chunk_rows - 1}", after_params).fetchone()
+                upper = row[0] if row else None
+                bounds = [f"{self.key} > ?"] if position is not None else []
+                if upper is not None:
+                    bounds.append(f"{self.key} <= ?")
+                bounds_params = after_params + ((upper,) if upper is not None else ())
+                condition = " AND ".join(bounds) or "1"
+                with self.conn:
+                    cursor = self.conn.execute(f"UPDATE {table} SET {quote_ident(self.column)} = {value_sql} "
+                                               f"WHERE {condition}{self._filter()}", value_params + bounds_params)
+                    done += max(cursor.rowcount, 0)
+                # Saved once the chunk has committed; a crash in between repeats this one chunk on resume.
+                self.store.update(self.job_id, position=upper, rows_done=done,
+                                  status="running" if upper is not None else "done")
+                position = upper
+                scanned += self.chunk_rows
+                if progress:
+                    elapsed = time.monotonic() - started
+                    fraction = min(scanned / total, 1.0) if total else None
+                    progress(done, 1.0 if upper is None else fraction, scanned / elapsed if elapsed else 0.0)
+                if upper is None:
+                    break
+                # Leave a gap between chunks so other writers can take the lock.
+                time.sleep(self.sleep)
+        except BaseException as e:
+            self.store.update(self.job_id, status="paused" if isinstance(e, sqlite3.OperationalError)
+                              and str(e) == "interrupted" else "failed")
+            raise
+        elapsed = time.monotonic() - started
+        return {"table": self.table, "column": self.column, "rows": done, "seconds": elapsed, "job": self.job_id}
+
+
+SQL_PIECE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\]|--[^\n]*|/\*.*?(?:\*/|$)"""
+                       r"""|[A-Za-z_][A-Za-z0-9_$]*|\s+|.""", re.S)
+TABLE_CONSTRAINT_WORDS = {"constraint", "primary", "unique", "check", "foreign"}
+
+
+def _identifier(piece):
+    # The identifier a token names, or None for literals, comments and punctuation.
+    if piece[:1] in ('"', "`"):
+        return piece[1:-1].replace(piece[0] * 2, piece[0])
+    if piece[:1] == "[":
+        return piece[1:-1]
+    if piece[:1].isalpha() or piece[:1] == "_":
+        return piece
+    return None
+
+
+def references_identifier(sql, name):
+    return any((_identifier(piece) or "").lower() == name.lower() for piece in SQL_PIECE.findall(sql))
+
+
+def rename_identifier(sql, old, new):
+    return "".join(quote_ident(new) if (_identifier(piece) or "").lower() == old.lower() else piece
+                   for piece in SQL_PIECE.findall(sql))
+
+
+def split_table_definition(sql):
+    # Splits CREATE TABLE sql into (head, [column and constraint definitions], tail).
+    head, definitions, current, tail = [], [], [], []
+    depth = 0
+    for piece in SQL_PIECE.findall(sql):
+        if current is None:
+            tail.append(piece)
+        elif depth == 0:
+            if piece == "(":
+                depth = 1
+            else:
+                head.append(piece)
+        elif piece == "," and depth == 1:
+            definitions.append("".join(current).strip())
+            current = []
+        else:
+            if piece == "(":
+                depth += 1
+            elif piece == ")":
+                depth -= 1
+                if depth == 0:
+                    definitions.append("".join(current).strip())
+                    current = None
+                    continue
+            current.append(piece)
+    return "".join(head), definitions, "".join(tail)
+
+
+def definition_column(definition):
+    first = SQL_PIECE.match(definition)
+    name = _identifier(first.group()) if first else None
+    if name is None or (first.group()[:1].isalpha() and name.lower() in TABLE_CONSTRAINT_WORDS):
+        return None
+    return name
+
+
+class ColumnChange:
+    BATCH_ROWS = 50000
+    RENAME_VERSION = (3, 25, 0)
+    DROP_VERSION = (3, 35, 0)
+
+    def __init__(self, conn, table, column, new_name=None, batch_rows=None, native=True, catalog=None):
+        self.conn = conn
+        self.catalog = catalog or SchemaCatalog(conn)
+        self.table = table
+        self.column = column
+        self.new_name = new_name
+        self.batch_rows = batch_rows or self.BATCH_ROWS
+        self.native = native
+        names = self.catalog.column_names(table)
+        if self.catalog.kind(table) != "table":
+            raise ValueError(f"{table} is not a table")
+        if column not in names:
+            raise ValueError(f"No column '{column}' in {table}")
+        if new_name is not None and new_name.lower() in {name.lower() for name in names if name != column}:
+            raise ValueError(f"{table} already has a column '{new_name}'")
+        if new_name is None and len(names) == 1:
+            raise ValueError(f"Cannot drop the only column of {table}")
+
+    def native_supported(self):
+        required = self.DROP_VERSION if self.new_name is None else self.RENAME_VERSION
+        return self.native and sqlite3.sqlite_version_info >= required
+
+    def run(self, progress=None, cancelled=None):
+        index = SearchIndex(self.conn, self.catalog)
+        indexed = index.indexed_tables().get(self.table)
+        if not indexed or self.column not in indexed:
+            return self._change(progress, cancelled)
+        # The search index and its sync triggers name the column, so they are rebuilt around the change.
+        index.drop(self.table)
+        self.conn.commit()
+        try:
+            summary = self._change(progress, cancelled)
+        except BaseException:
+            index.create(self.table, indexed)
+            self.conn.commit()
+            raise
+        columns = [self.new_name if name == self.column else name for name in indexed
+                   if self.new_name is not None or name != self.column]
+        if columns:
+            index.create(self.table, columns)
+        else:
+            summary["skipped"].append("search index")
+        self.conn.commit()
+        return summary
+
+    def _change(self, progress, cancelled):
+        started = time.monotonic()
+        reason = None
+        if self.native_supported():
+            table, column = quote_ident(self.table), quote_ident(self.column)
+            try:
+                if self.new_name is None:
+                    self.conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+                else:
+                    self.conn.execute(f"ALTER TABLE {table} RENAME COLUMN {column} TO {quote_ident(self.new_name)}")
+                self.conn.commit()
+                return {"table": self.table, "method": "alter", "rows": 0, "skipped": [],
+                        "seconds": time.monotonic() - started}
+            except sqlite3.OperationalError as e:
+                # DROP COLUMN refuses key, unique, indexed and referenced columns; a rebuild can still do it.
+                if self.new_name is not None:
+                    raise
+                reason = str(e)
+        summary = self._rebuild(progress, cancelled)
+        summary.update(reason=reason, seconds=time.monotonic() - started)
+        return summary
+
+    def _new_definition(self, temp):
+        head, definitions, tail = split_table_definition(self.catalog.sql(self.table))
+        kept = []
+        for definition in definitions:
+            name = definition_column(definition)
+            if self.new_name is not None:
+                kept.append(rename_identifier(definition, self.column, self.new_name))
+            elif name is not None and name.lower() == self.column.lower():
+                continue
+            elif references_identifier(definition, self.column):
+                raise ValueError(f"Cannot drop {self.column}: it is used by {definition}")
+            else:
+                kept.append(definition)
+        return f"CREATE TABLE {quote_ident(temp)} ({', '.join(kept)}){tail}"
+
+    def _dependents(self):
+        rows = self.conn.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? "
+                                 "AND type IN ('index', 'trigger') AND sql IS NOT NULL ORDER BY type", (self.table,))
+        recreate, skipped = [], []
+        for kind, name, sql in rows.fetchall():
+            if self.new_name is not None:
+                recreate.append(rename_identifier(sql, self.column, self.new_name))
+            elif references_identifier(sql, self.column):
+                skipped.append(f"{kind} {name}")
+            else:
+                recreate.append(sql)
+        views = []
+        for name, sql in self.conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'").fetchall():
+            if references_identifier(sql, self.table) and references_identifier(sql, self.column):
+                if self.new_name is None:
+                    raise ValueError(f"Cannot drop {self.column}: view {name} uses it")
+                views.append((name, rename_identifier(sql, self.column, self.new_name)))
+        return recreate, skipped, views
+
+    def _rebuild(self, progress, cancelled):
+        table = quote_ident(self.table)
+        temp = f"{self.table}__rebuild"
+        names = self.catalog.column_names(self.table)
+        keys, has_rowid = self.catalog.key_columns(self.table)
+        source = [name for name in names if self.new_name is not None or name != self.column]
+        target = [self.new_name if name == self.column else name for name in source]
+        source_sql = ", ".join((keys if has_rowid else []) + [quote_ident(name) for name in source])
+        target_sql = ", ".join((["rowid"] if has_rowid else []) + [quote_ident(name) for name in target])
+        create = self._new_definition(temp)
+        recreate, skipped, views = self._dependents()
+        total = self.catalog.row_estimate(self.table) or 0
+        key_sql = ", ".join(keys)
+        foreign_keys = self.conn.execute("PRAGMA foreign_keys").fetchone()[0]
+        legacy = self.conn.execute("PRAGMA legacy_alter_table").fetchone()
+        sequence = None
+        if self.catalog.kind("sqlite_sequence") == "table":
+            sequence = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (self.table,)).fetchone()
+        self.conn.commit()
+        self.conn.execute("PRAGMA foreign_keys = OFF")
+        # Keep the final rename from rewriting or validating views and triggers of other tables.
+        self.conn.execute("PRAGMA legacy_alter_table = ON")
+        copied = 0
+        try:
+            self.conn.execute("BEGIN")
+            self.conn.execute(create)
+            insert = f"INSERT INTO {quote_ident(temp)} ({target_sql}) SELECT {source_sql} FROM {table}"
+            if not keys:
+                copied = self.conn.execute(insert).rowcount
+            else:
+                # Copy in key-ordered batches inside SQLite so rows never pass through Python.
+                last = None
+                while True:
+                    if cancelled and cancelled():
+                        raise sqlite3.OperationalError("interrupted")
+                    after = f"WHERE ({key_sql}) > ({', '.join('?' * len(keys))}) " if last is not None else ""
+                    row = self.conn.execute(f"SELECT {key_sql} FROM {table} {after}ORDER BY {key_sql} "
+                                            f"LIMIT 1 OFFSET {self.batch_rows - 1}", last or ()).fetchone()
+                    bounds = [f"({key_sql}) > ({', '.join('?' * len(keys))})"] if last is not None else []
+                    if row is not None:
+                        bounds.append(f"({key_sql}) <= ({', '.join('?' * len(keys))})")
+                    where = f" WHERE {' AND '.join(bounds)}" if bounds else ""
+                    copied += self.conn.execute(insert + where, (last or ()) + (tuple(row) if row else ())).rowcount
+                    if progress:
+                        fraction = 1.0 if row is None else min(copied / total, 1.0) if total else None
+                        progress(copied, fraction)
+                    if row is None:
+                        break
+                    last = tuple(row)
+            self.conn.execute(f"DROP TABLE {table}")
+            self.conn.execute(f"ALTER TABLE {quote_ident(temp)} RENAME TO {table}")
+            if sequence is not None:
+                # The copy only raises the counter to max(rowid); keep ids of deleted rows from being reused.
+                self.conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (self.table,))
+                self.conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (self.table, sequence[0]))
+            for sql in recreate:
+                self.conn.execute(sql)
+            for name, sql in views:
+                self.conn.execute(f"DROP VIEW {quote_ident(name)}")
+                self.conn.execute(sql)
+            if foreign_keys and self.conn.execute(f"PRAGMA foreign_key_check({table})").fetchone():
+                raise sqlite3.IntegrityError(f"Rebuilding {self.table} would break foreign key constraints")
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            if legacy is not None:
+                self.conn.execute(f"PRAGMA legacy_alter_table = {int(legacy[0])}")
+            self.conn.execute(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+        return {"table": self.table, "method": "rebuild", "rows": copied, "skipped": skipped}
+
+
+class SearchIndex:
+    TRIGGERS = ("ai", "ad", "au")
+
+    def __init__(self, conn, catalog=None):
+        self.conn = conn
+        self.catalog = catalog or SchemaCatalog(conn)
+
+    @staticmethod
+    def index_name(table):
+        return table + FTS_SUFFIX
+
+    def indexed_tables(self):
+        indexed = {}
+        tables = set(self.catalog.tables(internal=True))
+        for name in tables:
+            if name.endswith(FTS_SUFFIX) and name[:-len(FTS_SUFFIX)] in tables:
+                indexed[name[:-len(FTS_SUFFIX)]] = self.catalog.column_names(name)
+        return indexed
+
+    def text_columns(self, table):
+        return [col.name for col in self.catalog.columns(table)
+                if not col.type or any(t in col.type.upper() for t in ("CHAR", "CLOB", "TEXT"))]
+
+    def create(self, table, columns):
+        if not self.catalog.key_columns(table)[1]:
+            raise ValueError(f"{table} has no rowid and cannot be indexed for search")
+        fts = quote_ident(self.index_name(table))
+        base = quote_ident(table)
+        names = ", ".join(quote_ident(c) for c in columns)
+        new_values = ", ".join(f"new.{quote_ident(c)}" for c in columns)
+        old_values = ", ".join(f"old.{quote_ident(c)}" for c in columns)
+        delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old_values});"
+        insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new_values});"
+        trigger = {kind: quote_ident(f"{self.index_name(table)}_{kind}") for kind in self.TRIGGERS}
+        self.drop(table)
+        self.conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content={sql_literal(table)}, "
+                          f"content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')")
+        self.conn.execute(f"CREATE TRIGGER {trigger['ai']} AFTER INSERT ON {base} BEGIN {insert} END")
+        self.conn.execute(f"CREATE TRIGGER {trigger['ad']} AFTER DELETE ON {base} BEGIN {delete} END")
+        self.conn.execute(f"CREATE TRIGGER {trigger['au']} AFTER UPDATE ON {base} BEGIN {delete} {insert} END")
+        self.conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    def drop(self, table):
+        for kind in self.TRIGGERS:
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {quote_ident(f'{self.index_name(table)}_{kind}')}")
+        self.conn.execute(f"DROP TABLE IF EXISTS {quote_ident(self.index_name(table))}")
+
+    @staticmethod
+    def match_query(text, column=None):
+        terms = re.findall(r"\w+", text)
+        if not terms:
+            return None
+        query = " ".join(f'"{term}"*' for term in terms)
+        if column:
+            query = "{" + quote_ident(column) + "} : (" + query + ")"
+        return query
+
+    def where_clause(self, table, text, column=None):
+        query = self.match_query(text, column)
+        fts = quote_ident(self.index_name(table))
+        return f"rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?)", (query,)
+
+    def search(self, text, tables=None, limit=50):
+        query = self.match_query(text)
+        if query is None:
+            return []
+        indexed = self.indexed_tables()
+        hits = []
+        for table in (tables if tables is not None else indexed):
+            if table not in indexed:
+                continue
+            fts = quote_ident(self.index_name(table))
+            cursor = self.conn.execute(
+                f"SELECT rowid, bm25({fts}), snippet({fts}, -1, '[', ']', '...', 8) FROM {fts} "
+                f"WHERE {fts} MATCH ? ORDER BY rank LIMIT ?", (query, limit))
+            hits.extend((score, table, rowid, snippet) for rowid, score, snippet in cursor.fetchall())
+        hits.sort(key=lambda hit: hit[0])
+        return [(table, rowid, score, snippet) for score, table, rowid, snippet in hits[:limit]]
+
+
+class ChangeJournal:
+    def __init__(self, limit=100):
+        self.undo_stack = collections.deque(maxlen=limit)
+        self.redo_stack = []
+
+    def record(self, label, undo, redo):
+        self.undo_stack.append((label, undo, redo))
+        self.redo_stack.clear()
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def undo_label(self):
+        return self.undo_stack[-1][0] if self.undo_stack else None
+
+    def redo_label(self):
+        return self.redo_stack[-1][0] if self.redo_stack else None
+
+
+class DatabaseEngine:
+    def __init__(self, path, profiler=None, readonly=False, timeout=30, result_cache=True, settings=None):
+        self.path = path
+        self.profiler = profiler
+        self.settings = settings or {}
+        self.readonly = readonly or self.settings.get("mode") == "ro" or bool(self.settings.get("immutable"))
+        if readonly:
+            self.conn = connect_readonly(path, timeout)
+        else:
+            self.conn = connect_database(path, self.settings, profiler, timeout)
+        self.catalog = SchemaCatalog(self.conn)
+        self.journal = ChangeJournal()
+        self.cache = ResultCache() if result_cache else None
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def table(self, table, order_by=None, ascending=True, where=None, params=()):
+        return TableSource(self.conn, table, order_by, ascending, where, params, catalog=self.catalog, cache=self.cache)
+
+    def sort(self, table, column, ascending=True):
+        return self.table(table, order_by=column, ascending=ascending)
+
+    def find(self, table, column, value):
+        col_types = {col.name: (col.type or "").upper() for col in self.catalog.columns(table)}
+        if column not in col_types:
+            raise ValueError(f"No column '{column}' in {table}")
+        index = SearchIndex(self.conn, self.catalog)
+        if column in index.indexed_tables().get(table, ()) and index.match_query(value):
+            where, params = index.where_clause(table, value, column)
+        elif 'CHAR' in col_types[column] or 'TEXT' in col_types[column]:
+            where, params = f"{quote_ident(column)} LIKE ?", (f"%{value}%",)
+        else:
+            where, params = f"{quote_ident(column)} = ?", (value,)
+        return self.table(table, where=where, params=params)
+
+    def search(self, text, tables=None, limit=50):
+        return SearchIndex(self.conn, self.catalog).search(text, tables, limit)
+
+    def key_predicate(self, table):
+        keys = self._key_columns(table)
+        if len(keys) == 1:
+            return f"{keys[0]} = ?"
+        return f"({', '.join(keys)}) = ({', '.join('?' * len(keys))})"
+
+    def update_cell(self, table, key, column, value):
+        return self.update_cells({table: {tuple(key): {column: value}}})
+
+    def update_cells(self, edits):
+        # edits maps table -> row key -> column -> value; everything is written in
+        # one transaction with one executemany per (table, column).
+        edits = {table: {tuple(key): dict(columns) for key, columns in rows.items()}
+                 for table, rows in edits.items()}
+        undo, redo = [], []
+        changed = 0
+        with self.conn:
+            for table, rows in edits.items():
+                undo.append(("update", table, self._current_values(table, rows)))
+                redo.append(("update", table, rows))
+                changed += self._update(table, rows)
+        cells = sum(len(columns) for rows in edits.values() for columns in rows.values())
+        self.journal.record(f"Edit {cells:,} cell(s)", undo, redo)
+        return changed
+
+    def insert_row(self, table, values):
+        columns = ", ".join(map(quote_ident, values))
+        key_columns, has_rowid = self.catalog.key_columns(table)
+        with self.conn:
+            cursor = self.conn.execute(f"INSERT INTO {quote_ident(table)} ({columns}) "
+                                       f"VALUES ({', '.join('?' * len(values))})", list(values.values()))
+            if has_rowid:
+                key = (cursor.lastrowid,)
+            else:
+                key = tuple(values.get(name) for name in self.catalog.primary_key(table))
+            image = self._row_image(table, [key])
+        self.journal.record("Insert row", [("delete", table, [key])], [("insert", table, image)])
+        return cursor.lastrowid
+
+    def insert_empty_rows(self, table, count):
+        columns = [col.name for col in self.catalog.columns(table) if col.pk == 0]
+        if columns:
+            sql = (f"INSERT INTO {quote_ident(table)} ({', '.join(map(quote_ident, columns))}) "
+                   f"VALUES ({', '.join(['NULL'] * len(columns))})")
+        else:
+            sql = f"INSERT INTO {quote_ident(table)} DEFAULT VALUES"
+        return self._insert_many(table, sql, itertools.repeat((), count), "Add {:,} row(s)")
+
+    def paste_columns(self, table, rows):
+        # Works out which columns clipboard rows map to: a header row of column
+        # names if there is one, otherwise every column or every column except an
+        # INTEGER PRIMARY KEY. The rowid alias is always left out so SQLite assigns
+        # new keys instead of existing rows being renumbered.
+        columns = self.catalog.columns(table)
+        names = [col.name for col in columns]
+        primary = [col for col in columns if col.pk]
+        alias = None
+        if self.catalog.key_columns(table)[1] and len(primary) == 1 and primary[0].type.upper() == "INTEGER":
+            alias = primary[0].name
+        if rows and len(set(rows[0])) == len(rows[0]) and set(rows[0]) <= set(names):
+            return list(rows[0]), alias, rows[1:]
+        width = max((len(row) for row in rows), default=0)
+        if width == len(names):
+            return names, alias, rows
+        if alias and width == len(names) - 1:
+            return [name for name in names if name != alias], alias, rows
+        raise ValueError(f"Rows have {width} field(s) but {table} has {len(names)} column(s)")
+
+    def paste_rows(self, table, rows):
+        columns, alias, rows = self.paste_columns(table, rows)
+        keep = [i for i, name in enumerate(columns) if name != alias]
+        width = len(columns)
+        values = ([None if cell == "" else cell for cell in (list(row) + [""] * (width - len(row)))[:width]]
+                  for row in rows)
+        if len(keep) != width:
+            values = ([row[i] for i in keep] for row in values)
+        names = [columns[i] for i in keep]
+        if names:
+            sql = (f"INSERT INTO {quote_ident(table)} ({', '.join(map(quote_ident, names))}) "
+                   f"VALUES ({', '.join('?' * len(names))})")
+        else:
+            sql = f"INSERT INTO {quote_ident(table)} DEFAULT VALUES"
+            values = (() for _ in values)
+        return self._insert_many(table, sql, values, "Paste {:,} row(s)")
+
+    def _insert_many(self, table, sql, rows, label):
+        key_columns, has_rowid = self.catalog.key_columns(table)
+        rows = list(rows)
+        with self.conn:
+            if not has_rowid:
+                count = self.conn.executemany(sql, rows).rowcount
+            else:
+                rowid = key_columns[0]
+                before = self.conn.execute(f"SELECT coalesce(max({rowid}), 0) FROM {quote_ident(table)}").fetchone()[0]
+                if before < MAX_ROWID - len(rows):
+                    # SQLite hands out max(rowid) + 1 until it reaches MAX_ROWID, so the new rows are those above it.
+                    count = self.conn.executemany(sql, rows).rowcount
+                    keys = self.conn.execute(f"SELECT {rowid} FROM {quote_ident(table)} WHERE {rowid} > ?",
+                                             (before,)).fetchall()
+                else:
+                    # Past MAX_ROWID new rowids are picked at random, so each one is read back.
+                    cursor = self.conn.cursor()
+                    keys = []
+                    for row in rows:
+                        cursor.execute(sql, row)
+                        keys.append((cursor.lastrowid,))
+                    count = len(keys)
+                image = self._row_image(table, keys)
+        if has_rowid:
+            self.journal.record(label.format(count), [("delete", table, keys)], [("insert", table, image)])
+        else:
+            self.journal.clear()
+        return count
+
+    def delete_rows(self, table, keys):
+        keys = [tuple(key) for key in keys]
+        with self.conn:
+            image = self._row_image(table, keys)
+            deleted = self._delete(table, keys)
+        self.journal.record(f"Delete {deleted:,} row(s)", [("insert", table, image)], [("delete", table, keys)])
+        return deleted
+
+    def undo(self):
+        if not self.journal.undo_stack:
+            return None
+        label, undo, redo = self.journal.undo_stack[-1]
+        with self.conn:
+            for operation in reversed(undo):
+                self._apply(operation)
+        self.journal.undo_stack.pop()
+        self.journal.redo_stack.append((label, undo, redo))
+        return label
+
+    def redo(self):
+        if not self.journal.redo_stack:
+            return None
+        label, undo, redo = self.journal.redo_stack[-1]
+        with self.conn:
+            for operation in redo:
+                self._apply(operation)
+        self.journal.redo_stack.pop()
+        self.journal.undo_stack.append((label, undo, redo))
+        return label
+
+    def _apply(self, operation):
+        kind, table, data = operation
+        if kind == "insert":
+            columns, rows = data
+            self.conn.executemany(f"INSERT INTO {quote_ident(table)} ({', '.join(columns)}) "
+                                  f"VALUES ({', '.join('?' * len(columns))})", rows)
+        elif kind == "delete":
+            self._delete(table, data)
+        elif kind == "update":
+            self._update(table, data)
+
+    def _key_columns(self, table):
+        keys = self.catalog.key_columns(table)[0]
+        if not keys:
+            raise ValueError(f"{table} has no rowid or primary key")
+        return keys
+
+    def _row_image(self, table, keys):
+        key_columns, has_rowid = self.catalog.key_columns(table)
+        columns = (key_columns if has_rowid else []) + [quote_ident(name) for name in self.catalog.column_names(table)]
+        rows = []
+        for condition, params in key_sets(self._key_columns(table), keys):
+            rows.extend(self.conn.execute(f"SELECT {', '.join(columns)} FROM {quote_ident(table)} WHERE {condition}",
+                                          params).fetchall())
+        return columns, rows
+
+    def _current_values(self, table, rows):
+        key_columns = self._key_columns(table)
+        columns = sorted({column for values in rows.values() for column in values})
+        select = ", ".join(key_columns + [quote_ident(column) for column in columns])
+        width = len(key_columns)
+        current = {}
+        for condition, params in key_sets(key_columns, rows):
+            for row in self.conn.execute(f"SELECT {select} FROM {quote_ident(table)} WHERE {condition}", params):
+                key = tuple(row[:width])
+                if key in rows:
+                    values = dict(zip(columns, row[width:]))
+                    current[key] = {column: values[column] for column in rows[key]}
+        return current
+
+    def _update(self, table, rows):
+        by_column = collections.defaultdict(list)
+        for key, columns in rows.items():
+            for column, value in columns.items():
+                by_column[column].append((value, *key))
+        predicate = self.key_predicate(table)
+        changed = 0
+        for column, params in by_column.items():
+            cursor = self.conn.executemany(f"UPDATE {quote_ident(table)} SET {quote_ident(column)} = ? "
+                                           f"WHERE {predicate}", params)
+            changed += cursor.rowcount
+        return changed
+
+    def _delete(self, table, keys):
+        deleted = 0
+        for condition, params in key_sets(self._key_columns(table), keys):
+            deleted += self.conn.execute(f"DELETE FROM {quote_ident(table)} WHERE {condition}", params).rowcount
+        return deleted
+
+    def add_column(self, table, name, dtype):
+        with self.conn:
+            self.conn.execute(f"ALTER TABLE {quote_ident(table)} ADD COLUMN {quote_ident(name)} {dtype}")
+        self.journal.clear()
+
+    def create_table(self, name, columns):
+        with self.conn:
+            self.conn.execute(f"CREATE TABLE {quote_ident(name)} ({columns})")
+        self.journal.clear()
+
+    def drop_table(self, table):
+        with self.conn:
+            self.conn.execute(f"DROP TABLE {quote_ident(table)}")
+        self.journal.clear()
+
+    def transform_column(self, table, column, value=None, expression=None, where=None, **options):
+        return ColumnTransform(self.conn, table, column, value, expression, where, catalog=self.catalog, **options)
+
+    def resume_transform(self, job_id, **options):
+        return ColumnTransform.resume(self.conn, job_id, catalog=self.catalog, **options)
+
+    def rename_column(self, table, column, new_name, **options):
+        return ColumnChange(self.conn, table, column, new_name, catalog=self.catalog, **options)
+
+    def drop_column(self, table, column, **options):
+        return ColumnChange(self.conn, table, column, catalog=self.catalog, **options)
+
+    def profile_table(self, table, **options):
+        path = database_path(self.conn)
+        if not path:
+            raise ValueError("Profiling uses read-only worker connections and needs a database file")
+        return TableProfiler(path, table, **options)
+
+    def import_file(self, path, table, progress=None, cancelled=None, **options):
+        return BulkImporter(self.conn, path, table, **options).run(progress, cancelled)
+
+    def export(self, path, table=None, sql=None, params=(), progress=None, cancelled=None, **options):
+        if table:
+            exporter = StreamingExporter.for_table(self.conn, table, **options)
+        else:
+            exporter = StreamingExporter(self.conn, sql, params, **options)
+        return exporter.run(path, progress, cancelled)
+
+    def backup(self, target, progress=None, cancelled=None, pages=None, sleep=None):
+        self.conn.commit()
+        return OnlineBackup(database_path(self.conn), target, pages, sleep).run(progress, cancelled)
+
+
+AUTH_DB = "user_auth.db"
+PERMISSION_LEVELS = {"Closed": 0, "Read-only": 1, "Write": 2, "Full write": 3}
+ACTION_LEVELS = {"open": 1, "write": 2, "schema": 3}
+
+
+def database_key(path):
+    return os.path.normcase(os.path.abspath(path)) if path and path != ":memory:" else ""
+
+
+class PermissionManager:
+    # One login session: the user's default permission plus per-database overrides, loaded once so
+    # checks on every action are dictionary lookups instead of queries against the auth database.
+    def __init__(self, current_user, current_role, default_permission="Read-only", permissions=None):
+        self.user = current_user
+        self.role = current_role
+        self.default = default_permission
+        self.permissions = {database_key(path): permission for path, permission in (permissions or {}).items()}
+        self._resolved = {}
+
+    def permission(self, database):
+        cached = self._resolved.get(database)
+        if cached is None:
+            cached = self._resolved[database] = self.permissions.get(database_key(database), self.default)
+        return cached
+
+    def update(self, database, permission):
+        self.permissions[database_key(database)] = permission
+        self._resolved.clear()
+
+    def allows(self, database, action):
+        if self.role == "admin":
+            return True
+        return PERMISSION_LEVELS.get(self.permission(database), 0) >= ACTION_LEVELS[action]
+
+    def can_change_permissions(self, database):
+        return self.role == "admin" or self.permission(database) == "Full write"
+
+    def has_write_access(self, database):
+        return self.allows(database, "write")
+
+    def has_read_access(self, database):
+        return self.allows(database, "open")
+
+    def is_blocked(self, database):
+        return not self.allows(database, "open")
+
+
+class AuthService:
+    SCHEMA_VERSION = 1
+    ITERATIONS = 200000
+    SCHEME = "pbkdf2_sha256"
+    DEFAULT_ADMIN = ("admin", "admin123", "admin", "Full write")
+
+    def __init__(self, path=None, iterations=None):
+        self.path = path or AUTH_DB
+        self.iterations = iterations or self.ITERATIONS
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            self._migrate()
+
+    def close(self):
+        self.conn.close()
+
+    def _migrate(self):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another instance may have migrated while this one waited for the write lock.
+            if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                conn.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, "
+                             "password TEXT, role TEXT, permission TEXT)")
+                conn.execute("CREATE TABLE IF NOT EXISTS database_permissions (username TEXT NOT NULL, "
+                             "database TEXT NOT NULL, permission TEXT NOT NULL, PRIMARY KEY (username, database))")
+                username, password, role, permission = self.DEFAULT_ADMIN
+                if not conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+                    conn.execute("INSERT INTO users (username, password, role, permission) VALUES (?, ?, ?, ?)",
+                                 (username, self.hash_password(password), role, permission))
+                # Existing rows stored plaintext passwords; replace them so none stay on disk.
+                for user_id, stored in conn.execute("SELECT id, password FROM users").fetchall():
+                    if not (stored or "").startswith(self.SCHEME + "$"):
+                        conn.execute("UPDATE users SET password = ? WHERE id = ?",
+                                     (self.hash_password(stored or ""), user_id))
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def hash_password(self, password, salt=None, iterations=None):
+        salt = salt or secrets.token_bytes(16)
+        iterations = iterations or self.iterations
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+        return f"{self.SCHEME}${iterations}${salt.hex()}${digest.hex()}"
+
+    def verify_password(self, stored, password):
+        # Returns (matches, needs_rehash); rows written before hashing, or with a lower cost, need a rehash.
+        stored = str(stored or "")
+        if not stored.startswith(self.SCHEME + "$"):
+            return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")), True
+        try:
+            scheme, iterations, salt, digest = stored.split("$")
+            iterations = int(iterations)
+            salt = bytes.fromhex(salt)
+        except ValueError:
+            return False, False
+        candidate = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+        return hmac.compare_digest(candidate.hex(), digest), iterations < self.iterations
+
+    def login(self, username, password):
+        row = self.conn.execute("SELECT password, role, permission FROM users WHERE username = ?",
+                                (username,)).fetchone()
+        if row is None:
+            # Same cost as a real check, so response time does not reveal which usernames exist.
+            self.hash_password(password)
+            return None
+        stored, role, permission = row
+        matches, rehash = self.verify_password(stored, password)
+        if not matches:
+            return None
+        if rehash:
+            self.conn.execute("UPDATE users SET password = ? WHERE username = ?",
+                              (self.hash_password(password), username))
+        permissions = dict(self.conn.execute("SELECT database, permission FROM database_permissions "
+                                             "WHERE username = ?", (username,)).fetchall())
+        return PermissionManager(username, role, permission or "Read-only", permissions)
+
+    def add_user(self, username, password, role="user", permission="Read-only"):
+        if permission not in PERMISSION_LEVELS:
+            raise ValueError(f"Unknown permission '{permission}'")
+        self.conn.execute("INSERT INTO users (username, password, role, permission) VALUES (?, ?, ?, ?)",
+                          (username, self.hash_password(password), role, permission))
+
+    def set_password(self, username, password):
+        self.conn.execute("UPDATE users SET password = ? WHERE username = ?", (self.hash_password(password), username))
+
+    def set_permission(self, username, database, permission):
+        if permission not in PERMISSION_LEVELS:
+            raise ValueError(f"Unknown permission '{permission}'")
+        if not self.conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone():
+            raise ValueError(f"No user '{username}'")
+        self.conn.execute("INSERT OR REPLACE INTO database_permissions (username, database, permission) "
+                          "VALUES (?, ?, ?)", (username, database_key(database), permission))
+
+
+SCHEMA_ACTIONS = {getattr(sqlite3, name) for name in (
+    "SQLITE_CREATE_INDEX", "SQLITE_CREATE_TABLE", "SQLITE_CREATE_TRIGGER", "SQLITE_CREATE_VIEW",
+    "SQLITE_CREATE_VTABLE", "SQLITE_DROP_INDEX", "SQLITE_DROP_TABLE", "SQLITE_DROP_TRIGGER", "SQLITE_DROP_VIEW",
+    "SQLITE_DROP_VTABLE", "SQLITE_ALTER_TABLE") if hasattr(sqlite3, name)}
+
+
+# ATTACH would let a restricted session reach files its permissions do not cover.
+ATTACH_ACTIONS = {sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH}
+
+
+# With writable_schema on, DML on the schema table creates or rewrites objects without any CREATE or DROP.
+# UPDATE is left to the pragma check: SQLite itself reports UPDATEs of sqlite_master when it sets up
+# table-valued functions such as json_each, and without writable_schema it refuses user UPDATEs anyway.
+# Temp objects stay allowed: creating one is itself an INSERT into sqlite_temp_master.
+SCHEMA_TABLES = {"sqlite_master", "sqlite_schema"}
+SCHEMA_WRITES = {sqlite3.SQLITE_INSERT, sqlite3.SQLITE_DELETE}
+
+
+def deny_schema_changes(action, arg1, arg2, database, source):
+    if action in SCHEMA_ACTIONS or action in ATTACH_ACTIONS:
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_PRAGMA and (arg1 or "").lower() == "writable_schema":
+        return sqlite3.SQLITE_DENY
+    if action in SCHEMA_WRITES and (arg1 or "").lower() in SCHEMA_TABLES:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+def deny_attach(action, arg1, arg2, database, source):
+    return sqlite3.SQLITE_DENY if action in ATTACH_ACTIONS else sqlite3.SQLITE_OK
+
+
+def run_cli(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="engine.py", description="OpenDoc SQL command line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export a table or query result")
+    export.add_argument("database")
+    source = export.add_mutually_exclusive_group(required=True)
+    source.add_argument("--table")
+    source.add_argument("--sql")
+    export.add_argument("-o", "--output", required=True)
+    export.add_argument("--format", choices=sorted(set(StreamingExporter.FORMATS.values())))
+    export.add_argument("--gzip", action="store_true", default=None)
+    export.add_argument("--batch-size", type=int)
+    export.add_argument("--profile", choices=["Read-only", "Archive"], default="Read-only",
+                        help="Archive also skips locking; only use it for files nothing else writes")
+    args = parser.parse_args(argv)
+
+    try:
+        engine = DatabaseEngine(args.database, settings=open_settings(args.profile))
+        try:
+            summary = engine.export(args.output, table=args.table, sql=args.sql, fmt=args.format,
+                                    compress=args.gzip, batch_size=args.batch_size)
+        finally:
+            engine.close()
+    except (sqlite3.Error, ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {summary['rows']} rows to {summary['path']} in {summary['seconds']:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_cli(sys.argv[1:]))
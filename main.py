@@ -1,13 +1,36 @@
+import time
+
+# Cold start is measured from here, before the heavier imports below.
+STARTED = time.perf_counter()
+STARTUP_BUDGET = 1.0
+
 import sqlite3
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox, filedialog
 from tkinter.scrolledtext import ScrolledText
-import re
+import threading
+import queue
+import os
+import sys
+
+from engine import (DatabaseEngine, TableSource, ListSource, SearchIndex, ColumnTransform, BulkImporter,
+                    OnlineBackup, QueryProfiler, RecentFiles, ScriptRunner, AuthService, OPEN_PROFILES,
+                    PERMISSION_LEVELS, ACTION_LEVELS, rows_to_tsv, tsv_to_rows, sqlite_order, database_path,
+                    open_settings, connect_database, connect_readonly, tokenize_sql_line, explain_plan,
+                    plan_warnings, suggest_indexes, run_cli)
+
+def report_startup(label, started):
+    seconds = time.perf_counter() - started
+    if seconds > STARTUP_BUDGET:
+        print(f"{label} took {seconds:.2f}s, over the {STARTUP_BUDGET:.1f}s startup budget", file=sys.stderr)
+    return seconds
+
 
 class LoginWindow:
     def __init__(self, root, on_login):
         self.root = root
         self.on_login = on_login
+        self.auth = None
         self.frame = tk.Frame(root)
         self.frame.pack(padx=20, pady=20)
 
@@ -24,33 +47,18 @@ class LoginWindow:
     def try_login(self):
         username = self.username_entry.get()
         password = self.password_entry.get()
+        try:
+            # Opened on the first attempt rather than with the window, which keeps the login screen fast.
+            if self.auth is None:
+                self.auth = AuthService()
+            session = self.auth.login(username, password)
+        except sqlite3.Error as e:
+            messagebox.showerror("Login Failed", f"Cannot read the user database: {e}")
+            return
 
-        conn = sqlite3.connect("user_auth.db")
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                username TEXT UNIQUE,
-                password TEXT,
-                role TEXT,
-                permission TEXT
-            )
-        """)
-        conn.commit()
-        c.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-        if c.fetchone()[0] == 0:
-            c.execute("INSERT INTO users (username, password, role, permission) VALUES (?, ?, ?, ?)",
-                      ("admin", "admin123", "admin", "Full write"))
-            conn.commit()
-
-        c.execute("SELECT role, permission FROM users WHERE username = ? AND password = ?", (username, password))
-        result = c.fetchone()
-        conn.close()
-
-        if result:
-            role, permission = result
+        if session:
             self.frame.destroy()
-            self.on_login(username, role, permission)
+            self.on_login(session, self.auth)
         else:
             messagebox.showerror("Login Failed", "Invalid username or password")
 
@@ -66,45 +74,651 @@ class DatabaseTemplates:
         cursor.execute("CREATE TABLE IF NOT EXISTS Warehouse (id INTEGER PRIMARY KEY, item TEXT, stock INTEGER, price REAL)")
         cursor.execute("CREATE TABLE IF NOT EXISTS Shop (id INTEGER PRIMARY KEY, item TEXT, customer TEXT, price REAL)")
 
-class PermissionManager:
-    def __init__(self, current_user, current_role):
-        self.user = current_user
-        self.role = current_role
+class BackgroundTask:
+    POLL_MS = 50
 
-    def can_change_permissions(self, db_permission):
-        return self.role == "admin" or db_permission == "Full write"
+    def __init__(self, root, work, on_message=None, on_done=None, on_error=None):
+        self.root = root
+        self.work = work
+        self.on_message = on_message
+        self.on_done = on_done
+        self.on_error = on_error
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.root.after(self.POLL_MS, self._poll)
+        return self
+
+    def post(self, kind, payload=None):
+        self.queue.put((kind, payload))
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _run(self):
+        try:
+            result = self.work(self)
+        except Exception as e:
+            self.queue.put(("__error__", e))
+        else:
+            self.queue.put(("__done__", result))
+
+    def _poll(self):
+        try:
+            while True:
+                kind, payload = self.queue.get_nowait()
+                if kind == "__done__":
+                    self.finished = True
+                    if self.on_done:
+                        self.on_done(payload)
+                elif kind == "__error__":
+                    self.finished = True
+                    if self.on_error:
+                        self.on_error(payload)
+                    else:
+                        messagebox.showerror("Error", str(payload))
+                elif self.on_message:
+                    self.on_message(kind, payload)
+        except queue.Empty:
+            pass
+        if not self.finished:
+            self.root.after(self.POLL_MS, self._poll)
+
+
+class QueryTask(BackgroundTask):
+    RESULT_ROW_LIMIT = 200000
+    RESULT_TAB_LIMIT = 20
+    PROGRESS_STEPS = 10000
+
+    def __init__(self, root, db_path, sql, profiler=None, settings=None, **callbacks):
+        super().__init__(root, self.execute, **callbacks)
+        self.db_path = db_path
+        self.sql = sql
+        self.profiler = profiler
+        self.settings = settings
+        self.conn = None
+        self.steps = 0
+        self.last_tick = 0.0
+        self.answered = threading.Event()
+        self.commit_answer = False
+
+    def cancel(self):
+        super().cancel()
+        conn = self.conn
+        if conn is not None:
+            conn.interrupt()
+
+    def answer(self, commit):
+        self.commit_answer = commit
+        self.answered.set()
+
+    def _progress(self):
+        self.steps += self.PROGRESS_STEPS
+        now = time.monotonic()
+        if now - self.last_tick > 0.1:
+            self.last_tick = now
+            self.post("progress", self.steps)
+        return 1 if self.cancelled.is_set() else 0
+
+    def execute(self, task):
+        conn = connect_database(self.db_path, self.settings, self.profiler)
+        self.conn = conn
+        conn.set_progress_handler(self._progress, self.PROGRESS_STEPS)
+        runner = ScriptRunner(conn, self.sql, self.RESULT_ROW_LIMIT, self.RESULT_TAB_LIMIT)
+        try:
+            summary = runner.run(self.post, self.cancelled.is_set)
+            commit = summary["failed"] is None
+            if summary["pending"] and summary["failed"]:
+                # The statements before the failure are still uncommitted; the GUI thread decides.
+                self.post("confirm", summary)
+                self.answered.wait()
+                commit = self.commit_answer
+            runner.finish(commit)
+            summary["committed"] = commit or not runner.transactional
+            return summary
+        except BaseException:
+            runner.finish(False)
+            raise
+        finally:
+            self.conn = None
+            conn.close()
+
+
+class VirtualGrid:
+    PREFETCH = 40
+    ROW_HEIGHT = 20
+    HEADER_HEIGHT = 25
+
+    def __init__(self, tree, scrollbar, status=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.status = status
+        self.source = None
+        self.buffer = []
+        self.offset = 0
+        self.position = 0
+        self.visible = 25
+        self.at_start = True
+        self.at_end = True
+        self.total = None
+        self.item_keys = {}
+        self.selected = set()
+        self.pending = {}
+        self._rendering = False
+
+        tree.tag_configure("dirty", background="#fff2b3")
+        scrollbar.configure(command=self.on_scrollbar)
+        tree.bind("<Configure>", self.on_resize)
+        tree.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        tree.bind("<Button-5>", lambda e: self.scroll(3))
+        tree.bind("<Prior>", lambda e: self.scroll(-self.visible) or "break")
+        tree.bind("<Next>", lambda e: self.scroll(self.visible) or "break")
+        tree.bind("<Control-Home>", lambda e: self.jump(0.0) or "break")
+        tree.bind("<Control-End>", lambda e: self.jump(1.0) or "break")
+        tree.bind("<Up>", lambda e: self.on_arrow(-1))
+        tree.bind("<Down>", lambda e: self.on_arrow(1))
+        tree.bind("<<TreeviewSelect>>", self.on_select, add="+")
+
+    def set_source(self, source):
+        self.source = source
+        self.selected = set()
+        self.tree["columns"] = source.columns
+        for col in source.columns:
+            self.tree.heading(col, text=col)
+        self.total = source.estimate()
+        self._load(source.first(self.visible + self.PREFETCH), 0, at_start=True)
+
+    def source_grew(self):
+        self.total = self.source.estimate()
+        if not self.buffer:
+            self._load(self.source.first(self.visible + self.PREFETCH), 0, at_start=True)
+        elif self.at_end:
+            self.at_end = False
+            self.scroll(0)
+        else:
+            self._update_scrollbar()
+
+    def clear(self):
+        self.source = None
+        self.buffer = []
+        self.item_keys = {}
+        self.selected = set()
+        self.tree.delete(*self.tree.get_children())
+        self.scrollbar.set(0.0, 1.0)
+        if self.status is not None:
+            self.status.config(text="")
+
+    def refresh(self):
+        if not self.source:
+            return
+        self.total = self.source.estimate()
+        if not self.buffer or (self.at_start and self.offset == 0):
+            self._load(self.source.first(self.visible + self.PREFETCH), 0, at_start=True)
+            return
+        anchor = self.buffer[self.offset][0] if self.offset < len(self.buffer) else self.buffer[0][0]
+        position = self.position + self.offset
+        rows = self.source.after(anchor, self.visible + self.PREFETCH, inclusive=True)
+        self._load(rows, position, at_start=self.at_start and self.offset == 0)
+
+    def _load(self, rows, position, at_start=False):
+        self.buffer = rows
+        self.offset = 0
+        self.position = position
+        self.at_start = at_start
+        self.at_end = len(rows) < self.visible + self.PREFETCH
+        if self.at_end and self.total is not None:
+            self.total = max(self.total, position + len(rows))
+        self._render()
+
+    def scroll(self, delta):
+        if not self.source or not self.buffer:
+            return
+        target = self.offset + delta
+        if target < 0 and not self.at_start:
+            wanted = -target + self.PREFETCH
+            rows = self.source.before(self.buffer[0][0], wanted)
+            self.buffer[:0] = rows
+            self.offset += len(rows)
+            target += len(rows)
+            self.position -= len(rows)
+            if len(rows) < wanted:
+                self.at_start = True
+                self.position = 0
+        if target + self.visible > len(self.buffer) and not self.at_end:
+            wanted = target + self.visible - len(self.buffer) + self.PREFETCH
+            rows = self.source.after(self.buffer[-1][0], wanted)
+            self.buffer.extend(rows)
+            if len(rows) < wanted:
+                self.at_end = True
+        self.offset = max(0, min(target, len(self.buffer) - self.visible))
+        self._trim()
+        self._render()
+
+    def jump(self, fraction):
+        if not self.source:
+            return
+        fraction = min(max(fraction, 0.0), 1.0)
+        count = self.visible + self.PREFETCH
+        if fraction >= 1.0:
+            rows = self.source.last(count)
+            total = self.total if self.total is not None else len(rows)
+            self._load(rows, max(0, total - len(rows)), at_start=len(rows) < count)
+            self.at_end = True
+            self.offset = max(0, len(self.buffer) - self.visible)
+            self._render()
+        elif fraction <= 0.0:
+            self._load(self.source.first(count), 0, at_start=True)
+        else:
+            position = int(fraction * (self.total or 0))
+            self._load(self.source.seek(fraction, count), position)
 
-    def has_write_access(self, db_permission):
-        return db_permission in ["Write", "Full write"]
+    def goto(self, sort_key):
+        if not self.source:
+            return
+        rows = self.source.after(sort_key, self.visible + self.PREFETCH, inclusive=True)
+        total = self.total or 0
+        position = self.position + self.offset
+        if self.source.has_rowid and not self.source.order_by and total:
+            low, high = self.source.rowid_bounds()
+            if high and high > low:
+                position = int((sort_key[-1] - low) / (high - low) * total)
+        self._load(rows, position, at_start=False)
+
+    def staged(self):
+        if not isinstance(self.source, TableSource):
+            return {}
+        return self.pending.get(self.source.table, {})
+
+    def stage(self, key, column, value):
+        self.pending.setdefault(self.source.table, {}).setdefault(tuple(key), {})[column] = value
+        self._render()
+
+    def pending_count(self):
+        return sum(len(columns) for rows in self.pending.values() for columns in rows.values())
+
+    def discard(self, table=None, keys=None):
+        if table is None:
+            self.pending.clear()
+        elif keys is None:
+            self.pending.pop(table, None)
+        else:
+            rows = self.pending.get(table, {})
+            for key in keys:
+                rows.pop(tuple(key), None)
+            if not rows:
+                self.pending.pop(table, None)
+        if self.source:
+            self._render()
+
+    def reload_rows(self, keys):
+        if not isinstance(self.source, TableSource):
+            return
+        keys = set(map(tuple, keys))
+        buffered = [self.source.row_key(sort_key) for sort_key, values in self.buffer]
+        rows = self.source.fetch([key for key in buffered if key in keys])
+        for index, key in enumerate(buffered):
+            if key in rows:
+                self.buffer[index] = rows[key]
+        self._render()
+
+    def _trim(self):
+        low = self.offset - self.PREFETCH
+        if low > 0:
+            del self.buffer[:low]
+            self.offset -= low
+            self.position += low
+            self.at_start = False
+        high = self.offset + self.visible + self.PREFETCH
+        if len(self.buffer) > high:
+            del self.buffer[high:]
+            self.at_end = False
+
+    def _render(self):
+        self._rendering = True
+        try:
+            self.tree.delete(*self.tree.get_children())
+            self.item_keys = {}
+            reselect = []
+            staged = self.staged()
+            for index, (sort_key, values) in enumerate(self.buffer[self.offset:self.offset + self.visible]):
+                iid = str(index)
+                self.item_keys[iid] = sort_key
+                edits = staged.get(self.source.row_key(sort_key)) if staged else None
+                if edits:
+                    values = [edits.get(column, value) for column, value in zip(self.source.columns, values)]
+                self.tree.insert("", "end", iid=iid, values=values, tags=("dirty",) if edits else ())
+                if sort_key in self.selected:
+                    reselect.append(iid)
+            self.tree.selection_set(reselect)
+        finally:
+            self._rendering = False
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        first_row = self.position + self.offset
+        shown = min(self.visible, len(self.buffer) - self.offset)
+        total = self.total
+        if total is None or total < first_row + shown:
+            total = first_row + shown + (0 if self.at_end else self.visible)
+        if total <= 0:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(first_row / total, (first_row + shown) / total)
+        if self.status is not None:
+            name = getattr(self.source, "table", "")
+            if self.total is None:
+                count = f"{total:,}+" if not self.at_end else f"{total:,}"
+            else:
+                count = f"~{self.total:,}"
+            text = f"{name}  rows {first_row + 1 if shown else 0:,}-{first_row + shown:,} of {count}"
+            if getattr(self.source, "where", None):
+                text += "  (filtered)"
+            pending = self.pending_count()
+            if pending:
+                text += f"  {pending:,} pending edit(s)"
+            self.status.config(text=text)
+
+    def on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.jump(float(args[0]))
+        elif action == "scroll":
+            amount = int(args[0])
+            self.scroll(amount * self.visible if args[1] == "pages" else amount)
+
+    def on_resize(self, event):
+        visible = max(1, (event.height - self.HEADER_HEIGHT) // self.row_height())
+        if visible != self.visible:
+            self.visible = visible
+            if self.source:
+                self.scroll(0)
+
+    def row_height(self):
+        try:
+            height = ttk.Style().lookup("Treeview", "rowheight")
+            return int(height) if height else self.ROW_HEIGHT
+        except (tk.TclError, ValueError):
+            return self.ROW_HEIGHT
+
+    def on_arrow(self, step):
+        focus = self.tree.focus()
+        children = self.tree.get_children()
+        if not children:
+            return None
+        edge = children[0] if step < 0 else children[-1]
+        if focus == edge:
+            self.scroll(step)
+            self.tree.focus(edge)
+            self.tree.selection_set(edge)
+            return "break"
+        return None
+
+    def on_select(self, event=None):
+        if self._rendering:
+            return
+        visible = set(self.item_keys.values())
+        chosen = {self.item_keys[iid] for iid in self.tree.selection() if iid in self.item_keys}
+        self.selected = (self.selected - visible) | chosen
+
+    def selected_keys(self):
+        return [self.source.row_key(sort_key) for sort_key in self.selected]
+
+    def key_for(self, iid):
+        sort_key = self.item_keys.get(iid)
+        return None if sort_key is None else self.source.row_key(sort_key)
+
+
+class SQLHighlighter:
+    DELAY_MS = 150
+    TAGS = {
+        "keyword": {"foreground": "blue", "font": ("Consolas", 10, "bold")},
+        "type": {"foreground": "green"},
+        "control": {"foreground": "orange"},
+        "string": {"foreground": "#a31515"},
+        "identifier": {"foreground": "#795e26"},
+        "number": {"foreground": "#098658"},
+        "comment": {"foreground": "gray"},
+    }
+
+    def __init__(self, text):
+        self.text = text
+        self.lines = []
+        self.states = []
+        self.pending = None
+        for tag, options in self.TAGS.items():
+            text.tag_config(tag, **options)
+        text.bind("<<Modified>>", self.on_modified, add="+")
+
+    def on_modified(self, event=None):
+        if not self.text.edit_modified():
+            return
+        self.text.edit_modified(False)
+        self.schedule()
+
+    def schedule(self):
+        if self.pending is not None:
+            self.text.after_cancel(self.pending)
+        self.pending = self.text.after(self.DELAY_MS, self.highlight)
+
+    def highlight(self):
+        self.pending = None
+        lines = self.text.get("1.0", "end-1c").split("\n")
+        old_lines, old_states = self.lines, self.states
+        limit = min(len(lines), len(old_lines))
+        start = 0
+        while start < limit and lines[start] == old_lines[start]:
+            start += 1
+        if start == len(lines) == len(old_lines):
+            return
+        tail = 0
+        while tail < limit - start and lines[-1 - tail] == old_lines[-1 - tail]:
+            tail += 1
+        new_end = len(lines) - tail
+        old_end = len(old_lines) - tail
+
+        states = old_states[:start]
+        state = states[-1] if states else None
+        index = start
+        while index < len(lines):
+            if index >= new_end:
+                old_index = old_end + (index - new_end)
+                old_entry = old_states[old_index - 1] if old_index > 0 else None
+                if state == old_entry:
+                    # Everything below is unchanged text entered in the same state.
+                    states.extend(old_states[old_index:])
+                    break
+            state = self._highlight_line(index, lines[index], state)
+            states.append(state)
+            index += 1
+        self.lines = lines
+        self.states = states
+
+    def _highlight_line(self, index, line, state):
+        row = index + 1
+        for tag in self.TAGS:
+            self.text.tag_remove(tag, f"{row}.0", f"{row}.end")
+        tokens, state = tokenize_sql_line(line, state)
+        for start, end, kind in tokens:
+            self.text.tag_add(kind, f"{row}.{start}", f"{row}.{end}")
+        return state
+
+
+class ProfilerWindow:
+    def __init__(self, editor):
+        self.editor = editor
+        self.profiler = editor.profiler
+        self.window = tk.Toplevel(editor.root)
+        self.window.title("Query Profiler")
+        self.items = {}
+
+        toolbar = tk.Frame(self.window)
+        toolbar.pack(fill=tk.X)
+        tk.Button(toolbar, text="Refresh", command=self.refresh).pack(side=tk.LEFT)
+        self.threshold_label = tk.Label(toolbar, anchor="w")
+        self.threshold_label.pack(side=tk.LEFT, padx=10)
+
+        pane = tk.PanedWindow(self.window, orient=tk.VERTICAL)
+        pane.pack(fill=tk.BOTH, expand=True)
+        notebook = ttk.Notebook(pane)
+        self.recent = self._statement_tree(notebook, ("ms", "rows", "steps", "sql"))
+        notebook.add(self.recent.master, text="Recent statements")
+        self.slow = self._statement_tree(notebook, ("time", "ms", "rows", "sql"))
+        notebook.add(self.slow.master, text="Slow query log")
+        pane.add(notebook, height=250)
+
+        details = tk.Frame(pane)
+        self.plan = ttk.Treeview(details, columns=("warning",), height=6)
+        self.plan.heading("#0", text="Query plan")
+        self.plan.heading("warning", text="Warning")
+        self.plan.tag_configure("warning", foreground="red")
+        self.plan.pack(fill=tk.BOTH, expand=True)
+        tk.Label(details, text="Suggested indexes:", anchor="w").pack(fill=tk.X)
+        self.suggestions = tk.Text(details, height=4)
+        self.suggestions.pack(fill=tk.X)
+        tk.Button(details, text="Copy to SQL Console", command=self.copy_suggestions).pack(anchor="e")
+        pane.add(details)
+        self.refresh()
+
+    def _statement_tree(self, parent, columns):
+        frame = tk.Frame(parent)
+        tree = ttk.Treeview(frame, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col.capitalize())
+            tree.column(col, width=400 if col == "sql" else 70, stretch=col == "sql")
+        scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        tree.bind("<<TreeviewSelect>>", lambda e: self.on_select(tree))
+        return tree
+
+    def refresh(self):
+        self.threshold_label.config(text=f"Slow query threshold: {self.profiler.threshold * 1000:.0f} ms")
+        self.items = {}
+        self.recent.delete(*self.recent.get_children())
+        for i, record in enumerate(reversed(self.profiler.recent())):
+            sql = record.expanded or record.sql
+            iid = f"r{i}"
+            self.items[iid] = sql
+            self.recent.insert("", "end", iid=iid, values=(
+                f"{record.seconds * 1000:.1f}", record.rows, record.steps, " ".join(sql.split())))
+        self.slow.delete(*self.slow.get_children())
+        for i, entry in enumerate(reversed(self.profiler.slow_log())):
+            iid = f"s{i}"
+            self.items[iid] = entry["sql"]
+            self.slow.insert("", "end", iid=iid, values=(
+                entry["time"], f"{entry['seconds'] * 1000:.1f}", entry["rows"], " ".join(entry["sql"].split())))
+
+    def on_select(self, tree):
+        sql = self.items.get(tree.focus())
+        self.plan.delete(*self.plan.get_children())
+        self.suggestions.delete("1.0", tk.END)
+        if not sql:
+            return
+        path = database_path(self.editor.conn)
+        try:
+            # A separate plain connection keeps EXPLAIN out of the profile.
+            conn = connect_readonly(path)
+            try:
+                plan = explain_plan(conn, sql)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            self.plan.insert("", "end", text=f"Cannot explain: {e}")
+            return
+        for node_id, parent, detail in plan:
+            warnings = plan_warnings(detail)
+            parent_iid = str(parent) if parent and self.plan.exists(str(parent)) else ""
+            self.plan.insert(parent_iid, "end", iid=str(node_id), text=detail, open=True,
+                             values=(", ".join(warnings),), tags=("warning",) if warnings else ())
+        suggestions = suggest_indexes(sql, plan, self.editor.catalog)
+        self.suggestions.insert("1.0", ";\n".join(suggestions) + (";" if suggestions else "No suggestions."))
+
+    def copy_suggestions(self):
+        text = self.suggestions.get("1.0", tk.END).strip()
+        if text and text != "No suggestions.":
+            self.editor.sql_entry.insert(tk.END, "\n" + text + "\n")
+
+
+class ProfileWindow:
+    SPARKS = "▁▂▃▄▅▆▇█"
+    COLUMNS = ("type", "nulls", "distinct", "min", "max", "mean", "top", "histogram")
+
+    def __init__(self, editor, profile):
+        self.editor = editor
+        self.table = profile["table"]
+        self.window = tk.Toplevel(editor.root)
+        self.window.title(f"Profile of {self.table}")
+
+        toolbar = tk.Frame(self.window)
+        toolbar.pack(fill=tk.X)
+        tk.Button(toolbar, text="Refresh", command=lambda: editor.profile_table(self.table, refresh=True)).pack(
+            side=tk.LEFT)
+        self.summary = tk.Label(toolbar, anchor="w")
+        self.summary.pack(side=tk.LEFT, padx=10)
+
+        frame = tk.Frame(self.window)
+        frame.pack(fill=tk.BOTH, expand=True)
+        self.tree = ttk.Treeview(frame, columns=self.COLUMNS)
+        self.tree.heading("#0", text="Column")
+        for col in self.COLUMNS:
+            self.tree.heading(col, text="Nulls %" if col == "nulls" else col.capitalize())
+            self.tree.column(col, width=220 if col == "top" else 150 if col == "histogram" else 90,
+                             stretch=col == "top")
+        scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scroll.set)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        self.show(profile)
+
+    def show(self, profile):
+        self.summary.config(text=f"{profile['rows']:,} rows profiled in {profile['seconds']:.2f}s "
+                                 f"with {profile['workers']} worker{'s' if profile['workers'] > 1 else ''}")
+        self.tree.delete(*self.tree.get_children())
+        rows = profile["rows"]
+        for entry in profile["columns"]:
+            top = ", ".join(f"{self.format(value)} ({count:,})" for value, count in entry["top"])
+            self.tree.insert("", "end", text=entry["column"], values=(
+                entry["type"], f"{entry['nulls'] / rows:.1%}" if rows else "", f"{entry['distinct']:,}",
+                self.format(entry["min"]), self.format(entry["max"]),
+                "" if entry["mean"] is None else f"{entry['mean']:.6g}", top, self.sparkline(entry["histogram"])))
+
+    def format(self, value):
+        if value is None:
+            return ""
+        if isinstance(value, bytes):
+            return f"x'{value[:8].hex()}{'...' if len(value) > 8 else ''}'"
+        text = str(value)
+        return text if len(text) <= 30 else text[:27] + "..."
 
-    def has_read_access(self, db_permission):
-        return db_permission in ["Read-only", "Write", "Full write"]
+    def sparkline(self, counts):
+        if not counts or not max(counts):
+            return ""
+        peak = max(counts)
+        return "".join(self.SPARKS[min(len(self.SPARKS) - 1, count * len(self.SPARKS) // peak)] if count else " "
+                       for count in counts)
 
-    def is_blocked(self, db_permission):
-        return db_permission == "Closed"
 
 class SQLEditor:
-    def __init__(self, root, username, role, permission):
+    def __init__(self, root, session, auth=None):
         self.root = root
         self.root.title("OpenDoc SQL")
-        self.conn = sqlite3.connect('example.db')
-        self.cursor = self.conn.cursor()
-        self.table_list = {}
-        self.username = username
-        self.role = role
-        self.permission = permission
-        self.perm_mgr = PermissionManager(username, role)
-        self.conn = None
-        self.cursor = None
-        self.setup_gui()
-
-        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-
-        tables = self.cursor.fetchall()
-
-        for table in tables:
-            self.table_list[table[0]] = None
-
+        self.username = session.user
+        self.role = session.role
+        self.permission = session.default
+        self.perm_mgr = session
+        self.auth = auth
+        self.profiler = QueryProfiler()
+        self.recent = RecentFiles()
+        try:
+            self.open_engine('example.db')
+        except (sqlite3.Error, PermissionError):
+            # Without access the default database cannot be opened or created; start on an empty in-memory one.
+            self.open_engine(':memory:')
 
         self.sort_column = None
         self.sort_ascending = True
@@ -117,18 +731,36 @@ class SQLEditor:
         file_menu = tk.Menu(menu_bar, tearoff=0)
         file_menu.add_command(label="New", accelerator="Ctrl+N", command=self.new_file)
         file_menu.add_command(label="Open", accelerator="Ctrl+O", command=self.open_file)
+        file_menu.add_command(label="Open With Profile...", command=lambda: self.open_file(choose_profile=True))
+        self.recent_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.update_recent_menu)
+        file_menu.add_cascade(label="Open Recent", menu=self.recent_menu)
         file_menu.add_command(label="Save", accelerator="Ctrl+S", command=self.save_file)
         file_menu.add_command(label="Save As", accelerator="Ctrl+Shift+S", command=self.save_file_as)
+        file_menu.add_command(label="Snapshot...", command=self.snapshot)
+        file_menu.add_command(label="Backup Settings...", command=self.backup_settings)
+        file_menu.add_separator()
+        file_menu.add_command(label="Import...", command=self.import_file)
+        file_menu.add_command(label="Import Settings...", command=self.import_settings)
+        file_menu.add_command(label="Export Table...", command=self.export_table)
+        file_menu.add_command(label="Export Query Result...", command=self.export_result)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.exit_app)
         menu_bar.add_cascade(label="File", menu=file_menu)
 
-        edit_menu = tk.Menu(menu_bar, tearoff=0)
-        edit_menu.add_command(label="Undo", accelerator="Ctrl+Z")
-        edit_menu.add_command(label="Redo", accelerator="Ctrl+Y")
+        edit_menu = tk.Menu(menu_bar, tearoff=0, postcommand=self.update_undo_menu)
+        edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
+        edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
+        self.edit_menu = edit_menu
+        edit_menu.add_separator()
+        self.buffer_edits = tk.BooleanVar(value=False)
+        edit_menu.add_checkbutton(label="Buffer Cell Edits", variable=self.buffer_edits)
+        edit_menu.add_command(label="Apply Pending Edits", command=self.apply_edits)
+        edit_menu.add_command(label="Discard Pending Edits", command=self.discard_edits)
+        edit_menu.add_separator()
         table_menu = tk.Menu(edit_menu, tearoff=0)
         table_menu.add_command(label="New Table", command=self.new_table)
         table_menu.add_command(label="Delete Table", command=self.delete_table)
+        table_menu.add_command(label="Profile Table", command=self.profile_table)
         column_menu = tk.Menu(table_menu, tearoff=0)
         column_menu.add_command(label="Add Column", command=self.add_column)
         column_menu.add_command(label="Delete Column", command=self.delete_column)
@@ -139,100 +771,212 @@ class SQLEditor:
         row_menu.add_command(label="Add Rows", command=self.add_rows)
         row_menu.add_command(label="Add Empty", command=self.add_empty_rows)
         row_menu.add_command(label="Delete Rows", command=self.delete_rows)
+        row_menu.add_separator()
+        row_menu.add_command(label="Copy Rows", accelerator="Ctrl+C", command=self.copy_rows)
+        row_menu.add_command(label="Copy Rows with Header", command=lambda: self.copy_rows(header=True))
+        row_menu.add_command(label="Copy Cells of Column", accelerator="Ctrl+Shift+C", command=self.copy_cells)
+        row_menu.add_command(label="Paste", accelerator="Ctrl+V", command=self.paste_rows)
         edit_menu.add_cascade(label="Rows", menu=row_menu)
+        search_menu = tk.Menu(edit_menu, tearoff=0)
+        search_menu.add_command(label="Find in Column...", accelerator="Ctrl+F", command=self.find_in_column)
+        search_menu.add_command(label="Index Table for Search...", command=self.create_search_index)
+        search_menu.add_command(label="Drop Search Index", command=self.drop_search_index)
+        edit_menu.add_cascade(label="Search", menu=search_menu)
         menu_bar.add_cascade(label="Edit", menu=edit_menu)
         edit_menu.add_command(label="Edit Column", command=self.edit_column)
 
+        tools_menu = tk.Menu(menu_bar, tearoff=0)
+        tools_menu.add_command(label="Query Profiler", command=self.show_profiler)
+        tools_menu.add_command(label="Slow Query Threshold...", command=self.set_slow_threshold)
+        tools_menu.add_command(label="Result Cache...", command=self.cache_settings)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Database Permissions...", command=self.database_permissions)
+        menu_bar.add_cascade(label="Tools", menu=tools_menu)
+
         self.root.config(menu=menu_bar)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit_app)
 
         self.root.bind_all("<Control-o>", lambda e: self.open_file())
         self.root.bind_all("<Control-s>", lambda e: self.save_file())
         self.root.bind_all("<Control-S>", lambda e: self.save_file_as())
         self.root.bind_all("<Control-n>", lambda e: self.new_file())
-        self.root.bind_all("<Control-z>", lambda e: None)
-        self.root.bind_all("<Control-y>", lambda e: None)
-        self.root.bind_all("<Delete>", lambda e: self.delete_rows)
+        self.root.bind_all("<Control-f>", lambda e: self.find_in_column())
+        self.root.bind_all("<Control-z>", self.undo)
+        self.root.bind_all("<Control-y>", self.redo)
+
+        self.status_bar = tk.Frame(self.root)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.task_status = tk.Label(self.status_bar, anchor="w")
+        self.task_status.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.task_cancel = tk.Button(self.status_bar, text="Cancel", command=self.cancel_task, state=tk.DISABLED)
+        self.task_cancel.pack(side=tk.RIGHT)
+        self.task_progress = ttk.Progressbar(self.status_bar, length=200, maximum=1.0)
+        self.task_progress.pack(side=tk.RIGHT, padx=5)
 
         self.main_pane = tk.PanedWindow(self.root, orient=tk.HORIZONTAL)
         self.main_pane.pack(fill=tk.BOTH, expand=True)
 
         self.tree_frame = tk.Frame(self.main_pane)
-        self.db_tree = ttk.Treeview(self.tree_frame)
+        self.db_tree = ttk.Treeview(self.tree_frame, columns=("info",))
+        self.db_tree.heading("#0", text="Table")
+        self.db_tree.heading("info", text="Rows / Type")
+        self.db_tree.column("#0", width=120)
+        self.db_tree.column("info", width=80)
         self.db_tree.pack(fill=tk.BOTH, expand=True)
         self.db_tree.bind('<<TreeviewSelect>>', self.on_table_select)
+        self.db_tree.bind('<<TreeviewOpen>>', self.on_tree_open)
         self.main_pane.add(self.tree_frame, width=200)
 
-        self.table_frame = tk.Frame(self.main_pane)
+        self.views = ttk.Notebook(self.main_pane)
+        self.views.bind("<<NotebookTabChanged>>", self.on_view_changed)
+        self.table_frame = tk.Frame(self.views)
+        self.grid_status = tk.Label(self.table_frame, anchor="w")
+        self.grid_status.pack(side=tk.BOTTOM, fill=tk.X)
+        self.table_scroll = ttk.Scrollbar(self.table_frame, orient=tk.VERTICAL)
+        self.table_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.table = ttk.Treeview(self.table_frame, show="headings")
         self.table.pack(fill=tk.BOTH, expand=True)
+        self.grid = VirtualGrid(self.table, self.table_scroll, self.grid_status)
         self.table.bind("<Button-1>", self.on_column_click)
         self.table.bind("<Double-1>", self.edit_cell)
-        self.main_pane.add(self.table_frame, width=800)
+        self.table.bind("<Delete>", lambda e: self.delete_rows())
+        self.table.bind("<Control-c>", self.copy_rows)
+        self.table.bind("<Control-C>", self.copy_cells)
+        self.table.bind("<Control-v>", self.paste_rows)
+        self.views.add(self.table_frame, text="Data")
+
+        self.messages_frame = tk.Frame(self.views)
+        columns = ("status", "rows", "changes", "ms", "sql")
+        self.messages = ttk.Treeview(self.messages_frame, columns=columns)
+        self.messages.heading("#0", text="#")
+        self.messages.column("#0", width=50, stretch=False)
+        for col in columns:
+            self.messages.heading(col, text=col.capitalize())
+            self.messages.column(col, width=400 if col == "sql" else 70, stretch=col == "sql")
+        self.messages.tag_configure("error", foreground="red")
+        messages_scroll = ttk.Scrollbar(self.messages_frame, orient=tk.VERTICAL, command=self.messages.yview)
+        self.messages.configure(yscrollcommand=messages_scroll.set)
+        messages_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.messages.pack(fill=tk.BOTH, expand=True)
+        self.messages.bind("<Double-1>", self.open_statement_result)
+        self.views.add(self.messages_frame, text="Messages")
+        self.result_tabs = {}
+        self.main_pane.add(self.views, width=800)
 
         self.right_frame = tk.Frame(self.main_pane)
         self.sql_entry = ScrolledText(self.right_frame, height=10, width=30, wrap=tk.WORD)
         self.sql_entry.pack(fill=tk.X)
-        self.sql_entry.bind("<KeyRelease>", self.syntax_highlight)
-        tk.Button(self.right_frame, text="Execute SQL", command=self.execute_sql).pack()
+        self.highlighter = SQLHighlighter(self.sql_entry)
+        button_row = tk.Frame(self.right_frame)
+        button_row.pack()
+        self.execute_button = tk.Button(button_row, text="Execute SQL", command=self.execute_sql)
+        self.execute_button.pack(side=tk.LEFT)
+        self.cancel_button = tk.Button(button_row, text="Cancel", command=self.cancel_sql, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT)
+        self.query_status = tk.Label(self.right_frame, anchor="w")
+        self.query_status.pack(fill=tk.X)
+
+        search_row = tk.Frame(self.right_frame)
+        search_row.pack(fill=tk.X, pady=(10, 0))
+        tk.Label(search_row, text="Search:").pack(side=tk.LEFT)
+        self.search_scope = ttk.Combobox(search_row, values=("All tables", "Current table"), width=12, state="readonly")
+        self.search_scope.current(0)
+        self.search_scope.pack(side=tk.RIGHT)
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(search_row, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        self.search_scope.bind("<<ComboboxSelected>>", lambda e: self.schedule_search())
+        self.search_results = ttk.Treeview(self.right_frame, columns=("table", "match"), show="headings", height=8)
+        self.search_results.heading("table", text="Table")
+        self.search_results.heading("match", text="Match")
+        self.search_results.column("table", width=80)
+        self.search_results.pack(fill=tk.BOTH, expand=True)
+        self.search_results.bind("<Double-1>", self.open_search_hit)
+        self.search_results.bind("<Return>", self.open_search_hit)
 
         self.main_pane.add(self.right_frame, width=300)
 
+    @property
+    def catalog(self):
+        return self.engine.catalog
+
     def load_db_structure(self):
+        catalog = self.catalog
+        catalog.refresh()
+        if getattr(self, 'tree_version', None) == (catalog, catalog.version):
+            return
+        self.tree_version = (catalog, catalog.version)
         self.db_tree.delete(*self.db_tree.get_children())
-        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        for table_name in self.cursor.fetchall():
-            self.db_tree.insert('', 'end', text=table_name[0], values=(table_name[0],))
+        for table_name in catalog.tables():
+            node = self.db_tree.insert('', 'end', text=table_name, values=("",))
+            self.db_tree.insert(node, 'end', text="...", tags=("placeholder",))
+
+    def on_tree_open(self, event):
+        node = self.db_tree.focus()
+        children = self.db_tree.get_children(node)
+        if len(children) != 1 or "placeholder" not in self.db_tree.item(children[0], "tags"):
+            return
+        self.db_tree.delete(children[0])
+        table = self.db_tree.item(node, "text")
+        estimate = self.catalog.row_estimate(table)
+        self.db_tree.set(node, "info", "?" if estimate is None else f"~{estimate:,}")
+
+        columns = self.db_tree.insert(node, 'end', text="Columns")
+        for col in self.catalog.columns(table):
+            info = (col.type or "ANY") + (" PK" if col.pk else "") + (" NOT NULL" if col.notnull else "")
+            self.db_tree.insert(columns, 'end', text=col.name, values=(info,))
+        indexes = self.catalog.indexes(table)
+        if indexes:
+            folder = self.db_tree.insert(node, 'end', text="Indexes")
+            for index in indexes:
+                info = ", ".join(map(str, index.columns)) + (" (unique)" if index.unique else "")
+                self.db_tree.insert(folder, 'end', text=index.name, values=(info,))
+        triggers = self.catalog.triggers(table)
+        if triggers:
+            folder = self.db_tree.insert(node, 'end', text="Triggers")
+            for trigger in triggers:
+                self.db_tree.insert(folder, 'end', text=trigger, values=("",))
 
     def on_table_select(self, event):
         selected = self.db_tree.focus()
+        if not selected:
+            return
+        while self.db_tree.parent(selected):
+            selected = self.db_tree.parent(selected)
         table_name = self.db_tree.item(selected)['text']
+        source = self.grid.source
+        if isinstance(source, TableSource) and source.table == table_name and selected != self.db_tree.focus():
+            return
         self.show_table_data(table_name)
 
     def show_table_data(self, table_name):
+        self.views.select(self.table_frame)
         self.current_table = table_name
-        self.cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [info[1] for info in self.cursor.fetchall()]
-        self.table.delete(*self.table.get_children())
-        self.table['columns'] = columns
-
-        for col in columns:
-            self.table.heading(col, text=col)
-
-        sql = f"SELECT * FROM {table_name}"
-        if hasattr(self, 'limit'):
-            sql += f" LIMIT {self.limit}"
-        self.cursor.execute(sql)
-        rows = self.cursor.fetchall()
-
-        for row in rows:
-            self.table.insert('', 'end', values=row)
+        self.sort_column = None
+        self.sort_ascending = True
+        self.grid.set_source(self.engine.table(table_name))
 
     def on_column_click(self, event):
         region = self.table.identify("region", event.x, event.y)
-        if region != "heading":
-            return
         column = self.table.identify_column(event.x)
+        if region == "cell" and column:
+            self.focus_column = self.table['columns'][int(column.replace("#", "")) - 1]
+        if region != "heading" or not isinstance(self.grid.source, TableSource):
+            return
         column_id = int(column.replace("#", "")) - 1
         column_name = self.table['columns'][column_id]
 
         self.sort_ascending = not self.sort_ascending if self.sort_column == column_name else True
         self.sort_column = column_name
 
-        order = 'ASC' if self.sort_ascending else 'DESC'
-        sql = f"SELECT * FROM {self.current_table} ORDER BY {column_name} {order}"
-        if hasattr(self, 'limit'):
-            sql += f" LIMIT {self.limit}"
-
-        self.cursor.execute(sql)
-        rows = self.cursor.fetchall()
-
-        self.table.delete(*self.table.get_children())
-        for row in rows:
-            self.table.insert('', 'end', values=row)
+        self.grid.set_source(self.engine.sort(self.current_table, column_name, self.sort_ascending))
 
     def edit_cell(self, event):
         region = self.table.identify("region", event.x, event.y)
-        if region != "cell":
+        if region != "cell" or not isinstance(self.grid.source, TableSource):
+            return
+        if not self.require("write"):
             return
         row_id = self.table.identify_row(event.y)
         col_id = self.table.identify_column(event.x)
@@ -241,30 +985,65 @@ class SQLEditor:
         old_value = self.table.item(row_id)['values'][col_index]
 
         new_value = simpledialog.askstring("Edit Cell", f"New value for {col_name}:", initialvalue=old_value)
-        if new_value is not None:
-            values = self.table.item(row_id)['values']
-            primary_key_col = self.table['columns'][0]
-            primary_key_val = values[0]
-            values[col_index] = new_value
-            try:
-                self.cursor.execute(f"UPDATE {self.current_table} SET {col_name} = ? WHERE {primary_key_col} = ?", (new_value, primary_key_val))
-                self.conn.commit()
-                self.show_table_data(self.current_table)
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+        if new_value is None:
+            return
+        key = self.grid.key_for(row_id)
+        if self.buffer_edits.get():
+            self.grid.stage(key, col_name, new_value)
+            return
+        try:
+            self.engine.update_cell(self.current_table, key, col_name, new_value)
+            self.grid.reload_rows([key])
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+
+    def apply_edits(self):
+        pending = self.grid.pending
+        if not pending:
+            return True
+        try:
+            self.engine.update_cells(pending)
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"Pending edits were not applied: {e}")
+            return False
+        source = self.grid.source
+        keys = list(pending.get(source.table, {})) if isinstance(source, TableSource) else []
+        pending.clear()
+        if keys:
+            self.grid.reload_rows(keys)
+        else:
+            self.grid.refresh()
+        return True
+
+    def discard_edits(self):
+        self.grid.discard()
+
+    def resolve_pending_edits(self):
+        grid = getattr(self, 'grid', None)
+        if grid is None or not grid.pending:
+            return True
+        answer = messagebox.askyesnocancel("Pending Edits",
+                                           f"Apply {grid.pending_count():,} pending cell edit(s) first?")
+        if answer is None:
+            return False
+        if answer:
+            return self.apply_edits()
+        grid.discard()
+        return True
+
+    def exit_app(self):
+        if self.resolve_pending_edits():
+            self.root.quit()
 
     def add_empty_rows(self):
         if not hasattr(self, 'current_table'):
             return
+        if not self.require("write"):
+            return
         try:
             n = simpledialog.askinteger("Add Empty Rows", "How many empty rows?")
             if n:
-                self.cursor.execute(f"PRAGMA table_info({self.current_table})")
-                columns = [info[1] for info in self.cursor.fetchall() if info[5] == 0]
-                placeholders = ','.join(['NULL'] * len(columns))
-                for _ in range(n):
-                    self.cursor.execute(f"INSERT INTO {self.current_table} ({','.join(columns)}) VALUES ({placeholders})")
-                self.conn.commit()
+                self.engine.insert_empty_rows(self.current_table, n)
                 self.show_table_data(self.current_table)
         except Exception as e:
             messagebox.showerror("Error", str(e))
@@ -272,72 +1051,512 @@ class SQLEditor:
     def add_column(self):
         if not hasattr(self, 'current_table'):
             return
+        if not self.require("schema"):
+            return
         name = simpledialog.askstring("Add Column", "Column name:")
         dtype = simpledialog.askstring("Add Column", "Data type:")
         if name and dtype:
             try:
-                self.cursor.execute(f"ALTER TABLE {self.current_table} ADD COLUMN {name} {dtype}")
-                self.conn.commit()
+                self.engine.add_column(self.current_table, name, dtype)
                 self.show_table_data(self.current_table)
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
     def delete_column(self):
-        messagebox.showinfo("Notice", "SQLite does not support deleting columns directly. Use SQL script manually.")
+        if not hasattr(self, 'current_table'):
+            return
+        if not self.require("schema"):
+            return
+        column = simpledialog.askstring("Delete Column", f"Column of {self.current_table} to delete:",
+                                        initialvalue=getattr(self, 'focus_column', None) or "")
+        if not column:
+            return
+        if messagebox.askyesno("Delete Column", f"Delete column {column} from {self.current_table}?"):
+            self._change_column(column, None)
 
     def rename_column(self):
-        messagebox.showinfo("Notice", "SQLite does not support renaming columns directly. Use SQL script manually.")
+        if not hasattr(self, 'current_table'):
+            return
+        if not self.require("schema"):
+            return
+        column = simpledialog.askstring("Rename Column", f"Column of {self.current_table} to rename:",
+                                        initialvalue=getattr(self, 'focus_column', None) or "")
+        if not column:
+            return
+        new_name = simpledialog.askstring("Rename Column", f"New name for {column}:")
+        if new_name and new_name != column:
+            self._change_column(column, new_name)
+
+    def _change_column(self, column, new_name):
+        table = self.current_table
+
+        def change_for(engine):
+            if new_name:
+                return engine.rename_column(table, column, new_name)
+            return engine.drop_column(table, column)
+
+        try:
+            # Validates the names here before the work moves to the background connection.
+            change_for(self.engine)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        db_path = self._background_path("Column changes")
+        if not db_path:
+            return
+        label = "Rename Column" if new_name else "Delete Column"
+
+        def work(engine, task):
+            def progress(rows, fraction):
+                task.post("progress", (fraction, f"rebuilding {table}, {rows:,} rows copied"))
+            return change_for(engine).run(progress, task.cancelled.is_set)
+
+        def done(summary):
+            self.grid.discard(table)
+            self._after_background_write()
+            self.show_table_data(table)
+            text = ""
+            if summary["method"] == "rebuild":
+                text = f"Rebuilt {table} ({summary['rows']:,} rows) in {summary['seconds']:.1f}s.\n"
+            if summary["skipped"]:
+                text += "Dropped because they used the column: " + ", ".join(summary["skipped"])
+            if text:
+                messagebox.showinfo(label, text.strip())
+
+        self.run_task(label, self._engine_worker(db_path, work), on_done=done)
 
     def execute_sql(self):
         sql = self.sql_entry.get("1.0", tk.END).strip()
-        try:
-            self.cursor.executescript(sql)
-            self.conn.commit()
-            self.load_db_structure()
-            if hasattr(self, 'current_table'):
+        if not sql or getattr(self, 'query_task', None):
+            return
+        path = self._background_path("Queries")
+        if not path:
+            return
+        self.clear_results()
+        self.query_started = time.monotonic()
+        self.query_task = QueryTask(self.root, path, sql, profiler=self.profiler, settings=self.engine.settings,
+                                    on_message=self.on_query_message, on_done=self.on_query_done,
+                                    on_error=self.on_query_error)
+        self.execute_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.query_status.config(text="Running...")
+        self.query_task.start()
+
+    def cancel_sql(self):
+        if getattr(self, 'query_task', None):
+            self.query_task.cancel()
+            self.query_status.config(text="Cancelling...")
+
+    def clear_results(self):
+        for frame, grid, source, sql in self.result_tabs.values():
+            self.views.forget(frame)
+            frame.destroy()
+        self.result_tabs = {}
+        self.messages.delete(*self.messages.get_children())
+
+    def add_result_tab(self, index, sql, columns):
+        frame = tk.Frame(self.views)
+        status = tk.Label(frame, anchor="w")
+        status.pack(side=tk.BOTTOM, fill=tk.X)
+        scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        tree = ttk.Treeview(frame, show="headings")
+        tree.pack(fill=tk.BOTH, expand=True)
+        grid = VirtualGrid(tree, scroll, status)
+        source = ListSource(columns, label=f"Result of statement {index + 1}")
+        grid.set_source(source)
+        self.result_tabs[index] = (frame, grid, source, sql)
+        self.views.add(frame, text=f"Result {len(self.result_tabs)}")
+        self.last_result_sql = sql
+
+    def on_view_changed(self, event=None):
+        selected = self.views.select()
+        for frame, grid, source, sql in self.result_tabs.values():
+            if str(frame) == selected:
+                self.last_result_sql = sql
+
+    def open_statement_result(self, event=None):
+        item = self.messages.focus()
+        if item and int(item) in self.result_tabs:
+            self.views.select(self.result_tabs[int(item)][0])
+
+    def on_query_message(self, kind, payload):
+        elapsed = time.monotonic() - self.query_started
+        if kind == "result":
+            self.add_result_tab(*payload)
+        elif kind == "rows":
+            index, batch = payload
+            frame, grid, source, sql = self.result_tabs[index]
+            source.extend(batch)
+            grid.source_grew()
+            self.query_status.config(text=f"Running statement {index + 1}... {len(source.rows):,} rows, {elapsed:.1f}s")
+        elif kind == "statement":
+            status = payload["error"] or "ok"
+            self.messages.insert("", "end", iid=str(payload["index"]), text=str(payload["index"] + 1), values=(
+                status, f"{payload['rows']:,}" if payload["columns"] else "", f"{payload['changes']:,}",
+                f"{payload['seconds'] * 1000:.1f}", " ".join(payload["sql"].split())),
+                tags=("error",) if payload["error"] else ())
+            self.query_status.config(text=f"Running... {payload['index'] + 1:,} statement(s), {elapsed:.1f}s")
+        elif kind == "progress":
+            self.query_status.config(text=f"Running... {payload:,} VM steps, {elapsed:.1f}s")
+        elif kind == "truncated":
+            index, rows = payload
+            if index in self.result_tabs:
+                frame = self.result_tabs[index][0]
+                self.views.tab(frame, text=self.views.tab(frame, "text") + f" (first {rows:,} rows)")
+        elif kind == "confirm":
+            failed = payload["failed"]
+            self.views.select(self.messages_frame)
+            self.query_task.answer(messagebox.askyesno(
+                "Script Failed", f"Statement {failed + 1} failed: {payload['error']}\n\n"
+                                 f"It was rolled back. Commit the {failed:,} statement(s) before it?\n"
+                                 f"(No rolls back the whole script.)"))
+
+    def _finish_query(self, text):
+        self.query_task = None
+        self.execute_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.query_status.config(text=text)
+
+    def on_query_done(self, summary):
+        elapsed = time.monotonic() - self.query_started
+        failed = summary["failed"]
+        if failed is None:
+            text = f"{summary['statements']:,} statement(s), {summary['changes']:,} change(s), {elapsed:.2f}s"
+            if self.result_tabs:
+                self.views.select(self.result_tabs[max(self.result_tabs)][0])
+        else:
+            error = summary["error"]
+            stopped = "cancelled" if str(error) == "interrupted" else "failed"
+            text = f"Statement {failed + 1} {stopped}; " + (
+                f"{failed:,} statement(s) before it committed" if summary["committed"] else "script rolled back")
+            self.views.select(self.messages_frame)
+        self._finish_query(text)
+        if summary["modified"] and summary["committed"]:
+            self._after_background_write()
+            if not self.result_tabs and hasattr(self, 'current_table'):
                 self.show_table_data(self.current_table)
-            messagebox.showinfo("Success", "SQL executed successfully.")
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
 
-    def syntax_highlight(self, event=None):
-        self.sql_entry.tag_remove("keyword", "1.0", tk.END)
-        self.sql_entry.tag_remove("type", "1.0", tk.END)
-        self.sql_entry.tag_remove("control", "1.0", tk.END)
+    def on_query_error(self, error):
+        if isinstance(error, sqlite3.OperationalError) and str(error) == "interrupted":
+            self._finish_query("Query cancelled")
+            return
+        self._finish_query("Query failed")
+        messagebox.showerror("Error", str(error))
+
+    def run_task(self, label, work, on_done=None):
+        if getattr(self, 'active_task', None):
+            messagebox.showwarning("Busy", "Another background task is still running.")
+            return None
+
+        def on_message(kind, payload):
+            if kind == "progress":
+                fraction, text = payload
+                if fraction is not None:
+                    self.task_progress["value"] = fraction
+                self.task_status.config(text=f"{label}: {text}")
+
+        def finish(text):
+            self.active_task = None
+            self.task_cancel.config(state=tk.DISABLED)
+            self.task_progress["value"] = 0
+            self.task_status.config(text=text)
+
+        def done(result):
+            finish(f"{label} finished")
+            if on_done:
+                on_done(result)
+
+        def failed(error):
+            if isinstance(error, sqlite3.OperationalError) and str(error) == "interrupted":
+                finish(f"{label} cancelled")
+                return
+            finish(f"{label} failed")
+            messagebox.showerror("Error", str(error))
+
+        self.task_status.config(text=f"{label}...")
+        self.task_cancel.config(state=tk.NORMAL)
+        self.active_task = BackgroundTask(self.root, work, on_message=on_message, on_done=done, on_error=failed)
+        return self.active_task.start()
+
+    def _background_path(self, jobs):
+        path = database_path(self.conn)
+        if not path:
+            messagebox.showerror("Error", f"{jobs} run on a background connection and need a database file.")
+            return None
+        # The background connection only sees what this one has committed.
+        self.conn.commit()
+        return path
 
-        content = self.sql_entry.get("1.0", tk.END)
+    def _engine_worker(self, db_path, job, settings=None):
+        # Wraps job(engine, task) for run_task with its own engine, closed however the job ends. The engine
+        # gets the session's settings unless told otherwise, so it enforces the same permission.
+        settings = dict(self.engine.settings if settings is None else settings)
 
-        keyword_pattern = r"\\b(SELECT|FROM|WHERE|INSERT|INTO|VALUES|UPDATE|SET|DELETE|CREATE|TABLE|DROP|ORDER|BY|ASC|DESC|LIMIT|PRIMARY|KEY)\\b"
-        type_pattern = r"\\b(INTEGER|TEXT|REAL|BLOB|NUMERIC)\\b"
-        control_pattern = r"\\b(IF|ELSE|BEGIN|END)\\b"
+        def work(task):
+            engine = DatabaseEngine(db_path, settings=settings)
+            try:
+                return job(engine, task)
+            finally:
+                engine.close()
+        return work
+
+    def _after_background_write(self):
+        # The write ran on another connection, so journalled inverses may no longer apply.
+        self.engine.journal.clear()
+        self.load_db_structure()
 
-        for match in re.finditer(keyword_pattern, content, re.IGNORECASE):
-            self.sql_entry.tag_add("keyword", f"1.0+{match.start()}c", f"1.0+{match.end()}c")
-        for match in re.finditer(type_pattern, content, re.IGNORECASE):
-            self.sql_entry.tag_add("type", f"1.0+{match.start()}c", f"1.0+{match.end()}c")
-        for match in re.finditer(control_pattern, content, re.IGNORECASE):
-            self.sql_entry.tag_add("control", f"1.0+{match.start()}c", f"1.0+{match.end()}c")
+    def cancel_task(self):
+        if getattr(self, 'active_task', None):
+            self.active_task.cancel()
 
-        self.sql_entry.tag_config("keyword", foreground="blue", font=("Consolas", 10, "bold"))
-        self.sql_entry.tag_config("type", foreground="green")
-        self.sql_entry.tag_config("control", foreground="orange")
+    def import_file(self):
+        path = filedialog.askopenfilename(title="Import Data", filetypes=[
+            ("Data files", "*.csv *.tsv *.tab *.txt *.jsonl *.ndjson *.gz"), ("All files", "*.*")])
+        if not path or not self.require("schema"):
+            return
+        default = getattr(self, 'current_table', None) or os.path.basename(path).split(".")[0]
+        table = simpledialog.askstring("Import", "Import into table (created if it does not exist):",
+                                       initialvalue=default)
+        if not table:
+            return
+        db_path = self._background_path("Imports")
+        if not db_path:
+            return
+        pragmas = dict(getattr(self, 'import_pragmas', BulkImporter.PRAGMAS))
+
+        def work(engine, task):
+            def progress(rows, fraction, rate):
+                task.post("progress", (fraction, f"{rows:,} rows, {rate:,.0f} rows/s"))
+            return engine.import_file(path, table, progress, task.cancelled.is_set, pragmas=pragmas)
+
+        def done(summary):
+            self._after_background_write()
+            self.show_table_data(summary["table"])
+            text = f"Imported {summary['rows']:,} rows in {summary['seconds']:.1f}s ({summary['rows_per_sec']:,.0f} rows/s)"
+            if summary["skipped_columns"]:
+                text += "\nSkipped columns not in table: " + ", ".join(summary["skipped_columns"])
+            messagebox.showinfo("Import", text)
+
+        self.run_task("Import", self._engine_worker(db_path, work), on_done=done)
+
+    def import_settings(self):
+        pragmas = dict(getattr(self, 'import_pragmas', BulkImporter.PRAGMAS))
+        for name in ("journal_mode", "synchronous", "cache_size"):
+            current = pragmas.get(name)
+            value = simpledialog.askstring("Import Settings", f"PRAGMA {name} during import (empty = unchanged):",
+                                           initialvalue="" if current is None else str(current))
+            if value is None:
+                return
+            pragmas[name] = value.strip() or None
+        self.import_pragmas = pragmas
+
+    def export_table(self):
+        if not hasattr(self, 'current_table'):
+            messagebox.showinfo("Export", "Select a table to export first.")
+            return
+        table = self.current_table
+        self._export({"table": table}, table)
 
-    def open_file(self):
-        if self.perm_mgr.is_blocked(self.permission):
-            messagebox.showwarning("Access Denied", "You do not have permission to open databases.")
+    def export_result(self):
+        sql = getattr(self, 'last_result_sql', None)
+        if not sql:
+            messagebox.showinfo("Export", "Run a query in the SQL console first.")
             return
+        self._export({"sql": sql}, "query_result")
 
-        path = filedialog.askopenfilename(title="Open Database", filetypes=[("SQLite DB", "*.db")])
-        if path:
-            try:
-                self.conn = sqlite3.connect(path)
-                self.cursor = self.conn.cursor()
-                messagebox.showinfo("Opened", f"Opened {path}")
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+    def _export(self, source, default_name):
+        path = filedialog.asksaveasfilename(title="Export", initialfile=f"{default_name}.csv", filetypes=[
+            ("CSV", "*.csv"), ("TSV", "*.tsv"), ("JSON Lines", "*.jsonl"), ("SQL INSERT dump", "*.sql"),
+            ("Gzip compressed", "*.gz"), ("All files", "*.*")])
+        if not path:
+            return
+        db_path = self._background_path("Exports")
+        if not db_path:
+            return
+        # Keeps the open profile's read settings (mmap, cache) for the export scan, read-only
+        # so re-running a console statement can never write.
+        settings = dict(self.engine.settings, mode="ro")
+
+        def work(engine, task):
+            def progress(rows, fraction, rate):
+                task.post("progress", (fraction, f"{rows:,} rows, {rate:,.0f} rows/s"))
+            return engine.export(path, progress=progress, cancelled=task.cancelled.is_set, **source)
+
+        def done(summary):
+            messagebox.showinfo("Export", f"Exported {summary['rows']:,} rows to {summary['path']} "
+                                          f"in {summary['seconds']:.1f}s")
+
+        self.run_task("Export", self._engine_worker(db_path, work, settings), on_done=done)
+
+    def open_engine(self, path, settings=None):
+        previous = getattr(self, 'engine', None)
+        # The connection itself enforces the session's permission, so the SQL console cannot bypass it.
+        settings = dict(settings or {})
+        if path != ":memory:":
+            if not self.perm_mgr.allows(path, "open"):
+                raise PermissionError(f"Your access to {os.path.basename(path)} is {self.perm_mgr.permission(path)}.")
+            if not self.perm_mgr.allows(path, "write"):
+                settings.update(mode="ro", restricted=True)
+            elif not self.perm_mgr.allows(path, "schema"):
+                settings["schema_locked"] = True
+        self.engine = DatabaseEngine(path, self.profiler, settings=settings)
+        self.conn = self.engine.conn
+        self.cursor = self.conn.cursor()
+        self.db_path = path
+        profile = self.engine.settings.get("profile", "Default")
+        access = self.perm_mgr.permission(path)
+        self.root.title(f"OpenDoc SQL - {os.path.basename(path)}" + ("" if profile == "Default" else f" [{profile}]")
+                        + ("" if access == "Full write" or self.role == "admin" else f" ({access})"))
+        if getattr(self, 'cache_limits', None):
+            self.engine.cache.resize(*self.cache_limits)
+        if previous is not None:
+            previous.close()
+
+    def _switch_engine(self, path, settings=None):
+        # The grid and tree still point at the old connection, which open_engine closes.
+        self.open_engine(path, settings)
+        self.grid.clear()
+        if hasattr(self, 'current_table'):
+            del self.current_table
+        self.load_db_structure()
+
+    def require(self, action, path=None):
+        path = path or getattr(self, 'db_path', None) or ""
+        if self.perm_mgr.allows(path, action):
+            return True
+        needed = next(name for name, level in PERMISSION_LEVELS.items() if level == ACTION_LEVELS[action])
+        messagebox.showwarning("Access Denied", f"Your access to {os.path.basename(path) or 'this database'} is "
+                                                f"{self.perm_mgr.permission(path)}; this needs {needed}.")
+        return False
+
+    def database_permissions(self):
+        path = getattr(self, 'db_path', None) or ""
+        if not self.auth or not self.perm_mgr.can_change_permissions(path):
+            messagebox.showwarning("Access Denied", "You cannot change permissions for this database.")
+            return
+        username = simpledialog.askstring("Database Permissions", f"User to grant access to {os.path.basename(path)}:")
+        if not username:
+            return
+        levels = list(PERMISSION_LEVELS)
+        permission = simpledialog.askstring("Database Permissions", f"Permission ({', '.join(levels)}):",
+                                            initialvalue="Read-only")
+        if permission is None:
+            return
+        matches = [level for level in levels if level.lower() == permission.strip().lower()]
+        try:
+            if not matches:
+                raise ValueError(f"Unknown permission '{permission}'")
+            self.auth.set_permission(username, path, matches[0])
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if username == self.username:
+            self.perm_mgr.update(path, matches[0])
+        messagebox.showinfo("Database Permissions", f"{username} now has {matches[0]} access to {path}.\n"
+                                                    "It applies from their next login.")
+
+    def show_profiler(self):
+        window = getattr(self, 'profiler_window', None)
+        if window and window.window.winfo_exists():
+            window.refresh()
+            window.window.lift()
+            return
+        self.profiler_window = ProfilerWindow(self)
+
+    def set_slow_threshold(self):
+        value = simpledialog.askfloat("Slow Query Threshold", "Log statements slower than (milliseconds):",
+                                      minvalue=0.0, initialvalue=self.profiler.threshold * 1000)
+        if value is not None:
+            self.profiler.threshold = value / 1000
+
+    def cache_settings(self):
+        cache = self.engine.cache
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        summary = (f"{stats['entries']:,} pages cached ({stats['bytes'] / 1048576:.1f} MB)\n"
+                   f"{stats['hits']:,} hits, {stats['misses']:,} misses "
+                   f"({stats['hits'] / lookups if lookups else 0:.0%} hit rate), "
+                   f"{stats['reversed']:,} served by reversing a cached page")
+        entries = simpledialog.askinteger("Result Cache", f"{summary}\n\nMaximum cached pages:",
+                                          initialvalue=cache.max_entries, minvalue=0)
+        if entries is None:
+            return
+        megabytes = simpledialog.askinteger("Result Cache", "Maximum cache size (MB):",
+                                            initialvalue=cache.max_bytes >> 20, minvalue=0)
+        if megabytes is None:
+            return
+        self.cache_limits = (entries, megabytes << 20)
+        cache.resize(*self.cache_limits)
+
+    def open_file(self, path=None, choose_profile=False):
+        if not self.resolve_pending_edits():
+            return
+
+        path = path or filedialog.askopenfilename(title="Open Database", filetypes=[("SQLite DB", "*.db")])
+        if not path or not self.require("open", path):
+            return
+        settings = self.recent.settings_for(path)
+        if choose_profile or settings is None:
+            settings = self.ask_open_settings(settings or {}) if choose_profile else open_settings()
+            if settings is None:
+                return
+        try:
+            self._switch_engine(path, settings)
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.recent.remember(path, settings)
+        messagebox.showinfo("Opened", f"Opened {path}")
+
+    def ask_open_settings(self, current):
+        names = list(OPEN_PROFILES)
+        profile = simpledialog.askstring("Open Profile", "Profile (" + ", ".join(names) + "):\n"
+                                         "Editing: WAL journal, synchronous=NORMAL\n"
+                                         "Read-only: read-only, memory-mapped\n"
+                                         "Archive: immutable, memory-mapped, no locking",
+                                         initialvalue=current.get("profile", "Default"))
+        if profile is None:
+            return None
+        matches = [name for name in names if name.lower() == profile.strip().lower()]
+        if not matches:
+            messagebox.showerror("Error", f"Unknown profile '{profile}'")
+            return None
+        defaults = current if current.get("profile") == matches[0] else OPEN_PROFILES[matches[0]]
+        mmap_mb = simpledialog.askinteger("Open Profile", "Memory-mapped I/O (MB, 0 = off):", minvalue=0,
+                                          initialvalue=defaults.get("mmap_mb", 0))
+        if mmap_mb is None:
+            return None
+        cache_mb = simpledialog.askinteger("Open Profile", "Page cache (MB, 0 = SQLite default):", minvalue=0,
+                                           initialvalue=defaults.get("cache_mb", 0))
+        if cache_mb is None:
+            return None
+        statements = simpledialog.askinteger("Open Profile", "Prepared statements to cache:", minvalue=0,
+                                             initialvalue=defaults.get("cached_statements", 128))
+        if statements is None:
+            return None
+        return open_settings(matches[0], mmap_mb=mmap_mb, cache_mb=cache_mb, cached_statements=statements)
+
+    def update_recent_menu(self):
+        self.recent_menu.delete(0, tk.END)
+        for entry in self.recent.entries:
+            profile = entry["settings"].get("profile", "Default")
+            self.recent_menu.add_command(label=f"{entry['path']} ({profile})",
+                                         command=lambda path=entry["path"]: self.open_recent(path))
+        if not self.recent.entries:
+            self.recent_menu.add_command(label="(empty)", state=tk.DISABLED)
+
+    def open_recent(self, path):
+        if not os.path.exists(path):
+            messagebox.showerror("Error", f"{path} no longer exists.")
+            self.recent.forget(path)
+            return
+        self.open_file(path)
 
 
     def save_file(self):
+        if not self.apply_edits():
+            return
         if hasattr(self, 'db_path') and self.db_path:
             self.conn.commit()
             messagebox.showinfo("Saved", f"Database saved to {self.db_path}")
@@ -345,27 +1564,63 @@ class SQLEditor:
             self.save_file_as()
 
     def save_file_as(self):
+        if not self.resolve_pending_edits():
+            return
         path = filedialog.asksaveasfilename(title="Save Database As", defaultextension=".db",
                                             filetypes=[("SQLite Database", "*.db")])
-        if path:
-            try:
-                self.conn.commit()
-                self.conn.close()
-                import shutil
-                shutil.copy(self.db_path if hasattr(self, 'db_path') else 'example.db', path)
-                self.conn = sqlite3.connect(path)
-                self.cursor = self.conn.cursor()
-                self.db_path = path
-                self.load_db_structure()
+        if path and self.require("write", path):
+            def done(summary):
+                self._switch_engine(path)
                 messagebox.showinfo("Saved As", f"Database saved as {path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save database: {str(e)}")
+            self._backup_to(path, "Save As", done)
+
+    def snapshot(self):
+        source = database_path(self.conn)
+        stem = os.path.splitext(os.path.basename(source or "database.db"))[0]
+        path = filedialog.asksaveasfilename(title="Save Snapshot", defaultextension=".db",
+                                            initialfile=f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}.db",
+                                            filetypes=[("SQLite Database", "*.db")])
+        if path:
+            self._backup_to(path, "Snapshot", lambda summary: messagebox.showinfo(
+                "Snapshot", f"Snapshot written to {path} in {summary['seconds']:.1f}s"))
+
+    def _backup_to(self, path, label, on_done):
+        source = database_path(self.conn)
+        if not source:
+            messagebox.showerror("Error", "There is no database file to back up.")
+            return
+        try:
+            self.conn.commit()
+            backup = OnlineBackup(source, path, getattr(self, 'backup_pages', None), getattr(self, 'backup_sleep', None))
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to save database: {str(e)}")
+            return
+
+        def work(task):
+            def progress(done, total):
+                task.post("progress", (done / total, f"{done:,} of {total:,} pages"))
+            return backup.run(progress, task.cancelled.is_set)
+
+        self.run_task(label, work, on_done=on_done)
+
+    def backup_settings(self):
+        pages = simpledialog.askinteger("Backup Settings", "Pages copied per step:", minvalue=1,
+                                        initialvalue=getattr(self, 'backup_pages', OnlineBackup.PAGES_PER_STEP))
+        if pages is None:
+            return
+        sleep = simpledialog.askfloat("Backup Settings", "Pause between steps (seconds):", minvalue=0.0,
+                                      initialvalue=getattr(self, 'backup_sleep', OnlineBackup.SLEEP))
+        if sleep is None:
+            return
+        self.backup_pages = pages
+        self.backup_sleep = sleep
 
     def new_file(self):
+        if not self.resolve_pending_edits():
+            return
         path = filedialog.asksaveasfilename(title="Create New Database", defaultextension=".db", filetypes=[("SQLite DB", "*.db")])
-        if path:
-            self.conn = sqlite3.connect(path)
-            self.cursor = self.conn.cursor()
+        if path and self.require("schema", path):
+            self._switch_engine(path)
             win = tk.Toplevel(self.root)
             win.title("Choose Template")
             tk.Button(win, text="Create User Database", command=lambda: self.create_template(win, 'user')).pack(pady=5)
@@ -381,130 +1636,389 @@ class SQLEditor:
         messagebox.showinfo("Template Created", f"{template.capitalize()} database created successfully.")
 
     def new_table(self):
+        if not self.require("schema"):
+            return
         name = simpledialog.askstring("New Table", "Table name:")
         if name:
             columns = simpledialog.askstring("New Table", "Columns (e.g., id INTEGER PRIMARY KEY, name TEXT):")
             if columns:
                 try:
-                    self.cursor.execute(f"CREATE TABLE {name} ({columns})")
-                    self.conn.commit()
+                    self.engine.create_table(name, columns)
                     self.load_db_structure()
                 except Exception as e:
                     messagebox.showerror("Error", str(e))
 
     def delete_table(self):
-        if hasattr(self, 'current_table'):
+        if hasattr(self, 'current_table') and self.require("schema"):
             try:
-                self.cursor.execute(f"DROP TABLE {self.current_table}")
-                self.conn.commit()
+                self.engine.drop_table(self.current_table)
+                self.grid.discard(self.current_table)
                 self.load_db_structure()
-                self.table.delete(*self.table.get_children())
+                self.grid.clear()
             except Exception as e:
                 messagebox.showerror("Error", str(e))
 
+    def profile_table(self, table=None, refresh=False):
+        table = table or getattr(self, 'current_table', None)
+        if not table:
+            return
+        profile = None if refresh else self.catalog.profile(table)
+        if profile:
+            self.show_profile(profile)
+            return
+        try:
+            profiler = self.engine.profile_table(table)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        # Workers read the file, so they see committed data only.
+        self.conn.commit()
+        stamp = self.catalog.data_stamp()
+
+        def work(task):
+            def progress(parts, fraction):
+                task.post("progress", (fraction, f"{table}, {parts} parts done"))
+            return profiler.run(progress, task.cancelled.is_set)
+
+        def done(profile):
+            if self.catalog.data_stamp() == stamp:
+                self.catalog.store_profile(table, stamp, profile)
+            self.show_profile(profile)
+
+        self.run_task("Profile Table", work, on_done=done)
+
+    def show_profile(self, profile):
+        window = getattr(self, 'profile_window', None)
+        if window and window.window.winfo_exists() and window.table == profile["table"]:
+            window.show(profile)
+            window.window.lift()
+            return
+        self.profile_window = ProfileWindow(self, profile)
+
     def add_rows(self):
         if not hasattr(self, 'current_table'):
             return
-        self.cursor.execute(f"PRAGMA table_info({self.current_table})")
-        columns = [info[1] for info in self.cursor.fetchall() if info[5] == 0]
-        values = []
+        if not self.require("write"):
+            return
+        columns = [col.name for col in self.catalog.columns(self.current_table) if col.pk == 0]
+        values = {}
         for col in columns:
-            val = simpledialog.askstring("Insert Row", f"Value for {col}:")
-            values.append(val)
-        placeholders = ','.join(['?'] * len(values))
+            values[col] = simpledialog.askstring("Insert Row", f"Value for {col}:")
         try:
-            self.cursor.execute(f"INSERT INTO {self.current_table} ({','.join(columns)}) VALUES ({placeholders})", values)
-            self.conn.commit()
+            self.engine.insert_row(self.current_table, values)
             self.show_table_data(self.current_table)
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
     def delete_rows(self):
-        selected_items = self.table.selection()
-        if not selected_items:
+        if not self.grid.selected or not isinstance(self.grid.source, TableSource):
             return
-        for item in selected_items:
-            values = self.table.item(item)['values']
-            conditions = " AND ".join([f"{col} = ?" for col in self.table['columns']])
-            try:
-                self.cursor.execute(f"DELETE FROM {self.current_table} WHERE {conditions}", values)
-                self.conn.commit()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-        self.show_table_data(self.current_table)
+        if not self.require("write"):
+            return
+        keys = self.grid.selected_keys()
+        try:
+            deleted = self.engine.delete_rows(self.current_table, keys)
+            self.grid.discard(self.current_table, keys)
+        except Exception as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.grid.selected.clear()
+        self.grid.refresh()
+        self.task_status.config(text=f"Deleted {deleted:,} row(s)")
+
+    def undo(self, event=None):
+        if event is not None and self.text_has_focus():
+            return None
+        self._replay(self.engine.undo, "Undo", self.engine.journal.undo_label())
+        return "break"
+
+    def redo(self, event=None):
+        if event is not None and self.text_has_focus():
+            return None
+        self._replay(self.engine.redo, "Redo", self.engine.journal.redo_label())
+        return "break"
+
+    def text_has_focus(self):
+        # Text and entry widgets keep their own Ctrl+Z/Ctrl+Y handling.
+        try:
+            return isinstance(self.root.focus_get(), (tk.Text, tk.Entry, ttk.Entry))
+        except KeyError:
+            return False
+
+    def _replay(self, action, name, pending):
+        # Ctrl+Z is pressed often, so an empty journal or a read-only session is not worth a popup.
+        if pending is None or not self.perm_mgr.allows(getattr(self, 'db_path', None) or "", "write"):
+            self.task_status.config(text=f"Nothing to {name.lower()}")
+            return
+        try:
+            label = action()
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror(name, f"{name} failed: {e}")
+            return
+        if label is None:
+            self.task_status.config(text=f"Nothing to {name.lower()}")
+            return
+        self.task_status.config(text=f"{name}: {label}")
+        if isinstance(self.grid.source, TableSource):
+            self.grid.refresh()
+
+    def update_undo_menu(self):
+        journal = self.engine.journal
+        for index, name, label in ((0, "Undo", journal.undo_label()), (1, "Redo", journal.redo_label())):
+            self.edit_menu.entryconfig(index, label=f"{name} {label}" if label else name,
+                                       state=tk.NORMAL if label else tk.DISABLED)
 
     def edit_column(self):
-        column = simpledialog.askstring("Edit Column", "Enter column name to edit:")
+        if not isinstance(self.grid.source, TableSource):
+            messagebox.showinfo("Edit Column", "Select a table first.")
+            return
+        if not self.require("write"):
+            return
+        db_path = self._background_path("Column updates")
+        if not db_path:
+            return
+        for job_id, spec, rows_done, status, updated in ColumnTransform.pending(self.conn):
+            answer = messagebox.askyesnocancel(
+                "Edit Column", f"An earlier update of {spec['table']}.{spec['column']} stopped after "
+                               f"{rows_done:,} rows ({status}).\nResume it now? (No discards it.)")
+            if answer is None:
+                return
+            if answer:
+                self._run_transform(db_path, job_id=job_id)
+                return
+            ColumnTransform.abandon(self.conn, job_id)
+
+        table = self.current_table
+        column = simpledialog.askstring("Edit Column", f"Column of {table} to update:",
+                                        initialvalue=self.sort_column or "")
         if not column:
             return
-        new_value = simpledialog.askstring("Edit Column", f"Enter new value for all rows in '{column}':")
-        if new_value is None:
+        value = simpledialog.askstring("Edit Column", f"New value for '{column}' "
+                                                      f"(start with = for an SQL expression, e.g. =upper({column})):")
+        if value is None:
+            return
+        where = simpledialog.askstring("Edit Column", "Only rows matching this SQL condition (empty = all rows):")
+        if where is None:
             return
-        table_name = self.table_list.get()
-        self.cursor.execute(f"UPDATE {table_name} SET {column} = ?", (new_value,))
+        chunk_rows = simpledialog.askinteger("Edit Column", "Rows per transaction:", minvalue=1,
+                                             initialvalue=getattr(self, 'transform_chunk_rows', ColumnTransform.CHUNK_ROWS))
+        if not chunk_rows:
+            return
+        self.transform_chunk_rows = chunk_rows
+        if value.startswith("="):
+            spec = {"value": None, "expression": value[1:]}
+        else:
+            spec = {"value": value, "expression": None}
+        spec.update(table=table, column=column, where=where, chunk_rows=chunk_rows)
+        try:
+            transform = self.engine.transform_column(**spec)
+            transform.validate()
+            estimate = transform.estimate()
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if messagebox.askokcancel("Edit Column", f"About {estimate:,} row(s) of {table} will be updated, "
+                                                 f"{chunk_rows:,} rows per transaction.\nContinue?"):
+            self._run_transform(db_path, **spec)
+
+    def _run_transform(self, db_path, job_id=None, **spec):
         self.conn.commit()
-        self.show_table_data()
 
-    def copy_row(self):
-        selected = self.table.selection()
-        if not selected:
+        def work(engine, task):
+            if job_id is None:
+                transform = engine.transform_column(**spec)
+            else:
+                transform = engine.resume_transform(job_id)
+
+            def progress(rows, fraction, rate):
+                task.post("progress", (fraction, f"{rows:,} rows updated, {rate:,.0f} rows/s"))
+            return transform.run(progress, task.cancelled.is_set)
+
+        def done(summary):
+            self._after_background_write()
+            self.grid.refresh()
+            messagebox.showinfo("Edit Column", f"Updated {summary['rows']:,} row(s) of {summary['table']}."
+                                               f"{summary['column']} in {summary['seconds']:.1f}s")
+
+        self.run_task("Edit Column", self._engine_worker(db_path, work), on_done=done)
+
+    def copy_rows(self, event=None, header=False):
+        rows = self.selected_rows()
+        if rows:
+            self.root.clipboard_clear()
+            self.root.clipboard_append(rows_to_tsv(rows, self.grid.source.columns if header else None))
+            self.task_status.config(text=f"Copied {len(rows):,} row(s)")
+        return "break"
+
+    def copy_cells(self, event=None):
+        rows = self.selected_rows()
+        column = getattr(self, 'focus_column', None)
+        if rows and column in self.grid.source.columns:
+            index = self.grid.source.columns.index(column)
+            self.root.clipboard_clear()
+            self.root.clipboard_append(rows_to_tsv([row[index]] for row in rows))
+            self.task_status.config(text=f"Copied {len(rows):,} cell(s) of {column}")
+        return "break"
+
+    def selected_rows(self):
+        source = self.grid.source
+        if not source or not self.grid.selected:
+            return []
+        rows = sorted(source.fetch(self.grid.selected_keys()).values(), key=lambda row: sqlite_order(row[0]),
+                      reverse=not getattr(source, 'ascending', True))
+        return [values for sort_key, values in rows]
+
+    def paste_rows(self, event=None):
+        if not isinstance(self.grid.source, TableSource) or not self.require("write"):
+            return "break"
+        try:
+            rows = tsv_to_rows(self.root.clipboard_get())
+        except tk.TclError:
+            return "break"
+        if not rows:
+            return "break"
+        column = getattr(self, 'focus_column', None)
+        if len(rows) == 1 and len(rows[0]) == 1 and self.grid.selected and column in self.grid.source.columns:
+            self.paste_cells(column, rows[0][0])
+            return "break"
+        try:
+            count = self.engine.paste_rows(self.current_table, rows)
+        except (sqlite3.Error, ValueError) as e:
+            messagebox.showerror("Paste", str(e))
+            return "break"
+        self.grid.refresh()
+        self.task_status.config(text=f"Pasted {count:,} row(s) into {self.current_table}")
+        return "break"
+
+    def paste_cells(self, column, value):
+        keys = self.grid.selected_keys()
+        if self.buffer_edits.get():
+            for key in keys:
+                self.grid.stage(key, column, value)
             return
-        self.copied_row = self.table.item(selected[0])['values']
-
-    def paste_row(self):
-        if not self.copied_row:
+        try:
+            self.engine.update_cells({self.current_table: {key: {column: value} for key in keys}})
+        except sqlite3.Error as e:
+            messagebox.showerror("Paste", str(e))
             return
-        table_name = self.table_list.get()
-        self.cursor.execute(f"PRAGMA table_info({table_name})")
-        columns = [info[1] for info in self.cursor.fetchall()]
+        self.grid.reload_rows(keys)
+        self.task_status.config(text=f"Pasted into {len(keys):,} cell(s) of {column}")
 
-        id_col = columns[0]
-        new_id = simpledialog.askinteger("Paste Row", f"Enter new {id_col} value:")
-        if new_id is None:
+    def create_search_index(self):
+        if not hasattr(self, 'current_table'):
+            messagebox.showinfo("Search", "Select a table to index first.")
+            return
+        if not self.require("schema"):
+            return
+        table = self.current_table
+        index = SearchIndex(self.conn, self.catalog)
+        default = index.indexed_tables().get(table) or index.text_columns(table)
+        columns = simpledialog.askstring("Search Index", f"Columns of {table} to index (comma separated):",
+                                         initialvalue=", ".join(default))
+        if not columns:
+            return
+        columns = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in columns if c not in self.catalog.column_names(table)]
+        if unknown:
+            messagebox.showerror("Error", f"No column(s) {', '.join(unknown)} in {table}")
+            return
+        db_path = self._background_path("Search index builds")
+        if not db_path:
             return
 
-        self.cursor.execute(f"UPDATE {table_name} SET {id_col} = {id_col} + 1 WHERE {id_col} >= ? ORDER BY {id_col} DESC", (new_id,))
-        self.conn.commit()
+        def work(task):
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                conn.set_progress_handler(lambda: 1 if task.cancelled.is_set() else 0, 100000)
+                task.post("progress", (None, f"indexing {table}"))
+                with conn:
+                    SearchIndex(conn).create(table, columns)
+            finally:
+                conn.close()
 
-        new_row = self.copied_row[:]
-        new_row[0] = new_id
+        def done(result):
+            self._after_background_write()
+            self.schedule_search()
 
-        placeholders = ', '.join('?' for _ in columns)
-        self.cursor.execute(f"INSERT INTO {table_name} VALUES ({placeholders})", new_row)
-        self.conn.commit()
-        self.show_table_data()
+        self.run_task("Search index", work, on_done=done)
+
+    def drop_search_index(self):
+        if not hasattr(self, 'current_table'):
+            return
+        if not self.require("schema"):
+            return
+        try:
+            SearchIndex(self.conn, self.catalog).drop(self.current_table)
+            self.conn.commit()
+            self._after_background_write()
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", str(e))
+
+    def schedule_search(self):
+        pending = getattr(self, 'search_pending', None)
+        if pending is not None:
+            self.root.after_cancel(pending)
+        self.search_pending = self.root.after(200, self.run_search)
+
+    def run_search(self):
+        self.search_pending = None
+        self.search_results.delete(*self.search_results.get_children())
+        self.search_hits = {}
+        text = self.search_var.get()
+        tables = None
+        if self.search_scope.get() == "Current table":
+            tables = [self.current_table] if hasattr(self, 'current_table') else []
+        try:
+            hits = self.engine.search(text, tables)
+        except sqlite3.Error as e:
+            self.query_status.config(text=f"Search failed: {e}")
+            return
+        for i, (table, rowid, score, snippet) in enumerate(hits):
+            iid = str(i)
+            self.search_hits[iid] = (table, rowid)
+            self.search_results.insert("", "end", iid=iid, values=(table, snippet))
+
+    def open_search_hit(self, event=None):
+        hit = self.search_hits.get(self.search_results.focus()) if hasattr(self, 'search_hits') else None
+        if not hit:
+            return
+        table, rowid = hit
+        source = self.grid.source
+        if not (isinstance(source, TableSource) and source.table == table and not source.where):
+            self.show_table_data(table)
+        self.grid.goto(self.grid.source.order_key_for(rowid))
+        children = self.table.get_children()
+        if children:
+            self.table.selection_set(children[0])
+            self.table.focus(children[0])
 
     def find_in_column(self):
         column = simpledialog.askstring("Find", "Find in column: ")
         value = simpledialog.askstring("Find", f"Search in column '{column}':")
         if value is None:
             return
-        table_name = self.table_list.get()
-        self.cursor.execute(f"PRAGMA table_info({table_name})")
-        col_types = {info[1]: info[2].upper() for info in self.cursor.fetchall()}
-
-        if 'CHAR' in col_types[column] or 'TEXT' in col_types[column]:
-            query = f"SELECT * FROM {table_name} WHERE {column} LIKE ?"
-            param = f"%{value}%"
-        else:
-            query = f"SELECT * FROM {table_name} WHERE {column} = ?"
-            param = value
-
-        self.cursor.execute(query, (param,))
-        rows = self.cursor.fetchall()
-
-        self.table.delete(*self.table.get_children())
-        for row in rows:
-            self.table.insert("", tk.END, values=row)
-
+        if not hasattr(self, 'current_table'):
+            return
+        try:
+            self.views.select(self.table_frame)
+            self.grid.set_source(self.engine.find(self.current_table, column, value))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
 
 if __name__ == '__main__':
-    def start_app(username, role, permission):
-        SQLEditor(login_root, username, role, permission)
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
+    def start_app(session, auth):
+        started = time.perf_counter()
+        editor = SQLEditor(login_root, session, auth)
+        login_root.after_idle(lambda: editor.task_status.config(
+            text=f"Ready in {report_startup('Editor window', started):.2f}s"))
 
     global login_root
     login_root = tk.Tk()
     LoginWindow(login_root, start_app)
+    login_root.after_idle(lambda: report_startup("Login window", STARTED))
     login_root.mainloop()
 
 
@@ -0,0 +1,482 @@
+import sqlite3
+
+import pytest
+
+from engine import (AuthService, ColumnTransform, DatabaseEngine, JobStore, QueryProfiler, ScriptRunner, SearchIndex,
+                    StreamingExporter, explain_plan, plan_warnings, suggest_indexes)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "test.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT, n INTEGER)")
+    conn.executemany("INSERT INTO t (name, n) VALUES (?, ?)",
+                     [(f"r{i}", None if i % 10 == 0 else i % 7) for i in range(1000)])
+    conn.execute("CREATE TABLE w (a TEXT, b TEXT, v INTEGER, PRIMARY KEY (a, b)) WITHOUT ROWID")
+    conn.executemany("INSERT INTO w VALUES (?, ?, ?)", [(str(i % 13), str(i), i) for i in range(300)])
+    conn.commit()
+    conn.close()
+    engine = DatabaseEngine(path)
+    yield engine
+    engine.close()
+
+
+def page_through(source, n=64):
+    rows = source.first(n)
+    seen = list(rows)
+    while rows:
+        rows = source.after(rows[-1][0], n)
+        seen.extend(rows)
+    return seen
+
+
+def test_keyset_paging_visits_every_row_once(db):
+    seen = page_through(db.table("t"))
+    assert [values[0] for key, values in seen] == list(range(1, 1001))
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sorted_paging_matches_order_by(db, ascending):
+    seen = page_through(db.sort("t", "n", ascending))
+    direction = "ASC" if ascending else "DESC"
+    expected = db.conn.execute(f"SELECT * FROM t ORDER BY n {direction}, id {direction}").fetchall()
+    assert [values for key, values in seen] == expected
+
+
+def test_keyset_paging_without_rowid(db):
+    seen = page_through(db.table("w"), 50)
+    assert [values for key, values in seen] == db.conn.execute("SELECT * FROM w ORDER BY a, b").fetchall()
+
+
+def test_before_pages_back_to_the_start(db):
+    source = db.sort("t", "n")
+    rows = source.last(64)
+    seen = list(rows)
+    while rows:
+        rows = source.before(rows[0][0], 64)
+        seen[:0] = rows
+    assert seen == page_through(source)
+
+
+def test_script_runner_keeps_statements_before_a_failure(db):
+    runner = ScriptRunner(db.conn, "INSERT INTO t (name) VALUES ('a'); INSERT INTO t (name) VALUES ('b'); "
+                                   "INSERT INTO missing VALUES (1); INSERT INTO t (name) VALUES ('c')")
+    summary = runner.run()
+    assert summary["failed"] == 2
+    assert summary["pending"]
+    assert summary["changes"] == 2
+    runner.finish(commit=True)
+    names = [row[0] for row in db.conn.execute("SELECT name FROM t WHERE id > 1000 ORDER BY id")]
+    assert names == ["a", "b"]
+
+
+def test_script_runner_rolls_back_on_request(db):
+    runner = ScriptRunner(db.conn, "DELETE FROM t; UPDATE w SET v = 0")
+    summary = runner.run()
+    assert summary["failed"] is None
+    runner.finish(commit=False)
+    assert db.conn.execute("SELECT count(*) FROM t").fetchone()[0] == 1000
+    assert db.conn.execute("SELECT sum(v) FROM w").fetchone()[0] == sum(range(300))
+
+
+def test_script_runner_reports_returning_as_modified(db):
+    runner = ScriptRunner(db.conn, "UPDATE t SET name = 'x' WHERE id = 1 RETURNING id")
+    summary = runner.run()
+    runner.finish()
+    assert summary["modified"]
+    assert runner.results[0]["columns"] == ["id"]
+    runner = ScriptRunner(db.conn, "SELECT * FROM t")
+    summary = runner.run()
+    runner.finish()
+    assert not summary["modified"]
+
+
+def test_journal_undo_and_redo_cell_edit(db):
+    db.update_cell("t", (5,), "name", "edited")
+    assert db.journal.undo_label() == "Edit 1 cell(s)"
+    assert db.undo() == "Edit 1 cell(s)"
+    assert db.conn.execute("SELECT name FROM t WHERE id = 5").fetchone()[0] == "r4"
+    assert db.redo() == "Edit 1 cell(s)"
+    assert db.conn.execute("SELECT name FROM t WHERE id = 5").fetchone()[0] == "edited"
+    assert db.redo() is None
+
+
+def test_journal_undo_restores_deleted_rows(db):
+    before = db.conn.execute("SELECT * FROM w ORDER BY a, b").fetchall()
+    keys = [key for key, values in db.table("w").first(20)]
+    assert db.delete_rows("w", keys) == 20
+    db.undo()
+    assert db.conn.execute("SELECT * FROM w ORDER BY a, b").fetchall() == before
+    assert db.undo() is None
+
+
+def test_auth_migration_hashes_plaintext_passwords(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT, role TEXT, "
+                 "permission TEXT)")
+    conn.execute("INSERT INTO users (username, password, role, permission) VALUES ('ann', 'secret', 'user', "
+                 "'Read-only')")
+    conn.commit()
+    conn.close()
+
+    auth = AuthService(path, iterations=1000)
+    try:
+        stored = auth.conn.execute("SELECT password FROM users WHERE username = 'ann'").fetchone()[0]
+        assert stored.startswith(AuthService.SCHEME + "$")
+        assert "secret" not in stored
+        assert auth.conn.execute("PRAGMA user_version").fetchone()[0] == AuthService.SCHEMA_VERSION
+        assert auth.login("ann", "secret").permission("") == "Read-only"
+        assert auth.login("ann", "wrong") is None
+        assert auth.login(*AuthService.DEFAULT_ADMIN[:2]) is not None
+    finally:
+        auth.close()
+
+
+def test_auth_login_rehashes_with_a_higher_cost(tmp_path):
+    path = str(tmp_path / "users.db")
+    AuthService(path, iterations=1000).close()
+    auth = AuthService(path, iterations=2000)
+    try:
+        assert auth.login("admin", "admin123") is not None
+        stored = auth.conn.execute("SELECT password FROM users WHERE username = 'admin'").fetchone()[0]
+        assert stored.split("$")[1] == "2000"
+    finally:
+        auth.close()
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_rename_indexed_column_keeps_search_working(db, native):
+    SearchIndex(db.conn, db.catalog).create("t", ["name"])
+    db.commit()
+    db.rename_column("t", "name", "label", native=native).run()
+    assert SearchIndex(db.conn, db.catalog).indexed_tables() == {"t": ["label"]}
+    assert [hit[1] for hit in db.search("r999")] == [1000]
+    db.update_cell("t", (43,), "label", "renamed")
+    assert [values[0] for key, values in db.find("t", "label", "renamed").first(10)] == [43]
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_drop_indexed_column_recreates_index_over_the_rest(db, native):
+    db.conn.execute("ALTER TABLE t ADD COLUMN note TEXT")
+    db.conn.execute("UPDATE t SET note = 'note ' || id")
+    SearchIndex(db.conn, db.catalog).create("t", ["name", "note"])
+    db.commit()
+    db.drop_column("t", "name", native=native).run()
+    assert SearchIndex(db.conn, db.catalog).indexed_tables() == {"t": ["note"]}
+    assert {"t__fts_ai", "t__fts_ad", "t__fts_au"} <= set(db.catalog.triggers("t"))
+    assert db.search("r42") == []
+    db.insert_row("t", {"note": "fresh"})
+    assert [hit[0] for hit in db.search("fresh")] == ["t"]
+
+
+def test_drop_only_indexed_column_drops_the_index(db):
+    SearchIndex(db.conn, db.catalog).create("t", ["name"])
+    db.commit()
+    summary = db.drop_column("t", "name").run()
+    assert "search index" in summary["skipped"]
+    assert SearchIndex(db.conn, db.catalog).indexed_tables() == {}
+    assert db.search("r42") == []
+
+
+def test_rebuild_keeps_the_autoincrement_counter(db):
+    db.conn.execute("CREATE TABLE a (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, extra TEXT)")
+    db.conn.executemany("INSERT INTO a (name) VALUES (?)", [(str(i),) for i in range(100)])
+    db.conn.execute("DELETE FROM a WHERE id > 90")
+    db.commit()
+    summary = db.drop_column("a", "extra", native=False).run()
+    assert summary["method"] == "rebuild"
+    assert db.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'a'").fetchone() == (100,)
+    db.conn.execute("INSERT INTO a (name) VALUES ('next')")
+    assert db.conn.execute("SELECT max(id) FROM a").fetchone() == (101,)
+
+
+def test_schema_locked_session_can_write_rows_but_not_schema(db, tmp_path):
+    SearchIndex(db.conn, db.catalog).create("t", ["name"])
+    db.commit()
+    locked = DatabaseEngine(db.path, settings={"schema_locked": True})
+    try:
+        locked.update_cell("t", (1,), "name", "edited")
+        assert [hit[1] for hit in locked.search("edited")] == [1]
+        locked.conn.execute("CREATE TEMP TABLE scratch (a)")
+        for sql in ("CREATE TABLE x (a)", "DROP TABLE w", "ALTER TABLE t ADD COLUMN x",
+                    "CREATE INDEX t_n ON t (n)", "PRAGMA writable_schema = ON",
+                    "INSERT INTO sqlite_master VALUES ('view', 'v', 'v', 0, 'CREATE VIEW v AS SELECT 1')",
+                    "UPDATE sqlite_schema SET sql = sql", "DELETE FROM sqlite_master",
+                    f"ATTACH DATABASE '{tmp_path / 'other.db'}' AS other"):
+            with pytest.raises(sqlite3.DatabaseError):
+                locked.conn.execute(sql)
+        assert locked.conn.execute("SELECT count(*) FROM sqlite_master").fetchone()[0] > 0
+    finally:
+        locked.close()
+    assert db.conn.execute("SELECT name FROM t WHERE id = 1").fetchone() == ("edited",)
+    assert db.catalog.kind("v") is None
+    assert not (tmp_path / "other.db").exists()
+
+
+def test_restricted_session_cannot_attach(db, tmp_path):
+    restricted = DatabaseEngine(db.path, settings={"mode": "ro", "restricted": True})
+    try:
+        with pytest.raises(sqlite3.DatabaseError):
+            restricted.conn.execute(f"ATTACH DATABASE '{tmp_path / 'other.db'}' AS other")
+        with pytest.raises(sqlite3.OperationalError):
+            restricted.conn.execute("UPDATE t SET name = 'x'")
+    finally:
+        restricted.close()
+    assert not (tmp_path / "other.db").exists()
+
+
+def test_column_transform_runs_under_a_schema_lock_and_resumes(db, tmp_path):
+    store = JobStore(str(tmp_path / "jobs.json"))
+    objects = db.conn.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall()
+    locked = DatabaseEngine(db.path, settings={"schema_locked": True})
+    try:
+        transform = locked.transform_column("t", "name", expression="name || '!'", where="id <= 500",
+                                            chunk_rows=100, sleep=0, store=store)
+        chunks = []
+
+        def cancelled():
+            return len(chunks) >= 2
+
+        with pytest.raises(sqlite3.OperationalError):
+            transform.run(lambda rows, fraction, rate: chunks.append(rows), cancelled)
+        [(job_id, spec, rows_done, status, updated)] = ColumnTransform.pending(locked.conn, store)
+        assert (spec["column"], rows_done, status) == ("name", 200, "paused")
+        summary = locked.resume_transform(job_id, sleep=0, store=store).run()
+        assert summary["rows"] == 500
+        assert ColumnTransform.pending(locked.conn, store) == []
+    finally:
+        locked.close()
+    assert db.conn.execute("SELECT count(*) FROM t WHERE name LIKE '%!'").fetchone() == (500,)
+    assert db.conn.execute("SELECT count(*) FROM t WHERE name LIKE '%!!'").fetchone() == (0,)
+    assert db.conn.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall() == objects
+
+
+def test_abandoned_transform_is_no_longer_pending(db, tmp_path):
+    store = JobStore(str(tmp_path / "jobs.json"))
+    transform = db.transform_column("t", "n", value=0, chunk_rows=100, sleep=0, store=store)
+    with pytest.raises(sqlite3.OperationalError):
+        transform.run(cancelled=lambda: True)
+    [(job_id, *_)] = ColumnTransform.pending(db.conn, store)
+    ColumnTransform.abandon(db.conn, job_id, store)
+    assert ColumnTransform.pending(db.conn, store) == []
+    with pytest.raises(ValueError):
+        DatabaseEngine(":memory:").resume_transform(job_id, store=store)
+
+
+def test_suggest_indexes_keeps_self_join_aliases_apart(db):
+    db.conn.execute("CREATE TABLE p (id INTEGER PRIMARY KEY, x, y, z)")
+    sql = "SELECT a.id FROM p a JOIN p b ON a.x = b.y WHERE a.z = ?"
+    plan = explain_plan(db.conn, sql, (1,))
+    assert suggest_indexes(sql, plan, db.catalog) == ['CREATE INDEX "idx_p_z_x_id" ON "p"("z", "x", "id")']
+    sql = "SELECT b.id FROM p a JOIN p b ON b.y = a.x WHERE b.z = 1 AND a.id = 5"
+    plan = [(2, 0, "SEARCH a USING INTEGER PRIMARY KEY (rowid=?)"), (3, 0, "SCAN TABLE p AS b")]
+    assert suggest_indexes(sql, plan, db.catalog) == ['CREATE INDEX "idx_p_z_y_id" ON "p"("z", "y", "id")']
+
+
+def test_suggest_indexes_for_a_plain_scan(db):
+    sql = "SELECT name FROM t WHERE n = 3 ORDER BY name"
+    plan = explain_plan(db.conn, sql)
+    assert plan_warnings(plan[0][2]) == ["full table scan"]
+    assert suggest_indexes(sql, plan, db.catalog) == ['CREATE INDEX "idx_t_n_name" ON "t"("n", "name")']
+    db.conn.execute("CREATE INDEX t_n_name ON t (n, name)")
+    assert suggest_indexes(sql, explain_plan(db.conn, sql), db.catalog) == []
+
+
+@pytest.mark.parametrize("name", ["t.csv", "t.tsv", "t.jsonl", "t.csv.gz"])
+def test_export_then_import_round_trips_rows(db, tmp_path, name):
+    path = str(tmp_path / name)
+    exported = db.export(path, table="t")
+    assert exported["rows"] == 1000
+    summary = db.import_file(path, "copy")
+    assert (summary["rows"], summary["created"], summary["skipped_columns"]) == (1000, True, [])
+    expected = [(i, f"r{i - 1}", None if (i - 1) % 10 == 0 else (i - 1) % 7) for i in range(1, 1001)]
+    copied = db.conn.execute("SELECT id, name, n FROM copy ORDER BY id").fetchall()
+    assert [(int(i), name, None if n is None else int(n)) for i, name, n in copied] == expected
+
+
+def test_sql_export_replays_into_an_empty_table(db, tmp_path):
+    path = tmp_path / "w.sql"
+    StreamingExporter(db.conn, "SELECT * FROM w WHERE v < ?", (10,), table="w").run(str(path))
+    other = sqlite3.connect(":memory:")
+    other.execute("CREATE TABLE w (a TEXT, b TEXT, v INTEGER, PRIMARY KEY (a, b)) WITHOUT ROWID")
+    other.executescript(path.read_text())
+    assert other.execute("SELECT * FROM w ORDER BY v").fetchall() == \
+        db.conn.execute("SELECT * FROM w WHERE v < 10 ORDER BY v").fetchall()
+
+
+def test_cancelled_export_leaves_no_file(db, tmp_path):
+    path = tmp_path / "t.csv"
+    with pytest.raises(sqlite3.OperationalError):
+        db.export(str(path), table="t", cancelled=lambda: True)
+    assert not path.exists()
+    with pytest.raises(ValueError):
+        db.export(str(path), sql="UPDATE t SET n = n")
+
+
+def test_import_into_an_existing_table_maps_columns_by_name(db, tmp_path):
+    path = tmp_path / "rows.jsonl"
+    path.write_text('{"NAME": "one", "unknown": 1}\n{"name": "two", "extra": {"a": 1}}\n')
+    summary = db.import_file(str(path), "t")
+    assert (summary["rows"], summary["created"], summary["skipped_columns"]) == (2, False, ["unknown", "extra"])
+    assert db.conn.execute("SELECT name FROM t WHERE id > 1000 ORDER BY id").fetchall() == [("one",), (None,)]
+
+
+def test_cancelled_import_rolls_back(db, tmp_path):
+    path = tmp_path / "rows.csv"
+    path.write_text("name,n\n" + "".join(f"x{i},{i}\n" for i in range(100)))
+    with pytest.raises(sqlite3.OperationalError):
+        db.import_file(str(path), "t", cancelled=lambda: True, batch_size=10)
+    assert db.conn.execute("SELECT count(*) FROM t").fetchone() == (1000,)
+    assert db.conn.execute("PRAGMA synchronous").fetchone() == (2,)
+
+
+def test_backup_copies_the_database(db, tmp_path):
+    target = tmp_path / "copy.db"
+    db.update_cell("t", (1,), "name", "committed")
+    steps = []
+    db.backup(str(target), progress=lambda done, total: steps.append((done, total)), pages=1, sleep=0)
+    copy = sqlite3.connect(str(target))
+    assert copy.execute("SELECT name FROM t WHERE id = 1").fetchone() == ("committed",)
+    assert copy.execute("SELECT count(*) FROM w").fetchone() == (300,)
+    assert steps[-1][0] == steps[-1][1]
+    assert not (tmp_path / "copy.db.part").exists()
+
+
+def test_cancelled_backup_keeps_the_old_target(db, tmp_path):
+    target = tmp_path / "copy.db"
+    target.write_bytes(b"old")
+    with pytest.raises(sqlite3.OperationalError):
+        db.backup(str(target), cancelled=lambda: True, pages=1, sleep=0)
+    assert target.read_bytes() == b"old"
+    assert not (tmp_path / "copy.db.part").exists()
+    with pytest.raises(ValueError):
+        db.backup(db.path)
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_rename_column_keeps_rows_indexes_and_views(db, native):
+    db.conn.execute("CREATE INDEX t_name ON t (name)")
+    db.conn.execute("CREATE VIEW named AS SELECT id, name FROM t WHERE name LIKE 'r1%'")
+    db.commit()
+    before = db.conn.execute("SELECT * FROM t ORDER BY id").fetchall()
+    db.rename_column("t", "name", "label", native=native).run()
+    assert db.catalog.column_names("t") == ["id", "label", "n"]
+    assert db.conn.execute("SELECT * FROM t ORDER BY id").fetchall() == before
+    assert [index.columns for index in db.catalog.indexes("t")] == [["label"]]
+    assert db.conn.execute("SELECT count(*) FROM named").fetchone() == (111,)
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_drop_column_keeps_the_other_columns(db, native):
+    db.drop_column("t", "n", native=native).run()
+    assert db.catalog.column_names("t") == ["id", "name"]
+    assert db.conn.execute("SELECT id, name FROM t WHERE id IN (1, 1000)").fetchall() == [(1, "r0"), (1000, "r999")]
+
+
+def test_drop_column_used_by_a_view_is_refused(db):
+    db.conn.execute("CREATE VIEW counted AS SELECT n FROM t")
+    db.commit()
+    with pytest.raises(ValueError):
+        db.drop_column("t", "n", native=False).run()
+    with pytest.raises(ValueError):
+        db.rename_column("t", "name", "N")
+    assert db.catalog.column_names("t") == ["id", "name", "n"]
+
+
+def test_column_transform_updates_only_matching_rows(db, tmp_path):
+    matching = db.conn.execute("SELECT count(*) FROM t WHERE n = 3").fetchone()[0]
+    transform = db.transform_column("t", "n", value=-1, where="n = 3", chunk_rows=64, sleep=0,
+                                    store=JobStore(str(tmp_path / "jobs.json")))
+    assert transform.estimate() == matching
+    assert transform.run()["rows"] == matching
+    assert db.conn.execute("SELECT count(*) FROM t WHERE n = -1").fetchone() == (matching,)
+    assert db.conn.execute("SELECT count(*) FROM t WHERE n = 3").fetchone() == (0,)
+    with pytest.raises(ValueError):
+        db.transform_column("t", "id", value=1)
+
+
+def test_search_index_follows_inserts_updates_and_deletes(db):
+    index = SearchIndex(db.conn, db.catalog)
+    index.create("t", ["name"])
+    db.commit()
+    assert "t__fts" not in db.catalog.tables()
+    assert [hit[1] for hit in db.search("r999")] == [1000]
+    db.update_cell("t", (1000,), "name", "zulu")
+    db.insert_row("t", {"name": "yankee zulu"})
+    db.delete_rows("t", [(1,)])
+    assert sorted(hit[1] for hit in db.search("zulu")) == [1000, 1001]
+    assert db.search("r999") == [] and db.search("r0") == []
+    assert [values[0] for key, values in db.find("t", "name", "yank").first(10)] == [1001]
+    with pytest.raises(ValueError):
+        index.create("w", ["a"])
+    index.drop("t")
+    assert index.indexed_tables() == {} and db.catalog.triggers("t") == []
+
+
+def test_result_cache_serves_repeats_and_drops_stale_pages(db):
+    source = db.sort("t", "name")
+    first = source.first(50)
+    assert source.first(50) == first and db.cache.hits == 1
+    db.update_cell("t", first[0][0][-1:], "name", "changed")
+    assert source.first(50) != first
+    other = sqlite3.connect(db.path)
+    other.execute("DELETE FROM t WHERE id = ?", (first[1][0][-1],))
+    other.commit()
+    other.close()
+    assert first[1] not in source.first(50)
+    misses = db.cache.misses
+    db.conn.execute("CREATE TABLE extra (a)")
+    source.first(50)
+    assert db.cache.misses == misses + 1
+
+
+def test_result_cache_mirrors_a_complete_result(db):
+    ascending = db.sort("w", "v").first(1000)
+    assert len(ascending) == 300
+    descending = db.sort("w", "v", ascending=False).first(20)
+    assert db.cache.reversed == 1
+    assert descending == ascending[::-1][:20]
+
+
+def test_profiling_connection_records_queries_and_logs_slow_ones(tmp_path):
+    profiler = QueryProfiler(threshold=0, log_path=str(tmp_path / "slow.jsonl"), log_limit=400)
+    path = str(tmp_path / "p.db")
+    engine = DatabaseEngine(path, profiler=profiler)
+    try:
+        engine.conn.execute("CREATE TABLE p (a)")
+        engine.conn.executemany("INSERT INTO p VALUES (?)", [(i,) for i in range(10)])
+        engine.catalog.refresh()
+        assert engine.conn.execute("SELECT a FROM p WHERE a > ?", (4,)).fetchall() == [(i,) for i in range(5, 10)]
+    finally:
+        engine.close()
+    records = [(record.sql, record.rows) for record in profiler.recent()]
+    assert ("SELECT a FROM p WHERE a > ?", 5) in records
+    assert not any("schema_version" in sql for sql, rows in records)
+    assert (tmp_path / "slow.jsonl.1").exists()
+    assert [entry["sql"] for entry in profiler.slow_log()][-1] == "SELECT a FROM p WHERE a > 4"
+
+
+def test_table_profile_counts_nulls_and_values(db):
+    summary = db.profile_table("t", workers=1).run()
+    columns = {column["column"]: column for column in summary["columns"]}
+    assert summary["rows"] == 1000
+    assert columns["n"]["nulls"] == 100
+    assert (columns["n"]["min"], columns["n"]["max"]) == (0, 6)
+    assert columns["id"]["distinct"] == 1000
+
+
+@pytest.mark.parametrize("top", [2000, 2 ** 63 - 1])
+def test_undo_removes_exactly_the_added_rows(db, top):
+    db.conn.execute("INSERT INTO t (id, name) VALUES (?, 'top')", (top,))
+    db.commit()
+    before = db.conn.execute("SELECT * FROM t ORDER BY id").fetchall()
+    assert db.insert_empty_rows("t", 5) == 5
+    assert db.paste_rows("t", [["pasted", "1"], ["pasted", "2"]]) == 2
+    assert db.conn.execute("SELECT count(*) FROM t").fetchone() == (len(before) + 7,)
+    db.undo()
+    db.undo()
+    assert db.conn.execute("SELECT * FROM t ORDER BY id").fetchall() == before
+    db.redo()
+    assert db.conn.execute("SELECT count(*) FROM t WHERE name IS NULL AND n IS NULL").fetchone() == (5,)